@@ -0,0 +1,263 @@
+import hashlib
+import json
+import logging
+import math
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_prompt(prompt):
+    """
+    Normalizes a question so trivially different phrasings share a cache entry.
+    """
+    text = unicodedata.normalize("NFKC", prompt).casefold()
+    text = re.sub(r"\s+", " ", text).strip()
+    return text.rstrip("?!. ")
+
+
+def cosine_similarity(a, b):
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+def titan_embedder(client, model_id="amazon.titan-embed-text-v2:0", dimensions=None):
+    """
+    Returns a function that embeds text with an Amazon Titan embedding model,
+    with the model's default number of dimensions unless given.
+    """
+
+    def embed(text):
+        body = {"inputText": text}
+        if dimensions:
+            body["dimensions"] = dimensions
+        response = client.invoke_model(
+            body=json.dumps(body),
+            modelId=model_id,
+            contentType="application/json",
+            accept="application/json",
+        )
+        return json.loads(response["body"].read())["embedding"]
+
+    return embed
+
+
+def _cached_answer(entry):
+    return {"answer": entry["answer"], "citations": entry["citations"]}
+
+
+class AnswerCache:
+    """
+    Thread-safe LRU cache of generated answers with a TTL.
+
+    Entries are keyed by the normalized prompt together with the Knowledge Base,
+    model and inference parameters. When an embedding function and similarity
+    threshold are given, a miss on the exact key falls back to the closest cached
+    question asked with the same Knowledge Base, model and parameters.
+
+    With a StateStore, answers are also written to the store and a local miss
+    reads through to it, so every task shares the answers any task generated.
+    Shared entries are keyed by the Knowledge Base sync generation, so a new
+    sync leaves the old ones to expire.
+    """
+
+    def __init__(
+        self,
+        max_entries=512,
+        ttl_seconds=3600,
+        embed=None,
+        similarity_threshold=None,
+        generation_check_seconds=60,
+        store=None,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.embed = embed
+        self.similarity_threshold = similarity_threshold
+        self.generation_check_seconds = generation_check_seconds
+        self.store = store
+        self.generation = None
+        self._generation_checked_at = 0.0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.similar_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.saved_seconds = 0.0
+
+    @staticmethod
+    def scope(knowledge_base_id, model_id, max_tokens, temperature, top_p):
+        return json.dumps(
+            [knowledge_base_id, model_id, max_tokens, temperature, top_p]
+        )
+
+    @staticmethod
+    def make_key(scope, prompt):
+        return hashlib.sha256(
+            f"{scope}\n{normalize_prompt(prompt)}".encode("utf-8")
+        ).hexdigest()
+
+    def get(self, prompt, **params):
+        """
+        Returns the cached {"answer", "citations"} for the prompt and
+        parameters, or None.
+        """
+        scope = self.scope(**params)
+        key = self.make_key(scope, prompt)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and now - entry["created_at"] > self.ttl_seconds:
+                del self._entries[key]
+                entry = None
+            if entry:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                self.saved_seconds += entry["latency"]
+                return _cached_answer(entry)
+
+        shared = self._fetch_shared(key)
+        if shared:
+            citations = shared.get("citations", [])
+            with self._lock:
+                self._store_local(
+                    key, scope, shared["answer"], citations, shared["latency"], None
+                )
+                self.hits += 1
+                self.shared_hits += 1
+                self.saved_seconds += shared["latency"]
+            return {"answer": shared["answer"], "citations": citations}
+
+        entry = self._find_similar(scope, prompt, now)
+        with self._lock:
+            if entry:
+                if entry["key"] in self._entries:
+                    self._entries.move_to_end(entry["key"])
+                self.hits += 1
+                self.similar_hits += 1
+                self.saved_seconds += entry["latency"]
+                return _cached_answer(entry)
+            self.misses += 1
+        return None
+
+    def put(self, prompt, answer, latency=0.0, citations=(), **params):
+        """
+        Stores an answer with the source locations it cited and the latency it
+        took to generate it.
+        """
+        scope = self.scope(**params)
+        key = self.make_key(scope, prompt)
+        embedding = None
+        if self.embed and self.similarity_threshold:
+            embedding = self._safe_embed(normalize_prompt(prompt))
+        citations = list(citations)
+        with self._lock:
+            self._store_local(key, scope, answer, citations, latency, embedding)
+        if self.store:
+            self.store.put(
+                self._shared_key(key),
+                {"answer": answer, "citations": citations, "latency": latency},
+                ttl_seconds=self.ttl_seconds,
+            )
+
+    def _store_local(self, key, scope, answer, citations, latency, embedding):
+        self._entries[key] = {
+            "key": key,
+            "scope": scope,
+            "answer": answer,
+            "citations": citations,
+            "latency": latency,
+            "embedding": embedding,
+            "created_at": time.monotonic(),
+        }
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _shared_key(self, key):
+        return f"answer:{self.generation or ''}:{key}"
+
+    def _fetch_shared(self, key):
+        if not self.store:
+            return None
+        return self.store.get(self._shared_key(key))
+
+    def invalidate(self):
+        with self._lock:
+            logger.info(f"Invalidating {len(self._entries)} cached answers")
+            self._entries.clear()
+
+    def refresh_generation(self, fetch_generation, on_change=None):
+        """
+        Invalidates the cache when the Knowledge Base sync generation changes.
+
+        fetch_generation is called at most once every generation_check_seconds
+        and should return an identifier that changes whenever a new ingestion
+        job is started. on_change is called after invalidation so related
+        caches can be cleared too.
+        """
+        now = time.monotonic()
+        if now - self._generation_checked_at < self.generation_check_seconds:
+            return
+        self._generation_checked_at = now
+        try:
+            generation = fetch_generation()
+        except Exception as e:
+            logger.warning(f"Could not read knowledge base sync generation: {e}")
+            return
+        if self.generation is not None and generation != self.generation:
+            logger.info(f"Knowledge base sync generation changed to {generation}")
+            self.invalidate()
+            if on_change:
+                on_change()
+        self.generation = generation
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "similar_hits": self.similar_hits,
+                "shared_hits": self.shared_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "saved_seconds": round(self.saved_seconds, 2),
+            }
+
+    def _find_similar(self, scope, prompt, now):
+        if not (self.embed and self.similarity_threshold):
+            return None
+        embedding = self._safe_embed(normalize_prompt(prompt))
+        if embedding is None:
+            return None
+        best, best_score = None, self.similarity_threshold
+        with self._lock:
+            candidates = [
+                entry
+                for entry in self._entries.values()
+                if entry["scope"] == scope
+                and entry["embedding"] is not None
+                and now - entry["created_at"] <= self.ttl_seconds
+            ]
+        for entry in candidates:
+            score = cosine_similarity(embedding, entry["embedding"])
+            if score >= best_score:
+                best, best_score = entry, score
+        return best
+
+    def _safe_embed(self, text):
+        try:
+            return self.embed(text)
+        except Exception as e:
+            logger.warning(f"Could not embed prompt for the answer cache: {e}")
+            return None
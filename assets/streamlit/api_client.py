@@ -0,0 +1,129 @@
+import json
+import logging
+import os
+import urllib.error
+import urllib.request
+
+from conversation import BUSY_MESSAGE
+
+logger = logging.getLogger(__name__)
+
+# When set, the Streamlit app sends every turn to the inference API instead of
+# calling Bedrock itself
+INFERENCE_API_URL = os.environ.get("INFERENCE_API_URL")
+INFERENCE_API_TIMEOUT = float(os.environ.get("INFERENCE_API_TIMEOUT", "120"))
+
+# Server-side measurements copied onto the caller's TurnMetrics
+SERVER_METRICS = (
+    "model_id",
+    "routing_reason",
+    "prompt_template",
+    "fallback",
+    "cache_hit",
+    "faq_hit",
+    "coalesced",
+    "retrieval_time",
+    "generation_time",
+    "input_tokens",
+    "output_tokens",
+    "cache_read_input_tokens",
+    "cache_write_input_tokens",
+    "context_tokens",
+    "context_tokens_saved",
+    "citation_count",
+)
+
+
+def read_events(lines):
+    """
+    Parses a server-sent event stream into (event, data) pairs.
+    """
+    kind, data = "message", []
+    for raw_line in lines:
+        line = raw_line.decode("utf-8").rstrip("\r\n")
+        if not line:
+            if data:
+                yield kind, json.loads("\n".join(data))
+            kind, data = "message", []
+        elif line.startswith("event:"):
+            kind = line[len("event:") :].strip()
+        elif line.startswith("data:"):
+            data.append(line[len("data:") :].strip())
+
+
+def apply_result(result, metrics, conversation):
+    """
+    Copies the conversation state and server metrics from a finished turn.
+    """
+    if conversation is not None:
+        conversation.update(result.get("conversation") or {})
+    for name in SERVER_METRICS:
+        value = result.get("metrics", {}).get(name)
+        if metrics is not None and value is not None:
+            setattr(metrics, name, value)
+    return result["response"]
+
+
+def answer_events(
+    prompt,
+    model_id,
+    max_tokens,
+    temperature,
+    top_p,
+    metrics=None,
+    conversation=None,
+    stream=True,
+    api_url=None,
+):
+    """
+    Same contract as chat_service.answer_events, answered by the inference API.
+    The conversation is updated in place from the server's response.
+    """
+    api_url = (api_url or INFERENCE_API_URL).rstrip("/")
+    body = json.dumps(
+        {
+            "prompt": prompt,
+            "model_id": model_id,
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "top_p": top_p,
+            "conversation": conversation,
+        }
+    ).encode("utf-8")
+    request = urllib.request.Request(
+        f"{api_url}/v1/answer/stream" if stream else f"{api_url}/v1/answer",
+        data=body,
+        headers={"Content-Type": "application/json"},
+        method="POST",
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=INFERENCE_API_TIMEOUT) as response:
+            if not stream:
+                result = json.loads(response.read())
+                yield "done", apply_result(result, metrics, conversation)
+                return
+            for kind, data in read_events(response):
+                if kind == "done":
+                    yield "done", apply_result(data, metrics, conversation)
+                    return
+                yield kind, data
+        raise ConnectionError("Stream ended before the answer was complete")
+    except urllib.error.HTTPError as e:
+        logger.error(f"Inference API returned {e.code}")
+        yield "done", BUSY_MESSAGE if e.code == 503 else f"Error: {e}"
+    except (OSError, ValueError) as e:
+        logger.error(f"Error calling inference API: {e}")
+        yield "done", f"Error: {e}"
+
+
+def fetch_stats(api_url=None):
+    """
+    Returns the API's answer cache and engine counters, or None if unavailable.
+    """
+    api_url = (api_url or INFERENCE_API_URL).rstrip("/")
+    try:
+        with urllib.request.urlopen(f"{api_url}/v1/stats", timeout=5) as response:
+            return json.loads(response.read())
+    except (OSError, ValueError) as e:
+        logger.warning(f"Could not fetch inference API stats: {e}")
+        return None
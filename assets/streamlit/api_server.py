@@ -0,0 +1,279 @@
+"""
+Stateless HTTP API for the chat pipeline.
+
+Runs answer_events behind an async Tornado server so the inference path can be
+deployed and scaled separately from the Streamlit UI. Each request carries its
+own conversation context, so any task can answer any turn.
+
+    POST /v1/answer          JSON in, JSON {"response", "conversation", "metrics"} out
+    POST /v1/answer/stream   JSON in, server-sent events out
+    GET  /v1/stats           cache, FAQ, state store, engine, resilience, hedging and
+                             prompt cache counters
+    GET  /health             load balancer health check
+
+Start it with `python api_server.py`; it listens on API_PORT (default 8080).
+"""
+
+import asyncio
+import json
+import logging
+import os
+import signal
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import tornado.web
+from tornado.iostream import StreamClosedError
+
+from app_logging import configure_logging
+from bedrock_clients import get_hedged_runtime, get_resilience_policy, warm_clients
+from chat_service import (
+    DEFAULT_MODEL_ID,
+    KB_PIPELINE,
+    KNOWLEDGE_BASE_ID,
+    answer_events,
+    get_answer_cache,
+    get_answer_flights,
+    get_faq_matcher,
+    get_metrics_recorder,
+    get_prompt_registry,
+    get_request_engine,
+    get_state_store,
+    new_conversation_context,
+)
+from metrics import TurnMetrics
+
+logger = logging.getLogger(__name__)
+
+API_PORT = int(os.environ.get("API_PORT", "8080"))
+# Turns answered at once by this process; further requests get a 503
+API_MAX_CONCURRENCY = int(os.environ.get("API_MAX_CONCURRENCY", "64"))
+# How long in-flight turns may finish after SIGTERM before the process exits
+API_DRAIN_SECONDS = float(os.environ.get("API_DRAIN_SECONDS", "30"))
+
+# Drives the blocking answer_events generators; bounded by API_MAX_CONCURRENCY
+_executor = ThreadPoolExecutor(
+    max_workers=API_MAX_CONCURRENCY, thread_name_prefix="answer"
+)
+
+
+def parse_request(body):
+    """
+    Validates an answer request and fills in defaults. Raises ValueError on
+    malformed input.
+    """
+    try:
+        request = json.loads(body or b"{}")
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Invalid JSON: {e}") from e
+    if not isinstance(request, dict):
+        raise ValueError("Request body must be a JSON object")
+    prompt = request.get("prompt")
+    if not isinstance(prompt, str) or not prompt.strip():
+        raise ValueError("prompt is required")
+    conversation = request.get("conversation") or new_conversation_context()
+    if not isinstance(conversation, dict) or not isinstance(
+        conversation.get("history", []), list
+    ):
+        raise ValueError("conversation must be an object with a history list")
+    try:
+        return {
+            "prompt": prompt,
+            "model_id": str(request.get("model_id") or DEFAULT_MODEL_ID),
+            "max_tokens": int(request.get("max_tokens", 2000)),
+            "temperature": float(request.get("temperature", 0.2)),
+            "top_p": float(request.get("top_p", 0.2)),
+            "conversation": {
+                "history": conversation.get("history", []),
+                "bedrock_session_id": conversation.get("bedrock_session_id"),
+            },
+        }
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Invalid parameter: {e}") from e
+
+
+async def turn_events(params, metrics, stream, cancelled):
+    """
+    Runs answer_events on a worker thread and yields its events on the event
+    loop. Setting cancelled stops generation, e.g. when the client goes away.
+    """
+    loop = asyncio.get_running_loop()
+    events = asyncio.Queue()
+
+    def produce():
+        generator = answer_events(**params, metrics=metrics, stream=stream)
+        try:
+            for event in generator:
+                if cancelled.is_set():
+                    return
+                loop.call_soon_threadsafe(events.put_nowait, event)
+        except Exception as e:
+            logger.exception("Error answering request")
+            loop.call_soon_threadsafe(events.put_nowait, ("done", f"Error: {e}"))
+        finally:
+            try:
+                generator.close()
+            finally:
+                # The handler waits for this even if closing the generator fails
+                loop.call_soon_threadsafe(events.put_nowait, None)
+
+    _executor.submit(produce)
+    while (event := await events.get()) is not None:
+        yield event
+
+
+class AnswerHandler(tornado.web.RequestHandler):
+    """Answers a single chat turn with a JSON response."""
+
+    def initialize(self):
+        self.state = self.settings["state"]
+        self.cancelled = threading.Event()
+
+    def on_connection_close(self):
+        self.cancelled.set()
+
+    def write_json(self, status, payload):
+        self.set_status(status)
+        self.set_header("Content-Type", "application/json")
+        self.finish(json.dumps(payload, default=str))
+
+    async def post(self):
+        try:
+            params = parse_request(self.request.body)
+        except ValueError as e:
+            self.write_json(400, {"error": str(e)})
+            return
+        if self.state["in_flight"] >= API_MAX_CONCURRENCY:
+            logger.warning("API is at capacity, rejecting request")
+            self.write_json(503, {"error": "busy"})
+            return
+
+        self.state["in_flight"] += 1
+        try:
+            metrics = TurnMetrics(
+                model_id=params["model_id"],
+                pipeline=KB_PIPELINE if KNOWLEDGE_BASE_ID else "direct",
+            )
+            await self.answer(params, metrics)
+        finally:
+            self.state["in_flight"] -= 1
+
+    def done_payload(self, response, params, metrics):
+        metrics.finish()
+        return {
+            "response": response,
+            "conversation": params["conversation"],
+            "metrics": get_metrics_recorder().record(metrics),
+        }
+
+    async def answer(self, params, metrics):
+        response = None
+        async for kind, data in turn_events(params, metrics, False, self.cancelled):
+            if kind == "done":
+                response = data
+        self.write_json(200, self.done_payload(response, params, metrics))
+
+
+class AnswerStreamHandler(AnswerHandler):
+    """Answers a single chat turn as server-sent events."""
+
+    async def answer(self, params, metrics):
+        self.set_header("Content-Type", "text/event-stream")
+        self.set_header("Cache-Control", "no-cache")
+        # Stop proxies from buffering the stream
+        self.set_header("X-Accel-Buffering", "no")
+        async for kind, data in turn_events(params, metrics, True, self.cancelled):
+            if kind == "text":
+                metrics.mark_first_byte()
+            elif kind == "done":
+                data = self.done_payload(data, params, metrics)
+            self.write(f"event: {kind}\ndata: {json.dumps(data, default=str)}\n\n")
+            try:
+                await self.flush()
+            except StreamClosedError:
+                logger.info("Client disconnected, cancelling turn")
+                self.cancelled.set()
+                return
+        self.finish()
+
+
+class StatsHandler(tornado.web.RequestHandler):
+    def get(self):
+        hedged = get_hedged_runtime()
+        state_store = get_state_store()
+        faq_matcher = get_faq_matcher()
+        self.set_header("Content-Type", "application/json")
+        self.write(
+            json.dumps(
+                {
+                    "in_flight": self.settings["state"]["in_flight"],
+                    "answer_cache": get_answer_cache().stats(),
+                    "faq": faq_matcher.stats() if faq_matcher else None,
+                    "engine": get_request_engine().stats(),
+                    "resilience": {
+                        **get_resilience_policy().stats(),
+                        "coalesced_answers": get_answer_flights().coalesced,
+                    },
+                    "hedging": hedged.stats() if hedged else None,
+                    "state_store": state_store.stats() if state_store else None,
+                    "prompts": get_prompt_registry().stats(),
+                }
+            )
+        )
+
+
+class HealthHandler(tornado.web.RequestHandler):
+    def get(self):
+        draining = self.settings["state"]["draining"]
+        if draining:
+            self.set_status(503)
+        self.write({"status": "draining" if draining else "ok"})
+
+
+def make_app():
+    return tornado.web.Application(
+        [
+            (r"/v1/answer", AnswerHandler),
+            (r"/v1/answer/stream", AnswerStreamHandler),
+            (r"/v1/stats", StatsHandler),
+            (r"/health", HealthHandler),
+        ],
+        state={"in_flight": 0, "draining": False},
+    )
+
+
+async def serve(port=API_PORT):
+    """
+    Serves until SIGTERM or SIGINT, then lets in-flight turns finish for up to
+    API_DRAIN_SECONDS.
+    """
+    app = make_app()
+    server = app.listen(port, address="0.0.0.0")
+    logger.info(f"Inference API listening on port {port}")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+    await stop.wait()
+
+    state = app.settings["state"]
+    state["draining"] = True
+    server.stop()
+    deadline = time.monotonic() + API_DRAIN_SECONDS
+    while state["in_flight"] and time.monotonic() < deadline:
+        await asyncio.sleep(0.1)
+    logger.info(f"Stopped with {state['in_flight']} turns in flight")
+
+
+def main():
+    configure_logging()
+    warm_clients(KNOWLEDGE_BASE_ID)
+    # A broken prompt template fails the task at startup, not on the first turn
+    get_prompt_registry()
+    asyncio.run(serve())
+
+
+if __name__ == "__main__":
+    main()
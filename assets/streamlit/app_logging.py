@@ -0,0 +1,37 @@
+import logging
+import queue
+import sys
+from logging.handlers import QueueHandler, QueueListener
+
+_listener = None
+
+
+def configure_logging(level=logging.INFO):
+    """
+    Routes all log records through a queue drained by a background thread, so
+    request threads never block on handler I/O. Records from the "metrics"
+    logger are written to stdout as bare JSON lines for CloudWatch to parse.
+    Safe to call on every Streamlit rerun; only the first call has an effect.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    app_handler = logging.StreamHandler()
+    app_handler.setFormatter(
+        logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    )
+    app_handler.addFilter(lambda record: record.name != "metrics")
+
+    metrics_handler = logging.StreamHandler(sys.stdout)
+    metrics_handler.setFormatter(logging.Formatter("%(message)s"))
+    metrics_handler.addFilter(lambda record: record.name == "metrics")
+
+    records = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(QueueHandler(records))
+    _listener = QueueListener(
+        records, app_handler, metrics_handler, respect_handler_level=True
+    )
+    _listener.start()
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+Answers a file of questions in bulk, for offline evaluation or to pre-warm the
+answer cache after a Knowledge Base sync.
+
+Questions come from a JSONL file (one {"question": ...} object per line, with
+an optional "id") or a CSV file with a "question" column, read from a local
+path or an s3:// URI. Answers, citations, token counts and latencies are
+written as JSON lines as soon as each question finishes. Rerunning with the
+same output file skips questions that were already answered, so an
+interrupted or partly failed run resumes where it stopped.
+
+    python batch_answer.py questions.jsonl --output answers.jsonl
+    python batch_answer.py s3://bucket/faq.csv --api-url http://api --rate 5
+"""
+
+import argparse
+import csv
+import hashlib
+import io
+import json
+import logging
+import os
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import api_client
+import chat_service
+from app_logging import configure_logging
+from bedrock_streaming import citation_locations
+from metrics import TurnMetrics
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimiter:
+    """Spaces calls to acquire() so they start at most rate times per second."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next_at = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start_at = max(now, self._next_at)
+            self._next_at = start_at + self.interval
+        if start_at > now:
+            time.sleep(start_at - now)
+
+
+def question_id(question):
+    return hashlib.sha1(question.strip().encode("utf-8")).hexdigest()[:16]
+
+
+def read_text(path):
+    if path.startswith("s3://"):
+        from bedrock_clients import get_client
+
+        bucket, key = path[len("s3://") :].split("/", 1)
+        s3 = get_client("s3", region_name=os.environ.get("AWS_REGION"))
+        body = s3.get_object(Bucket=bucket, Key=key)["Body"]
+        return body.read().decode("utf-8")
+    with open(path, encoding="utf-8") as f:
+        return f.read()
+
+
+def read_questions(path):
+    """
+    Returns [{"id", "question"}] from a JSONL or CSV file, dropping blank and
+    repeated questions.
+    """
+    text = read_text(path)
+    if path.lower().endswith(".csv"):
+        rows = list(csv.DictReader(io.StringIO(text)))
+    else:
+        rows = [json.loads(line) for line in text.splitlines() if line.strip()]
+
+    questions = {}
+    for row in rows:
+        question = (row.get("question") or row.get("prompt") or "").strip()
+        if not question:
+            continue
+        item_id = str(row.get("id") or question_id(question))
+        questions.setdefault(item_id, {"id": item_id, "question": question})
+    return list(questions.values())
+
+
+def completed_ids(output_path):
+    """Returns the ids already answered without error in an earlier run."""
+    if not output_path or not os.path.exists(output_path):
+        return set()
+    done = set()
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A run killed mid-write can leave a partial last line
+                continue
+            if not record.get("error"):
+                done.add(record["id"])
+    return done
+
+
+def answer_question(item, args, rate_limiter):
+    """
+    Answers one question, retrying errors with backoff, and returns its record.
+    """
+    events = api_client.answer_events if args.api_url else chat_service.answer_events
+    extra = {"api_url": args.api_url} if args.api_url else {}
+    for attempt in range(args.retries + 1):
+        rate_limiter.acquire()
+        metrics = TurnMetrics(model_id=args.model_id, pipeline="batch")
+        citations = []
+        response = ""
+        for kind, data in events(
+            prompt=item["question"],
+            model_id=args.model_id,
+            max_tokens=args.max_tokens,
+            temperature=args.temperature,
+            top_p=args.top_p,
+            metrics=metrics,
+            stream=True,
+            **extra,
+        ):
+            if kind == "text":
+                metrics.mark_first_byte()
+            elif kind == "citation":
+                citations.append(data)
+            elif kind == "reset":
+                citations = []
+            elif kind == "done":
+                response = data
+        metrics.finish()
+        error = response.strip() if response.strip().startswith("Error:") else None
+        if error is None or attempt == args.retries:
+            break
+        delay = min(30, 2**attempt)
+        logger.warning(f"Question {item['id']} failed ({error}), retrying in {delay}s")
+        time.sleep(delay)
+
+    return {
+        "id": item["id"],
+        "question": item["question"],
+        "answer": response,
+        "model_id": metrics.model_id,
+        "citations": citation_locations(citations),
+        "input_tokens": metrics.input_tokens,
+        "output_tokens": metrics.output_tokens,
+        "cache_read_input_tokens": metrics.cache_read_input_tokens,
+        "prompt_template": metrics.prompt_template,
+        "context_tokens_saved": metrics.context_tokens_saved,
+        "cache_hit": metrics.cache_hit,
+        "faq_hit": bool(metrics.faq_hit),
+        "time_to_first_byte": metrics.time_to_first_byte,
+        "latency": metrics.total_latency,
+        "error": error,
+    }
+
+
+def summarize_run(records, skipped, elapsed):
+    latencies = sorted(r["latency"] for r in records if not r["error"])
+    failed = sum(1 for r in records if r["error"])
+    summary = {
+        "answered": len(records) - failed,
+        "failed": failed,
+        "skipped": skipped,
+        "cache_hits": sum(1 for r in records if r["cache_hit"]),
+        "faq_hits": sum(1 for r in records if r["faq_hit"]),
+        "input_tokens": sum(r["input_tokens"] or 0 for r in records),
+        "output_tokens": sum(r["output_tokens"] or 0 for r in records),
+        "cache_read_input_tokens": sum(r["cache_read_input_tokens"] or 0 for r in records),
+        "context_tokens_saved": sum(r["context_tokens_saved"] or 0 for r in records),
+        "elapsed_seconds": round(elapsed, 2),
+    }
+    if latencies:
+        summary["latency_p50"] = round(statistics.median(latencies), 3)
+        summary["latency_p95"] = round(
+            latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 3
+        )
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("input", help="JSONL or CSV file of questions, local or s3://")
+    parser.add_argument("--output", help="JSONL file for answers (default: stdout)")
+    parser.add_argument("--api-url", default=api_client.INFERENCE_API_URL,
+                        help="Answer through the inference API instead of in-process")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--rate", type=float, default=2.0,
+                        help="Maximum questions started per second (0 for no limit)")
+    parser.add_argument("--retries", type=int, default=2)
+    parser.add_argument("--model-id", default=chat_service.DEFAULT_MODEL_ID,
+                        help='A Bedrock model id, or "auto" to route each question')
+    parser.add_argument("--max-tokens", type=int, default=2000)
+    parser.add_argument("--temperature", type=float, default=0.2)
+    parser.add_argument("--top-p", type=float, default=0.2)
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    configure_logging(logging.INFO if args.verbose else logging.WARNING)
+
+    items = read_questions(args.input)
+    done = completed_ids(args.output)
+    pending = [item for item in items if item["id"] not in done]
+    print(
+        f"{len(pending)} questions to answer, {len(items) - len(pending)} already done",
+        file=sys.stderr,
+    )
+
+    output = open(args.output, "a", encoding="utf-8") if args.output else sys.stdout
+    rate_limiter = RateLimiter(args.rate)
+    records = []
+    started_at = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            futures = [
+                pool.submit(answer_question, item, args, rate_limiter)
+                for item in pending
+            ]
+            for future in as_completed(futures):
+                record = future.result()
+                records.append(record)
+                # Written and flushed one by one so an interrupted run can resume
+                output.write(json.dumps(record, default=str) + "\n")
+                output.flush()
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    summary = summarize_run(records, len(items) - len(pending), time.perf_counter() - started_at)
+    print(json.dumps(summary), file=sys.stderr)
+    sys.exit(1 if summary["failed"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+import functools
+import json
+import logging
+import os
+import threading
+
+from hedging import HedgedRuntime, HedgeTarget
+from resilience import ResiliencePolicy, ResilientClient, RetryBudget
+
+logger = logging.getLogger(__name__)
+
+BEDROCK_REGION = (
+    os.environ.get("BEDROCK_REGION") or os.environ.get("AWS_REGION") or "us-east-1"
+)
+
+# Clients whose calls go through the shared resilience policy
+RESILIENT_SERVICES = ("bedrock-runtime", "bedrock-agent-runtime")
+
+_clients = {}
+_lock = threading.Lock()
+_session = None
+
+
+def client_config():
+    """
+    Builds the botocore configuration shared by every Bedrock client.
+    """
+    from botocore.config import Config
+
+    return Config(
+        max_pool_connections=int(os.environ.get("BEDROCK_MAX_POOL_CONNECTIONS", "50")),
+        tcp_keepalive=os.environ.get("BEDROCK_TCP_KEEPALIVE", "true").lower() == "true",
+        connect_timeout=float(os.environ.get("BEDROCK_CONNECT_TIMEOUT", "5")),
+        read_timeout=float(os.environ.get("BEDROCK_READ_TIMEOUT", "120")),
+        # Bedrock clients are retried by the resilience policy, so botocore
+        # makes a single attempt unless told otherwise
+        retries={
+            "mode": os.environ.get("BEDROCK_RETRY_MODE", "standard"),
+            "max_attempts": int(os.environ.get("BEDROCK_MAX_ATTEMPTS", "1")),
+        },
+    )
+
+
+@functools.cache
+def get_resilience_policy():
+    """
+    Returns the rate limits, retry budget and circuit breakers shared by every
+    Bedrock client in the process.
+    """
+    default_rate_limit = os.environ.get("BEDROCK_DEFAULT_RATE_LIMIT")
+    return ResiliencePolicy(
+        # Requests per minute for this process, keyed by model id or "retrieve"
+        rate_limits=json.loads(os.environ.get("BEDROCK_RATE_LIMITS", "{}")),
+        default_rate_limit=float(default_rate_limit) if default_rate_limit else None,
+        rate_limit_wait=float(os.environ.get("BEDROCK_RATE_LIMIT_WAIT", "10")),
+        max_retries=int(os.environ.get("BEDROCK_MAX_RETRIES", "3")),
+        retry_budget=RetryBudget(
+            ratio=float(os.environ.get("BEDROCK_RETRY_BUDGET_RATIO", "0.1"))
+        ),
+        failure_threshold=int(os.environ.get("BEDROCK_CIRCUIT_FAILURES", "5")),
+        reset_timeout=float(os.environ.get("BEDROCK_CIRCUIT_RESET_SECONDS", "30")),
+    )
+
+
+def hedge_targets():
+    """
+    Returns the bedrock-runtime targets to hedge across: the Bedrock region,
+    then the cross-region inference profile and the regions configured in
+    BEDROCK_HEDGE_INFERENCE_PROFILE (e.g. "us") and BEDROCK_HEDGE_REGIONS
+    (e.g. "us-west-2,us-east-2"). A single target means no hedging.
+    """
+    targets = [HedgeTarget(BEDROCK_REGION)]
+    profile = os.environ.get("BEDROCK_HEDGE_INFERENCE_PROFILE")
+    if profile:
+        targets.append(HedgeTarget(BEDROCK_REGION, profile))
+    for region in os.environ.get("BEDROCK_HEDGE_REGIONS", "").split(","):
+        region = region.strip()
+        if region and region != BEDROCK_REGION:
+            targets.append(HedgeTarget(region, profile or ""))
+    return targets
+
+
+@functools.cache
+def get_hedged_runtime():
+    """
+    Returns the process-wide hedged bedrock-runtime client, or None when no
+    secondary region or inference profile is configured.
+    """
+    targets = hedge_targets()
+    if len(targets) < 2:
+        return None
+    logger.info(f"Hedging bedrock-runtime calls across {[t.name for t in targets]}")
+    return HedgedRuntime(
+        targets,
+        lambda region: regional_client("bedrock-runtime", region),
+        percentile=int(os.environ.get("BEDROCK_HEDGE_PERCENTILE", "90")),
+        median_factor=float(os.environ.get("BEDROCK_HEDGE_MEDIAN_FACTOR", "3")),
+        default_delay=float(os.environ.get("BEDROCK_HEDGE_DELAY_SECONDS", "1.0")),
+        budget=RetryBudget(
+            ratio=float(os.environ.get("BEDROCK_HEDGE_BUDGET_RATIO", "0.1")),
+            capacity=5.0,
+        ),
+    )
+
+
+def resilient(service_name, client, region_name):
+    if service_name in RESILIENT_SERVICES:
+        scope = "" if region_name == BEDROCK_REGION else f"{region_name}/"
+        return ResilientClient(client, get_resilience_policy(), scope)
+    return client
+
+
+def get_client(service_name, region_name=None):
+    """
+    Returns a process-wide client for the service, creating it on first use.
+
+    Clients are thread-safe and keep their HTTPS connection pool alive, so every
+    Streamlit session and rerun reuses the same credentials and connections.
+    The default bedrock-runtime client hedges slow calls to other regions when
+    they are configured.
+    """
+    if service_name == "bedrock-runtime" and region_name is None:
+        hedged = get_hedged_runtime()
+        if hedged is not None:
+            return hedged
+    return regional_client(service_name, region_name)
+
+
+def regional_client(service_name, region_name=None):
+    global _session
+    key = (service_name, region_name or BEDROCK_REGION)
+    client = _clients.get(key)
+    if client is not None:
+        return client
+    with _lock:
+        if key not in _clients:
+            if _session is None:
+                # boto3 takes a noticeable share of startup, so it is only
+                # imported when the first client is needed
+                import boto3
+
+                _session = boto3.session.Session()
+            logger.info(f"Creating {service_name} client in {key[1]}")
+            _clients[key] = resilient(
+                service_name,
+                _session.client(
+                    service_name, region_name=key[1], config=client_config()
+                ),
+                key[1],
+            )
+        return _clients[key]
+
+
+def set_client(service_name, client, region_name=None):
+    """
+    Registers a client to be returned by get_client, e.g. a local fake for
+    offline testing. Bedrock clients are wrapped like the real ones.
+    """
+    region_name = region_name or BEDROCK_REGION
+    with _lock:
+        _clients[(service_name, region_name)] = resilient(
+            service_name, client, region_name
+        )
+
+
+def model_arn(model_id, region_name=None):
+    return f"arn:aws:bedrock:{region_name or BEDROCK_REGION}::foundation-model/{model_id}"
+
+
+def warm_clients(knowledge_base_id=None):
+    """
+    Creates the Bedrock clients, resolves credentials and, when a Knowledge Base
+    is configured, opens a connection with a single-result retrieve so the first
+    user request does not pay for the TLS handshake.
+    """
+    bedrock_agent = get_client("bedrock-agent-runtime")
+    get_client("bedrock-runtime")
+    try:
+        if _session is not None:
+            _session.get_credentials().get_frozen_credentials()
+        if knowledge_base_id:
+            bedrock_agent.retrieve(
+                knowledgeBaseId=knowledge_base_id,
+                retrievalQuery={"text": "warm up"},
+                retrievalConfiguration={
+                    "vectorSearchConfiguration": {"numberOfResults": 1}
+                },
+            )
+        logger.info("Bedrock clients warmed")
+    except Exception as e:
+        logger.warning(f"Could not warm Bedrock clients: {e}")
@@ -0,0 +1,105 @@
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def stream_knowledge_base_response(client, prompt, configuration, session_id=None):
+    """
+    Streams a Knowledge Base answer using retrieve_and_generate_stream.
+
+    Yields a ("session", str) event with the Bedrock session id, ("text", str)
+    events as the answer is generated and ("citation", dict) events as soon as a
+    citation is attached to a part of the answer. Any client exposing
+    retrieve_and_generate_stream (including a local fake that returns an
+    iterable of event dicts) can be used.
+    """
+    request = {
+        "input": {"text": prompt},
+        "retrieveAndGenerateConfiguration": configuration,
+    }
+    if session_id:
+        request["sessionId"] = session_id
+    response = client.retrieve_and_generate_stream(**request)
+    if response.get("sessionId"):
+        yield "session", response["sessionId"]
+    for event in response["stream"]:
+        if "output" in event:
+            yield "text", event["output"].get("text", "")
+        elif "citation" in event:
+            citation = event["citation"]
+            # Older API versions nest the payload under an extra "citation" key
+            yield "citation", citation.get("citation", citation)
+        elif "guardrail" in event:
+            logger.info(f"Guardrail action: {event['guardrail'].get('action')}")
+
+
+def stream_model_response(client, model_id, body):
+    """
+    Streams a direct model invocation using invoke_model_with_response_stream.
+
+    Yields ("text", str) events for each content delta and a final ("usage", dict)
+    event with the token counts reported by the model.
+    """
+    response = client.invoke_model_with_response_stream(
+        body=json.dumps(body),
+        modelId=model_id,
+        contentType="application/json",
+        accept="application/json",
+    )
+    for event in response["body"]:
+        chunk = event.get("chunk")
+        if not chunk:
+            continue
+        payload = json.loads(chunk["bytes"])
+        if "contentBlockDelta" in payload:
+            yield "text", payload["contentBlockDelta"]["delta"].get("text", "")
+        elif "metadata" in payload:
+            yield "usage", payload["metadata"].get("usage", {})
+
+
+def citation_locations(citations):
+    """
+    Returns the unique source locations referenced by a list of citations,
+    in the order they were first cited.
+    """
+    locations = {}
+    for citation in citations:
+        for reference in citation.get("retrievedReferences", []):
+            location = reference.get("location", {})
+            if "s3Location" in location:
+                locations[location["s3Location"]["uri"]] = None
+            if "webLocation" in location:
+                locations[location["webLocation"]["url"]] = None
+    return list(locations)
+
+
+def location_citations(locations):
+    """
+    Wraps source locations, as returned by citation_locations, back in the
+    citation shape, so stored answers can replay the sources they cited.
+    """
+    return [
+        {
+            "retrievedReferences": [
+                {
+                    "location": {"s3Location": {"uri": location}}
+                    if location.startswith("s3://")
+                    else {"webLocation": {"url": location}}
+                }
+            ]
+        }
+        for location in locations
+    ]
+
+
+def format_citations(locations):
+    """
+    Formats source locations as a markdown "Sources" section.
+    """
+    if not locations:
+        return ""
+    citations_text = "\n\n### Sources\n"
+    for i, location in enumerate(locations, 1):
+        citations_text += f"{i}. {location}\n"
+    return citations_text
@@ -0,0 +1,933 @@
+import functools
+import json
+import logging
+import os
+import time
+
+from answer_cache import AnswerCache, titan_embedder
+from bedrock_clients import get_client, model_arn
+from bedrock_streaming import (
+    citation_locations,
+    format_citations,
+    location_citations,
+    stream_knowledge_base_response,
+    stream_model_response,
+)
+from conversation import BUSY_MESSAGE, build_message_window, retrieval_query
+from metrics import EMF_NAMESPACE, MetricsRecorder, TurnMetrics
+from model_router import (
+    LITE_MODEL_ID,
+    PRO_MODEL_ID,
+    ModelRouter,
+    is_low_confidence_answer,
+)
+from prompt_templates import PROMPTS_DIR, PromptRegistry
+from request_engine import EngineBusyError, RequestEngine
+from resilience import SingleFlight
+from retrieval import (
+    RetrievalCache,
+    compress_passages,
+    passage_citations,
+    retrieve_passages,
+)
+from state_store import (
+    DynamoDBBackend,
+    MemoryBackend,
+    RedisBackend,
+    SQLiteBackend,
+    StateStore,
+)
+
+logger = logging.getLogger(__name__)
+
+KNOWLEDGE_BASE_ID = os.environ.get("KNOWLEDGE_BASE_ID")
+SYNC_GENERATION_PARAMETER = os.environ.get("SYNC_GENERATION_PARAMETER")
+# "two_stage" retrieves passages and generates with invoke_model,
+# "retrieve_and_generate" uses the all-in-one Knowledge Base API
+KB_PIPELINE = os.environ.get("KB_PIPELINE", "two_stage")
+RETRIEVAL_NUMBER_OF_RESULTS = int(os.environ.get("RETRIEVAL_NUMBER_OF_RESULTS", "5"))
+# Input token budget for retrieved passages in the two-stage prompt (0 for none)
+RETRIEVAL_TOKEN_BUDGET = int(os.environ.get("RETRIEVAL_TOKEN_BUDGET", "1500"))
+# Passages at least this similar to a better-scored one are dropped as duplicates
+RETRIEVAL_DEDUP_THRESHOLD = float(os.environ.get("RETRIEVAL_DEDUP_THRESHOLD", "0.8"))
+# Earlier questions searched together with a follow-up in the two-stage pipeline
+RETRIEVAL_HISTORY_QUESTIONS = int(os.environ.get("RETRIEVAL_HISTORY_QUESTIONS", "2"))
+# Input token budget for earlier turns sent with direct and two-stage requests
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", "2000"))
+# A model id, or "auto" to let the model router choose per turn
+DEFAULT_MODEL_ID = os.environ.get("DEFAULT_MODEL_ID", "auto")
+# Request engine key that Knowledge Base retrievals are admitted under, next
+# to the model ids in ENGINE_MODEL_LIMITS
+RETRIEVAL_ENGINE_KEY = "retrieve"
+# The prompt template in PROMPT_TEMPLATE_DIR used for every generation path
+PROMPT_TEMPLATE_NAME = os.environ.get("PROMPT_TEMPLATE", "question_answering")
+# How long a question waits for an identical one already being answered
+COALESCE_WAIT_SECONDS = float(os.environ.get("COALESCE_WAIT_SECONDS", "120"))
+
+
+def knowledge_base_configuration(model_id, max_tokens, temperature, top_p):
+    """
+    Builds the retrieveAndGenerateConfiguration for the Knowledge Base.
+    """
+    return {
+        "type": "KNOWLEDGE_BASE",
+        "knowledgeBaseConfiguration": {
+            "knowledgeBaseId": KNOWLEDGE_BASE_ID,
+            "modelArn": model_arn(model_id),
+            "generationConfiguration": {
+                "inferenceConfig": {
+                    "textInferenceConfig": {
+                        "maxTokens": max_tokens,
+                        "temperature": temperature,
+                        "topP": top_p,
+                    },
+                },
+                "promptTemplate": {
+                    "textPromptTemplate": prompt_template().knowledge_base_template
+                },
+            },
+        },
+    }
+
+
+def nova_request_body(messages, max_tokens, temperature, top_p, system=None):
+    body = {
+        "messages": messages,
+        "inferenceConfig": {
+            "max_new_tokens": max_tokens,
+            "temperature": temperature,
+            "top_p": top_p,
+        },
+    }
+    if system:
+        body["system"] = system
+    return body
+
+
+def prompt_request_body(
+    prompt, model_id, max_tokens, temperature, top_p, conversation, passages=None
+):
+    """
+    Builds the Nova request body for a turn from the prompt template: the static
+    instructions for answers from passages, or for direct answers without
+    them, as the (cacheable) system prompt, then earlier turns, then the
+    question with the retrieved passages when given.
+    """
+    template = prompt_template()
+    return nova_request_body(
+        conversation_messages(conversation, template.user_message(prompt, passages)),
+        max_tokens,
+        temperature,
+        top_p,
+        system=template.system_blocks(
+            model_id,
+            grounded=passages is not None,
+            cache=get_prompt_registry().cache_prompts,
+        ),
+    )
+
+
+def retrieve_context(prompt, metrics):
+    """
+    Retrieves passages for the prompt, reusing cached results when available.
+    """
+    retrieval_cache = get_retrieval_cache()
+    bedrock_agent = get_client("bedrock-agent-runtime")
+    started_at = time.perf_counter()
+    passages = retrieval_cache.get(
+        KNOWLEDGE_BASE_ID, prompt, RETRIEVAL_NUMBER_OF_RESULTS
+    )
+    cache_hit = passages is not None
+    if not cache_hit:
+        passages = retrieve_passages(
+            bedrock_agent, KNOWLEDGE_BASE_ID, prompt, RETRIEVAL_NUMBER_OF_RESULTS
+        )
+        retrieval_cache.put(
+            KNOWLEDGE_BASE_ID, prompt, RETRIEVAL_NUMBER_OF_RESULTS, passages
+        )
+    metrics.retrieval_time = time.perf_counter() - started_at
+    logger.info(
+        f"Retrieval stage: {metrics.retrieval_time:.3f}s, "
+        f"{len(passages)} passages, cache {'hit' if cache_hit else 'miss'}"
+    )
+    return passages
+
+
+def shape_context(passages, metrics):
+    """
+    Deduplicates, merges, ranks and packs the retrieved passages into the
+    retrieval token budget before they go into the prompt.
+    """
+    passages, report = compress_passages(
+        passages,
+        budget_tokens=RETRIEVAL_TOKEN_BUDGET or None,
+        similarity_threshold=RETRIEVAL_DEDUP_THRESHOLD,
+    )
+    metrics.context_tokens = report["tokens_after"]
+    metrics.context_tokens_saved = report["tokens_saved"]
+    logger.info(
+        f"Context shaping: {report['passages_before']} -> {report['passages_after']} "
+        f"passages ({report['duplicates']} duplicates, {report['merges']} merged), "
+        f"~{report['tokens_before']} -> ~{report['tokens_after']} tokens, "
+        f"~{report['tokens_saved']} saved"
+    )
+    return passages
+
+
+def record_usage(metrics, usage):
+    metrics.input_tokens = usage.get("inputTokens")
+    metrics.output_tokens = usage.get("outputTokens")
+    # invoke_model reports the ...Count names, Converse the shorter ones
+    metrics.cache_read_input_tokens = usage.get(
+        "cacheReadInputTokenCount", usage.get("cacheReadInputTokens")
+    )
+    metrics.cache_write_input_tokens = usage.get(
+        "cacheWriteInputTokenCount", usage.get("cacheWriteInputTokens")
+    )
+    if metrics.prompt_template:
+        get_prompt_registry().observe(
+            metrics.prompt_template,
+            metrics.input_tokens,
+            metrics.cache_read_input_tokens,
+            metrics.cache_write_input_tokens,
+        )
+
+
+def format_usage(usage):
+    footer = f"*Tokens: Input: {usage.get('inputTokens')}, Output: {usage.get('outputTokens')}"
+    cached = usage.get("cacheReadInputTokenCount", usage.get("cacheReadInputTokens"))
+    if cached:
+        footer += f", Cached: {cached}"
+    return footer + "*"
+
+
+def new_conversation_context():
+    """
+    Returns the per-chat state sent with follow-up questions: earlier turns for
+    invoke_model and the Bedrock session id for retrieve_and_generate.
+    """
+    return {"history": [], "bedrock_session_id": None}
+
+
+def conversation_messages(conversation, prompt):
+    return build_message_window(
+        conversation["history"] if conversation else [],
+        prompt,
+        budget_tokens=CONTEXT_TOKEN_BUDGET,
+    )
+
+
+def route_turn(prompt, model_id, passages, metrics):
+    """
+    Picks the model for the turn, resolving "auto" with the model router, and
+    records the choice on metrics.
+    """
+    route = get_model_router().route(prompt, model_id, passages)
+    metrics.model_id = route.model_id
+    metrics.routing_reason = route.reason
+    return route
+
+
+def needs_fallback(route, response_text, metrics):
+    """
+    Records the routed model's latency and returns True when its answer admits
+    it could not answer and the route allows a larger model to retry.
+    """
+    router = get_model_router()
+    router.observe(route.model_id, metrics.generation_time)
+    if not route.fallback_model_id or not is_low_confidence_answer(response_text):
+        router.log_outcome(route, route.model_id, metrics.generation_time)
+        return False
+    logger.info(
+        f"Low-confidence answer from {route.model_id}, "
+        f"retrying with {route.fallback_model_id}"
+    )
+    metrics.model_id = route.fallback_model_id
+    metrics.fallback = True
+    return True
+
+
+def finish_fallback(route, metrics, first_generation_time):
+    router = get_model_router()
+    router.observe(route.fallback_model_id, metrics.generation_time)
+    router.log_outcome(
+        route, route.fallback_model_id, metrics.generation_time, first_generation_time
+    )
+    if metrics.generation_time is not None and first_generation_time is not None:
+        metrics.generation_time += first_generation_time
+
+
+def turn_passages(prompt, metrics, conversation=None):
+    """
+    Retrieves passages for the two-stage pipeline, or returns None when the
+    model generates without them. Follow-up questions are searched together
+    with the questions before them.
+    """
+    if KNOWLEDGE_BASE_ID and KB_PIPELINE == "two_stage":
+        query = retrieval_query(
+            conversation["history"] if conversation else [],
+            prompt,
+            max_questions=RETRIEVAL_HISTORY_QUESTIONS,
+        )
+        return shape_context(retrieve_context(query, metrics), metrics)
+    return None
+
+
+def run_call(engine, key, fn, /, *args, **kwargs):
+    """Runs fn on the request engine under key, or inline without an engine."""
+    if engine is None:
+        return fn(*args, **kwargs)
+    return engine.submit(key, fn, *args, **kwargs).result()
+
+
+def stream_call(engine, key, fn, /, *args, **kwargs):
+    """Streams the generator function fn from the request engine under key."""
+    if engine is None:
+        return fn(*args, **kwargs)
+    return engine.stream(key, fn, *args, **kwargs)
+
+
+def generate_model_response(
+    prompt,
+    model_id,
+    max_tokens,
+    temperature,
+    top_p,
+    metrics,
+    conversation,
+    passages=None,
+):
+    """
+    Generates a formatted response from one model, from the retrieved passages
+    when given.
+    """
+    bedrock_runtime = get_client("bedrock-runtime")
+    bedrock_agent = get_client("bedrock-agent-runtime")
+    if passages is not None:
+        logger.info(
+            f"Using Knowledge Base ID: {KNOWLEDGE_BASE_ID} (two stage), model: {model_id}"
+        )
+        started_at = time.perf_counter()
+        response = bedrock_runtime.invoke_model(
+            body=json.dumps(
+                prompt_request_body(
+                    prompt,
+                    model_id,
+                    max_tokens,
+                    temperature,
+                    top_p,
+                    conversation,
+                    passages,
+                )
+            ),
+            modelId=model_id,
+            contentType="application/json",
+            accept="application/json",
+        )
+        response_body = json.loads(response["body"].read().decode("utf-8"))
+        response_text = response_body["output"]["message"]["content"][0]["text"]
+        metrics.generation_time = time.perf_counter() - started_at
+        record_usage(metrics, response_body.get("usage", {}))
+        logger.info(f"Generation stage: {metrics.generation_time:.3f}s")
+
+        locations = citation_locations(passage_citations(passages))
+        metrics.citation_count = len(locations)
+        citations_text = format_citations(locations)
+        formatted_response = f"""
+{response_text}
+
+{citations_text}
+"""
+        return formatted_response
+
+    if KNOWLEDGE_BASE_ID:
+        logger.info(f"Using Knowledge Base ID: {KNOWLEDGE_BASE_ID}, model: {model_id}")
+        # Use Bedrock Knowledge Base
+        started_at = time.perf_counter()
+        request = {
+            "input": {"text": prompt},
+            "retrieveAndGenerateConfiguration": knowledge_base_configuration(
+                model_id, max_tokens, temperature, top_p
+            ),
+        }
+        if conversation["bedrock_session_id"]:
+            request["sessionId"] = conversation["bedrock_session_id"]
+        response = bedrock_agent.retrieve_and_generate(**request)
+        conversation["bedrock_session_id"] = response.get("sessionId")
+        metrics.generation_time = time.perf_counter() - started_at
+        logger.debug(f"Response: {json.dumps(response, indent=4, default=str)}")
+        # Format the response as markdown with citations
+        response_text = response["output"]["text"]
+        citations = response.get("citations", [])
+
+        # Build citations section
+        citations_text = ""
+        if citations:
+            logger.info("Getting citations...")
+            locations = citation_locations(citations)
+            metrics.citation_count = len(locations)
+            citations_text = format_citations(locations)
+
+        formatted_response = f"""
+{response_text}
+
+{citations_text}
+"""
+        return formatted_response
+
+    # Direct model invocation
+    if model_id.startswith("amazon.nova"):
+        body = prompt_request_body(
+            prompt, model_id, max_tokens, temperature, top_p, conversation
+        )
+        logger.info(f"Invoking model: {model_id}")
+        started_at = time.perf_counter()
+        response = bedrock_runtime.invoke_model(
+            body=json.dumps(body),
+            modelId=model_id,
+            contentType="application/json",
+            accept="application/json",
+        )
+        response_body = json.loads(response["body"].read().decode("utf-8"))
+        response_text = response_body["output"]["message"]["content"][0]["text"]
+
+        metrics.generation_time = time.perf_counter() - started_at
+
+        # Get token usage from response
+        usage = response_body.get("usage", {})
+        record_usage(metrics, usage)
+
+        formatted_response = f"""
+{response_text}
+
+{format_usage(usage)}
+"""
+        return formatted_response
+    else:
+        return "Model not supported yet."
+
+
+def generate_response(
+    prompt,
+    model_id,
+    max_tokens,
+    temperature,
+    top_p,
+    metrics=None,
+    conversation=None,
+    engine=None,
+):
+    """
+    Generates a response from Amazon Bedrock, optionally using a Knowledge Base.
+    A model_id of "auto" lets the model router pick the model, retrying with the
+    larger model when the answer is low-confidence. Stage latencies and token
+    counts are recorded on metrics when given, and conversation carries context
+    between turns of the same chat. With an engine, retrieval and each model
+    call run on it, admitted under the model that was routed to.
+    """
+    metrics = metrics or TurnMetrics(model_id=model_id)
+    conversation = conversation or new_conversation_context()
+    try:
+        passages = run_call(
+            engine, RETRIEVAL_ENGINE_KEY, turn_passages, prompt, metrics, conversation
+        )
+        route = route_turn(prompt, model_id, passages, metrics)
+        metrics.prompt_template = prompt_template().label
+        session_id = conversation["bedrock_session_id"]
+        generation_params = {
+            "prompt": prompt,
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "top_p": top_p,
+            "metrics": metrics,
+            "conversation": conversation,
+            "passages": passages,
+        }
+        response = run_call(
+            engine,
+            route.model_id,
+            generate_model_response,
+            model_id=route.model_id,
+            **generation_params,
+        )
+        first_generation_time = metrics.generation_time
+        if needs_fallback(route, response, metrics):
+            # The retry continues the chat from before the discarded answer
+            conversation["bedrock_session_id"] = session_id
+            response = run_call(
+                engine,
+                route.fallback_model_id,
+                generate_model_response,
+                model_id=route.fallback_model_id,
+                **generation_params,
+            )
+            finish_fallback(route, metrics, first_generation_time)
+        return response
+    except EngineBusyError:
+        raise
+    except Exception as e:
+        logger.error(f"Error generating response: {str(e)}")
+        # Start a fresh Bedrock session in case the old one expired
+        conversation["bedrock_session_id"] = None
+        return f"Error: {e}"
+
+
+def stream_model_events(
+    prompt,
+    model_id,
+    max_tokens,
+    temperature,
+    top_p,
+    metrics,
+    conversation,
+    passages=None,
+):
+    """
+    Streams a response from one model, from the retrieved passages when given.
+    """
+    bedrock_runtime = get_client("bedrock-runtime")
+    bedrock_agent = get_client("bedrock-agent-runtime")
+    if passages is not None:
+        logger.info(
+            f"Streaming from Knowledge Base ID: {KNOWLEDGE_BASE_ID} (two stage), model: {model_id}"
+        )
+        for citation in passage_citations(passages):
+            yield "citation", citation
+        started_at = time.perf_counter()
+        yield from stream_model_response(
+            bedrock_runtime,
+            model_id,
+            prompt_request_body(
+                prompt,
+                model_id,
+                max_tokens,
+                temperature,
+                top_p,
+                conversation,
+                passages,
+            ),
+        )
+        metrics.generation_time = time.perf_counter() - started_at
+        logger.info(f"Generation stage: {metrics.generation_time:.3f}s")
+    elif KNOWLEDGE_BASE_ID:
+        logger.info(
+            f"Streaming from Knowledge Base ID: {KNOWLEDGE_BASE_ID}, model: {model_id}"
+        )
+        started_at = time.perf_counter()
+        for kind, data in stream_knowledge_base_response(
+            bedrock_agent,
+            prompt,
+            knowledge_base_configuration(model_id, max_tokens, temperature, top_p),
+            session_id=conversation["bedrock_session_id"],
+        ):
+            if kind == "session":
+                conversation["bedrock_session_id"] = data
+            else:
+                yield kind, data
+        metrics.generation_time = time.perf_counter() - started_at
+    elif model_id.startswith("amazon.nova"):
+        body = prompt_request_body(
+            prompt, model_id, max_tokens, temperature, top_p, conversation
+        )
+        logger.info(f"Streaming model: {model_id}")
+        started_at = time.perf_counter()
+        yield from stream_model_response(bedrock_runtime, model_id, body)
+        metrics.generation_time = time.perf_counter() - started_at
+    else:
+        yield "text", "Model not supported yet."
+
+
+def generate_response_stream(
+    prompt,
+    model_id,
+    max_tokens,
+    temperature,
+    top_p,
+    metrics=None,
+    conversation=None,
+    engine=None,
+):
+    """
+    Streams a response from Amazon Bedrock as ("text" | "citation" | "usage", data)
+    events, optionally using a Knowledge Base. When the model router retries a
+    low-confidence answer with the larger model, a ("reset", None) event tells
+    the caller to discard what was streamed so far. With an engine, retrieval
+    and each model call run on it as for generate_response.
+    """
+    metrics = metrics or TurnMetrics(model_id=model_id)
+    conversation = conversation or new_conversation_context()
+    try:
+        passages = run_call(
+            engine, RETRIEVAL_ENGINE_KEY, turn_passages, prompt, metrics, conversation
+        )
+        route = route_turn(prompt, model_id, passages, metrics)
+        metrics.prompt_template = prompt_template().label
+        session_id = conversation["bedrock_session_id"]
+        generation_params = {
+            "prompt": prompt,
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "top_p": top_p,
+            "metrics": metrics,
+            "conversation": conversation,
+            "passages": passages,
+        }
+        response_text = ""
+        for kind, data in stream_call(
+            engine,
+            route.model_id,
+            stream_model_events,
+            model_id=route.model_id,
+            **generation_params,
+        ):
+            if kind == "text":
+                response_text += data
+            yield kind, data
+        first_generation_time = metrics.generation_time
+        if needs_fallback(route, response_text, metrics):
+            conversation["bedrock_session_id"] = session_id
+            yield "reset", None
+            yield from stream_call(
+                engine,
+                route.fallback_model_id,
+                stream_model_events,
+                model_id=route.fallback_model_id,
+                **generation_params,
+            )
+            finish_fallback(route, metrics, first_generation_time)
+    except EngineBusyError:
+        raise
+    except Exception as e:
+        logger.error(f"Error streaming response: {str(e)}")
+        conversation["bedrock_session_id"] = None
+        yield "text", f"Error: {e}"
+
+
+def format_response(response_text, locations, usage=None):
+    """
+    Formats a streamed answer like generate_response does: the sources when
+    there are any, otherwise the token usage.
+    """
+    footer = format_citations(locations)
+    if not footer and usage:
+        footer = format_usage(usage)
+    return f"""
+{response_text}
+
+{footer}
+"""
+
+
+def answer_events(
+    prompt,
+    model_id,
+    max_tokens,
+    temperature,
+    top_p,
+    metrics=None,
+    conversation=None,
+    stream=True,
+):
+    """
+    Answers one chat turn as ("text" | "citation" | "usage" | "reset" | "done",
+    data) events, running the Bedrock calls on the shared request engine. The
+    first question of a chat may be answered from the FAQ index, the answer
+    cache, or by an identical first question that is already being answered. "reset"
+    discards the text and citations streamed before a fallback to a larger
+    model. "done" always comes last and carries the formatted response; without
+    stream it is the only event besides the citations of an answer that was
+    not generated for this turn.
+    """
+    metrics = metrics or TurnMetrics(model_id=model_id)
+    conversation = conversation or new_conversation_context()
+    refresh_caches()
+    answer_cache = get_answer_cache()
+    cache_params = {
+        "knowledge_base_id": KNOWLEDGE_BASE_ID,
+        "model_id": model_id,
+        "max_tokens": max_tokens,
+        "temperature": temperature,
+        "top_p": top_p,
+    }
+    # Follow-up questions depend on earlier turns, so only the first
+    # question of a chat can be answered from the shared cache
+    is_follow_up = bool(conversation["history"])
+    faq_matcher = get_faq_matcher()
+    if faq_matcher and not is_follow_up:
+        faq = faq_matcher.match(prompt, generation=answer_cache.generation)
+        if faq is not None:
+            metrics.faq_hit = 1
+            yield from stored_answer_events(faq["answer"], faq["citations"], metrics)
+            return
+    cached = None if is_follow_up else answer_cache.get(prompt, **cache_params)
+    if cached is not None:
+        logger.info("Answer cache hit")
+        metrics.cache_hit = True
+        yield from stored_answer_events(cached["answer"], cached["citations"], metrics)
+        return
+
+    # Identical first questions asked at the same time share one answer
+    flight_key = None
+    if not is_follow_up:
+        flight_key = AnswerCache.make_key(AnswerCache.scope(**cache_params), prompt)
+        flight, leader = get_answer_flights().join(flight_key)
+        if not leader:
+            answer = wait_for_answer(flight)
+            if answer is not None:
+                logger.info("Answered by an identical question in flight")
+                metrics.coalesced = True
+                yield from stored_answer_events(answer["answer"], answer["citations"], metrics)
+                return
+            flight_key = None
+
+    response = None
+    locations = []
+    try:
+        started_at = time.perf_counter()
+        params = {
+            "prompt": prompt,
+            "model_id": model_id,
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "top_p": top_p,
+            "metrics": metrics,
+            "conversation": conversation,
+            "engine": get_request_engine(),
+        }
+        try:
+            if stream:
+                response_text = ""
+                usage = None
+                for kind, data in generate_response_stream(**params):
+                    if kind == "text":
+                        response_text += data
+                    elif kind == "citation":
+                        for location in citation_locations([data]):
+                            if location not in locations:
+                                locations.append(location)
+                    elif kind == "usage":
+                        usage = data
+                        record_usage(metrics, usage)
+                    elif kind == "reset":
+                        response_text = ""
+                        locations = []
+                        usage = None
+                    yield kind, data
+                metrics.citation_count = len(locations)
+                response = format_response(response_text, locations, usage)
+            else:
+                response = generate_response(**params)
+        except EngineBusyError:
+            logger.warning("Request engine is busy, rejecting request")
+            response = BUSY_MESSAGE
+        if not is_follow_up and not response.strip().startswith("Error:"):
+            answer_cache.put(
+                prompt,
+                response,
+                latency=time.perf_counter() - started_at,
+                citations=locations,
+                **cache_params,
+            )
+    finally:
+        # Waiting callers answer for themselves if this turn was abandoned
+        if flight_key is not None:
+            get_answer_flights().finish(
+                flight_key,
+                None if response is None else {"answer": response, "citations": locations},
+            )
+    yield "done", response
+
+
+def stored_answer_events(answer, locations, metrics):
+    """
+    Replays an answer that was not generated for this turn, with the source
+    locations it cited, as the events of a generated one.
+    """
+    metrics.citation_count = len(locations)
+    for citation in location_citations(locations):
+        yield "citation", citation
+    yield "done", answer
+
+
+@functools.cache
+def get_answer_cache():
+    """
+    Returns the answer cache shared by every session in this process.
+    """
+    similarity_threshold = os.environ.get("ANSWER_CACHE_SIMILARITY_THRESHOLD")
+    return AnswerCache(
+        max_entries=int(os.environ.get("ANSWER_CACHE_MAX_ENTRIES", "512")),
+        ttl_seconds=int(os.environ.get("ANSWER_CACHE_TTL_SECONDS", "3600")),
+        embed=titan_embedder(get_client("bedrock-runtime"))
+        if similarity_threshold
+        else None,
+        similarity_threshold=float(similarity_threshold)
+        if similarity_threshold
+        else None,
+        store=get_state_store(),
+    )
+
+
+@functools.cache
+def get_state_store():
+    """
+    Returns the state store shared by every session in this process, or None
+    when STATE_BACKEND is not set and state stays in memory.
+    """
+    backend_name = os.environ.get("STATE_BACKEND", "").lower()
+    if not backend_name:
+        return None
+    if backend_name == "memory":
+        backend = MemoryBackend()
+    elif backend_name == "sqlite":
+        backend = SQLiteBackend(os.environ.get("STATE_SQLITE_PATH", "state.db"))
+    elif backend_name == "redis":
+        backend = RedisBackend(os.environ.get("STATE_REDIS_URL", "redis://localhost:6379/0"))
+    elif backend_name == "dynamodb":
+        backend = DynamoDBBackend(
+            os.environ["STATE_TABLE_NAME"],
+            get_client("dynamodb", region_name=os.environ.get("AWS_REGION")),
+        )
+    else:
+        raise ValueError(f"Unknown STATE_BACKEND {backend_name!r}")
+    logger.info(f"Keeping session history and shared caches in {backend_name}")
+    return StateStore(
+        backend,
+        flush_interval=float(os.environ.get("STATE_FLUSH_SECONDS", "0.25")),
+    )
+
+
+@functools.cache
+def get_faq_matcher():
+    """
+    Returns the precomputed FAQ answers at FAQ_INDEX_URI, or None when unset.
+    """
+    uri = os.environ.get("FAQ_INDEX_URI")
+    if not uri:
+        return None
+    # Imported here so processes without an index do not load numpy
+    from faq_index import FaqMatcher
+
+    return FaqMatcher(
+        uri,
+        threshold=float(os.environ.get("FAQ_MATCH_THRESHOLD", "0.75")),
+        check_seconds=float(os.environ.get("FAQ_INDEX_CHECK_SECONDS", "300")),
+        s3_client=get_client("s3", region_name=os.environ.get("AWS_REGION"))
+        if uri.startswith("s3://")
+        else None,
+        embedding_client=get_client("bedrock-runtime"),
+        embedding_threshold=float(os.environ.get("FAQ_EMBEDDING_THRESHOLD", "0.9")),
+    )
+
+
+@functools.cache
+def get_answer_flights():
+    """
+    Returns the in-flight first questions that identical questions wait on.
+    """
+    return SingleFlight()
+
+
+def wait_for_answer(flight):
+    """
+    Returns the {"answer", "citations"} of an identical turn in flight, or
+    None when it failed or was abandoned and the caller should answer for
+    itself.
+    """
+    try:
+        answer = flight.wait(COALESCE_WAIT_SECONDS)
+    except Exception:
+        return None
+    if answer is None or answer["answer"].strip().startswith("Error:"):
+        return None
+    return answer
+
+
+@functools.cache
+def get_prompt_registry():
+    """
+    Returns the prompt templates, loaded once per process from PROMPT_TEMPLATE_DIR.
+    """
+    return PromptRegistry(
+        os.environ.get("PROMPT_TEMPLATE_DIR", PROMPTS_DIR),
+        cache_prompts=os.environ.get("PROMPT_CACHE", "true").lower() == "true",
+    )
+
+
+def prompt_template():
+    return get_prompt_registry().get(PROMPT_TEMPLATE_NAME)
+
+
+@functools.cache
+def get_retrieval_cache():
+    """
+    Returns the retrieved-passage cache shared by every session in this process.
+    """
+    return RetrievalCache(
+        max_entries=int(os.environ.get("RETRIEVAL_CACHE_MAX_ENTRIES", "1024")),
+        ttl_seconds=int(os.environ.get("RETRIEVAL_CACHE_TTL_SECONDS", "900")),
+    )
+
+
+@functools.cache
+def get_metrics_recorder():
+    """
+    Returns the per-turn metrics recorder shared by every session in this process.
+    """
+    return MetricsRecorder(
+        window=int(os.environ.get("METRICS_WINDOW", "1000")),
+        output_format=os.environ.get("METRICS_FORMAT", "emf"),
+        namespace=os.environ.get("METRICS_NAMESPACE", EMF_NAMESPACE),
+    )
+
+
+@functools.cache
+def get_model_router():
+    """
+    Returns the model router, and its latency averages, shared by every session.
+    """
+    latency_slo = os.environ.get("ROUTER_LATENCY_SLO_SECONDS")
+    return ModelRouter(
+        lite_model_id=os.environ.get("ROUTER_LITE_MODEL_ID", LITE_MODEL_ID),
+        pro_model_id=os.environ.get("ROUTER_PRO_MODEL_ID", PRO_MODEL_ID),
+        complexity_threshold=float(
+            os.environ.get("ROUTER_COMPLEXITY_THRESHOLD", "0.5")
+        ),
+        min_retrieval_score=float(os.environ.get("ROUTER_MIN_RETRIEVAL_SCORE", "0.4")),
+        latency_slo_seconds=float(latency_slo) if latency_slo else None,
+        fallback=os.environ.get("ROUTER_FALLBACK", "true").lower() == "true",
+    )
+
+
+@functools.cache
+def get_request_engine():
+    """
+    Returns the request engine that runs Bedrock calls for every session.
+    """
+    return RequestEngine(
+        max_workers=int(os.environ.get("ENGINE_MAX_WORKERS", "32")),
+        max_queue=int(os.environ.get("ENGINE_MAX_QUEUE", "128")),
+        model_limits=json.loads(os.environ.get("ENGINE_MODEL_LIMITS", "{}")),
+        default_model_limit=int(os.environ.get("ENGINE_DEFAULT_MODEL_LIMIT", "16")),
+    )
+
+
+def refresh_caches():
+    """
+    Clears the answer and retrieval caches when a new Knowledge Base sync has
+    started since they were filled.
+    """
+    if SYNC_GENERATION_PARAMETER:
+        get_answer_cache().refresh_generation(
+            fetch_sync_generation, on_change=get_retrieval_cache().invalidate
+        )
+
+
+def fetch_sync_generation():
+    """
+    Reads the generation marker the sync Lambda updates after every completed
+    sync. The parameter lives in the stack's region, which can differ from
+    Bedrock's.
+    """
+    ssm = get_client("ssm", region_name=os.environ.get("AWS_REGION"))
+    return ssm.get_parameter(Name=SYNC_GENERATION_PARAMETER)["Parameter"]["Value"]
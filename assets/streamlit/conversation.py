@@ -0,0 +1,115 @@
+import functools
+import re
+
+# Rough characters-per-token ratio for English text with Nova tokenizers
+CHARS_PER_TOKEN = 4
+# Shown in place of an answer when the assistant has no capacity for the turn
+BUSY_MESSAGE = "Error: The assistant is busy right now, please try again in a moment."
+
+_FOOTER_PATTERN = re.compile(r"\n+(### Sources\n|\*Tokens: ).*\Z", re.DOTALL)
+
+
+def estimate_tokens(text):
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+
+def answer_text(message):
+    """
+    Strips the sources and token footers that are appended to displayed answers.
+    """
+    return _FOOTER_PATTERN.sub("", message).strip()
+
+
+@functools.lru_cache(maxsize=4096)
+def split_footer(message):
+    """
+    Splits a displayed answer into its text and its sources or token footer.
+    Cached, since every rerun renders the same stored messages again.
+    """
+    match = _FOOTER_PATTERN.search(message)
+    if match is None:
+        return message, ""
+    return message[: match.start()], message[match.start() :].strip()
+
+
+def summarize_turns(turns, budget_tokens):
+    """
+    Builds a short extractive summary of dropped turns from the first sentence
+    of each earlier user question, keeping the most recent ones within budget.
+    """
+    lines = []
+    used = 0
+    for turn in reversed(turns):
+        if turn["role"] != "user":
+            continue
+        first_sentence = re.split(r"(?<=[.?!])\s", turn["text"].strip(), maxsplit=1)[0]
+        line = f"- {first_sentence[:200]}"
+        cost = estimate_tokens(line)
+        if used + cost > budget_tokens:
+            break
+        lines.insert(0, line)
+        used += cost
+    if not lines:
+        return ""
+    return "Earlier in this conversation the user asked:\n" + "\n".join(lines)
+
+
+def retrieval_query(history, prompt, max_questions=2, budget_tokens=100):
+    """
+    Returns the Knowledge Base search text for the prompt: the latest question
+    preceded by up to max_questions earlier user questions that fit in
+    budget_tokens, so a follow-up such as "what about weekends?" retrieves
+    passages about what the conversation is discussing.
+    """
+    earlier = []
+    remaining = budget_tokens
+    for turn in reversed(history):
+        if len(earlier) >= max_questions:
+            break
+        if turn["role"] != "user":
+            continue
+        cost = estimate_tokens(turn["text"])
+        if cost > remaining:
+            break
+        earlier.insert(0, turn["text"].strip())
+        remaining -= cost
+    return "\n".join([*earlier, prompt])
+
+
+def build_message_window(history, prompt, budget_tokens=2000, summary_tokens=200):
+    """
+    Returns Nova messages for the prompt preceded by as many recent turns from
+    history as fit in budget_tokens. Turns that do not fit are folded into a
+    short summary prepended to the oldest kept user message, so input tokens
+    stay bounded however long the conversation gets.
+
+    history is a list of {"role": "user" | "assistant", "text": str} dicts.
+    """
+    remaining = budget_tokens - estimate_tokens(prompt)
+    kept = []
+    # Walk back over complete user/assistant exchanges, newest first
+    turns = list(history)
+    while len(turns) >= 2 and remaining > 0:
+        user_turn, assistant_turn = turns[-2], turns[-1]
+        if user_turn["role"] != "user" or assistant_turn["role"] != "assistant":
+            turns.pop()
+            continue
+        cost = estimate_tokens(user_turn["text"]) + estimate_tokens(
+            assistant_turn["text"]
+        )
+        if cost > remaining:
+            break
+        kept[:0] = [user_turn, assistant_turn]
+        remaining -= cost
+        del turns[-2:]
+
+    messages = [
+        {"role": turn["role"], "content": [{"text": turn["text"]}]} for turn in kept
+    ]
+    messages.append({"role": "user", "content": [{"text": prompt}]})
+
+    summary = summarize_turns(turns, summary_tokens) if turns else ""
+    if summary:
+        first = messages[0]["content"][0]
+        first["text"] = f"{summary}\n\n{first['text']}"
+    return messages
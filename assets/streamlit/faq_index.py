@@ -0,0 +1,594 @@
+#!/usr/bin/env python3
+"""
+Precomputed answers to a curated list of frequently asked questions.
+
+The build step answers every question in a JSONL or CSV file (the same format
+batch_answer.py reads) and writes the answers, citations, a lexical index of
+the questions and their Titan embeddings to a compact binary file, locally or
+to s3://. The app maps the file into memory and answers questions that match
+one of them closely enough without calling Bedrock.
+
+    python faq_index.py build faq.jsonl --output faq.idx
+    python faq_index.py build s3://bucket/faq.csv --output s3://bucket/faq/faq.idx
+    python faq_index.py query faq.idx "When is the library open?"
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import math
+import mmap
+import os
+import re
+import struct
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from answer_cache import normalize_prompt, titan_embedder
+from model_router import is_low_confidence_answer
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"FAQIDX02"
+# magic, records, terms, then the offsets of the exact, term, postings,
+# record terms, record and metadata sections, the metadata length, and the
+# offset and dimensions of the embeddings
+HEADER = struct.Struct("<8sIIQQQQQQIQI")
+# Hash of a normalized question and its record
+EXACT_ENTRY = struct.Struct("<QI")
+# Hash of a term, its idf and the start and length of its postings
+TERM_ENTRY = struct.Struct("<QfII")
+POSTING = struct.Struct("<I")
+RECORD_TERM = struct.Struct("<Q")
+# Offset and length of a record's JSON, the summed idf of its terms and the
+# start and length of its terms
+RECORD_ENTRY = struct.Struct("<QIfII")
+# Unit-length question embeddings, one row per record
+EMBEDDING = np.dtype("<f4")
+EMBEDDING_MODEL_ID = "amazon.titan-embed-text-v2:0"
+
+# Words that say little about which FAQ a question is asking
+STOPWORDS = frozenset(
+    "a an the is are am be been do does did i me my we our you your it its to "
+    "of for in on at by with and or can could would should will please there "
+    "this that any some about".split()
+)
+
+
+def term_hash(text):
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def question_terms(question):
+    words = re.findall(r"\w+", normalize_prompt(question))
+    return {word for word in words if word not in STOPWORDS} or set(words)
+
+
+def idf(document_frequency, records):
+    return 1.0 + math.log((records + 1) / (document_frequency + 1))
+
+
+def unit_vector(embedding):
+    vector = np.asarray(embedding, dtype=EMBEDDING)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def write_index(path, entries, metadata, embeddings=None):
+    """
+    Writes entries of {"question", "answer", "citations", ...} to a binary
+    index file at path, with an embedding of each question when given.
+    """
+    terms_by_record = [
+        sorted({term_hash(term) for term in question_terms(entry["question"])})
+        for entry in entries
+    ]
+    postings = defaultdict(list)
+    for record, terms in enumerate(terms_by_record):
+        for term in terms:
+            postings[term].append(record)
+    idfs = {term: idf(len(records), len(entries)) for term, records in postings.items()}
+
+    exact = sorted(
+        (term_hash(normalize_prompt(entry["question"])), record)
+        for record, entry in enumerate(entries)
+    )
+    blobs = [
+        json.dumps(entry, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+        for entry in entries
+    ]
+    meta = json.dumps(metadata, separators=(",", ":")).encode("utf-8")
+    vectors = (
+        np.stack([unit_vector(embedding) for embedding in embeddings])
+        if embeddings
+        else np.zeros((0, 0), dtype=EMBEDDING)
+    )
+
+    # The embeddings come first so the matrix is aligned for numpy
+    embeddings_offset = HEADER.size
+    exact_offset = embeddings_offset + vectors.nbytes
+    terms_offset = exact_offset + EXACT_ENTRY.size * len(exact)
+    postings_offset = terms_offset + TERM_ENTRY.size * len(postings)
+    record_terms_offset = postings_offset + POSTING.size * sum(map(len, postings.values()))
+    records_offset = record_terms_offset + RECORD_TERM.size * sum(map(len, terms_by_record))
+    data_offset = records_offset + RECORD_ENTRY.size * len(entries)
+    meta_offset = data_offset + sum(map(len, blobs))
+
+    with open(path, "wb") as f:
+        f.write(
+            HEADER.pack(
+                MAGIC,
+                len(entries),
+                len(postings),
+                exact_offset,
+                terms_offset,
+                postings_offset,
+                record_terms_offset,
+                records_offset,
+                meta_offset,
+                len(meta),
+                embeddings_offset,
+                vectors.shape[1],
+            )
+        )
+        f.write(vectors.tobytes())
+        for entry in exact:
+            f.write(EXACT_ENTRY.pack(*entry))
+        start = 0
+        for term in sorted(postings):
+            f.write(TERM_ENTRY.pack(term, idfs[term], start, len(postings[term])))
+            start += len(postings[term])
+        for term in sorted(postings):
+            for record in postings[term]:
+                f.write(POSTING.pack(record))
+        for terms in terms_by_record:
+            for term in terms:
+                f.write(RECORD_TERM.pack(term))
+        position = data_offset
+        start = 0
+        for blob, terms in zip(blobs, terms_by_record):
+            f.write(
+                RECORD_ENTRY.pack(
+                    position, len(blob), sum(idfs[t] for t in terms), start, len(terms)
+                )
+            )
+            position += len(blob)
+            start += len(terms)
+        for blob in blobs:
+            f.write(blob)
+        f.write(meta)
+
+
+class FaqIndex:
+    """
+    Read-only, memory-mapped view of an index file. A lookup hashes the
+    normalized question for an exact match, and otherwise scores the FAQs
+    that share a term with it by idf-weighted Jaccard similarity, touching
+    only the index pages it needs. Reworded questions share too few words for
+    that, so nearest compares a question embedding with every FAQ's.
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (
+            magic,
+            self.records,
+            self.terms,
+            self._exact_offset,
+            self._terms_offset,
+            self._postings_offset,
+            self._record_terms_offset,
+            self._records_offset,
+            meta_offset,
+            meta_length,
+            self._embeddings_offset,
+            self.dimensions,
+        ) = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            self._map.close()
+            raise ValueError(f"{path} is not an FAQ index, or was built by another version")
+        self.metadata = json.loads(self._map[meta_offset : meta_offset + meta_length])
+        # Lookups in progress, so a replaced index is closed after the last one
+        self.readers = 0
+        self.retired = False
+
+    def __len__(self):
+        return self.records
+
+    def _find(self, offset, count, entry, key):
+        low, high = 0, count
+        while low < high:
+            middle = (low + high) // 2
+            value = entry.unpack_from(self._map, offset + middle * entry.size)
+            if value[0] < key:
+                low = middle + 1
+            elif value[0] > key:
+                high = middle
+            else:
+                return value
+        return None
+
+    def record(self, record):
+        position, length, _, _, _ = RECORD_ENTRY.unpack_from(
+            self._map, self._records_offset + record * RECORD_ENTRY.size
+        )
+        return json.loads(self._map[position : position + length])
+
+    def match(self, question, min_score=0.0):
+        """
+        Returns the closest FAQ record and its score, or (None, 0.0). FAQs that
+        cannot reach min_score are skipped without being scored.
+        """
+        if not self.records:
+            return None, 0.0
+        exact = self._find(
+            self._exact_offset,
+            self.records,
+            EXACT_ENTRY,
+            term_hash(normalize_prompt(question)),
+        )
+        if exact:
+            return self.record(exact[1]), 1.0
+
+        query = {}
+        query_weight = 0.0
+        for term in question_terms(question):
+            hashed = term_hash(term)
+            entry = self._find(self._terms_offset, self.terms, TERM_ENTRY, hashed)
+            if entry is None:
+                query_weight += idf(0, self.records)
+                continue
+            query[hashed] = entry[1:]
+            query_weight += entry[1]
+        if not query:
+            return None, 0.0
+
+        # Collect candidates from the rarest terms first. Once the terms left
+        # weigh too little for an FAQ sharing only them to reach min_score, the
+        # long postings of common words need not be read.
+        candidates = set()
+        remaining = sum(term_idf for term_idf, _, _ in query.values())
+        for term_idf, start, count in sorted(query.values(), key=lambda entry: entry[2]):
+            if remaining / query_weight < min_score:
+                break
+            offset = self._postings_offset + start * POSTING.size
+            candidates.update(
+                record for (record,) in POSTING.iter_unpack(self._map[offset : offset + count * POSTING.size])
+            )
+            remaining -= term_idf
+
+        best, best_score = None, 0.0
+        for record in candidates:
+            _, _, record_weight, start, count = RECORD_ENTRY.unpack_from(
+                self._map, self._records_offset + record * RECORD_ENTRY.size
+            )
+            offset = self._record_terms_offset + start * RECORD_TERM.size
+            shared = sum(
+                query[term][0]
+                for (term,) in RECORD_TERM.iter_unpack(self._map[offset : offset + count * RECORD_TERM.size])
+                if term in query
+            )
+            score = shared / (query_weight + record_weight - shared)
+            if score > best_score:
+                best, best_score = record, score
+        if best is None:
+            return None, 0.0
+        return self.record(best), best_score
+
+    def nearest(self, embedding):
+        """
+        Returns the FAQ record whose question embedding is closest to the
+        given one and their cosine similarity, or (None, 0.0).
+        """
+        if not (self.records and self.dimensions):
+            return None, 0.0
+        # A view of the mapping, which must be released before it is closed
+        vectors = np.frombuffer(
+            self._map,
+            dtype=EMBEDDING,
+            count=self.records * self.dimensions,
+            offset=self._embeddings_offset,
+        ).reshape(self.records, self.dimensions)
+        similarities = vectors @ unit_vector(embedding)
+        best = int(np.argmax(similarities))
+        similarity = float(similarities[best])
+        del vectors, similarities
+        return self.record(best), similarity
+
+    def close(self):
+        self._map.close()
+
+
+def question_embedding(index, client, question):
+    """
+    Embeds a question with the model the index was built with, or returns
+    None when the index has no embeddings or the call failed.
+    """
+    model_id = index.metadata.get("embedding_model")
+    if not (model_id and index.dimensions and client):
+        return None
+    embed = titan_embedder(client, model_id, index.dimensions)
+    try:
+        return embed(normalize_prompt(question))
+    except Exception as e:
+        logger.warning(f"Could not embed question for the FAQ index: {e}")
+        return None
+
+
+class FaqMatcher:
+    """
+    Serves answers from the FAQ index at uri, a local path or s3:// URI.
+
+    S3 indexes are downloaded to a local file and checked for a newer version
+    at most every check_seconds. A question whose words overlap an FAQ's by
+    less than threshold is embedded with the model the index was built with,
+    given an embedding_client, and matches the closest FAQ at a cosine
+    similarity of embedding_threshold or more; 0 turns this off. Everything
+    else falls through to Bedrock, and so does every question while the index
+    was built for a different Knowledge Base sync generation than the one
+    being served.
+    """
+
+    def __init__(
+        self,
+        uri,
+        threshold=0.75,
+        check_seconds=300,
+        s3_client=None,
+        embedding_client=None,
+        embedding_threshold=0.9,
+    ):
+        self.uri = uri
+        self.threshold = threshold
+        self.check_seconds = check_seconds
+        self.s3_client = s3_client
+        self.embedding_client = embedding_client
+        self.embedding_threshold = embedding_threshold
+        self.index = None
+        self._version = None
+        self._downloaded = None
+        self._checked_at = None
+        self._load_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.hits = 0
+        self.semantic_hits = 0
+        self.stale = 0
+
+    def refresh(self):
+        """Loads the index if it changed, at most every check_seconds."""
+        now = time.monotonic()
+        if self._checked_at is not None and now - self._checked_at < self.check_seconds:
+            return
+        # Another thread is already checking; serve the current index meanwhile
+        if not self._load_lock.acquire(blocking=False):
+            return
+        try:
+            self._checked_at = now
+            if self.uri.startswith("s3://"):
+                self._load_from_s3()
+            else:
+                version = os.stat(self.uri).st_mtime_ns
+                if version != self._version:
+                    self._swap(FaqIndex(self.uri), version)
+        except Exception as e:
+            logger.warning(f"Could not load FAQ index {self.uri}: {e}")
+        finally:
+            self._load_lock.release()
+
+    def _load_from_s3(self):
+        bucket, key = self.uri[len("s3://") :].split("/", 1)
+        version = self.s3_client.head_object(Bucket=bucket, Key=key)["ETag"]
+        if version == self._version:
+            return
+        handle, path = tempfile.mkstemp(prefix="faq-", suffix=".idx")
+        os.close(handle)
+        self.s3_client.download_file(bucket, key, path)
+        previous, self._downloaded = self._downloaded, path
+        self._swap(FaqIndex(path), version)
+        if previous:
+            # Lookups still holding the old index keep reading its mapping
+            os.remove(previous)
+
+    def _swap(self, index, version):
+        with self._lock:
+            previous, self.index = self.index, index
+            if previous is not None:
+                previous.retired = True
+                # Otherwise the last lookup still reading it closes it
+                if not previous.readers:
+                    previous.close()
+        self._version = version
+        logger.info(
+            f"Loaded {len(index)} FAQ answers built for generation "
+            f"{index.metadata.get('generation')}"
+        )
+
+    def match(self, question, generation=None):
+        """Returns the FAQ record answering the question, or None."""
+        self.refresh()
+        with self._lock:
+            index = self.index
+            if index is None:
+                return None
+            index.readers += 1
+            self.lookups += 1
+        try:
+            return self._match(index, question, generation)
+        finally:
+            with self._lock:
+                index.readers -= 1
+                if index.retired and not index.readers:
+                    index.close()
+
+    def _match(self, index, question, generation):
+        built_for = index.metadata.get("generation")
+        if generation and built_for and generation != built_for:
+            with self._lock:
+                self.stale += 1
+            return None
+        record, score = index.match(question, min_score=self.threshold)
+        if record is not None and score >= self.threshold:
+            with self._lock:
+                self.hits += 1
+            logger.info(f"FAQ match {score:.2f}: {record['question']!r}")
+            return record
+        if not self.embedding_threshold:
+            return None
+        embedding = question_embedding(index, self.embedding_client, question)
+        if embedding is None:
+            return None
+        record, similarity = index.nearest(embedding)
+        if record is None or similarity < self.embedding_threshold:
+            return None
+        with self._lock:
+            self.hits += 1
+            self.semantic_hits += 1
+        logger.info(f"FAQ semantic match {similarity:.2f}: {record['question']!r}")
+        return record
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self.index) if self.index else 0,
+                "generation": self.index.metadata.get("generation") if self.index else None,
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "semantic_hits": self.semantic_hits,
+                "stale": self.stale,
+                "hit_rate": self.hits / self.lookups if self.lookups else 0.0,
+            }
+
+
+def build(args):
+    """Answers the questions with Bedrock and writes the index."""
+    # The index being replaced must not answer its own questions
+    os.environ.pop("FAQ_INDEX_URI", None)
+    import batch_answer
+    import chat_service
+
+    items = batch_answer.read_questions(args.input)
+    rate_limiter = batch_answer.RateLimiter(args.rate)
+    args.api_url = None
+    generation = (
+        chat_service.fetch_sync_generation()
+        if chat_service.SYNC_GENERATION_PARAMETER
+        else None
+    )
+    entries = []
+    failed = 0
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        for record in pool.map(
+            lambda item: batch_answer.answer_question(item, args, rate_limiter), items
+        ):
+            # Questions the Knowledge Base cannot answer are left to Bedrock
+            if record["error"] or is_low_confidence_answer(record["answer"]):
+                failed += 1
+                continue
+            entries.append(
+                {
+                    "question": record["question"],
+                    "answer": record["answer"],
+                    "citations": record["citations"],
+                    "model_id": record["model_id"],
+                }
+            )
+        embeddings = None
+        if args.embedding_model:
+            from bedrock_clients import get_client
+
+            embed = titan_embedder(
+                get_client("bedrock-runtime"), args.embedding_model, args.embedding_dimensions
+            )
+            embeddings = list(
+                pool.map(lambda entry: embed(normalize_prompt(entry["question"])), entries)
+            )
+
+    metadata = {
+        "generation": generation,
+        "knowledge_base_id": chat_service.KNOWLEDGE_BASE_ID,
+        "built_at": time.time(),
+        "embedding_model": args.embedding_model if embeddings else None,
+    }
+    if args.output.startswith("s3://"):
+        handle, path = tempfile.mkstemp(suffix=".idx")
+        os.close(handle)
+        write_index(path, entries, metadata, embeddings)
+        bucket, key = args.output[len("s3://") :].split("/", 1)
+        from bedrock_clients import get_client
+
+        get_client("s3", region_name=os.environ.get("AWS_REGION")).upload_file(path, bucket, key)
+        os.remove(path)
+    else:
+        write_index(args.output, entries, metadata, embeddings)
+    print(
+        json.dumps({"indexed": len(entries), "skipped": failed, "generation": generation}),
+        file=sys.stderr,
+    )
+    return 1 if not entries and items else 0
+
+
+def query(args):
+    index = FaqIndex(args.index)
+    started_at = time.perf_counter()
+    record, score = index.match(args.question)
+    elapsed = time.perf_counter() - started_at
+    result = {
+        "score": round(score, 3),
+        "question": record["question"] if record else None,
+        "lookup_ms": round(elapsed * 1000, 3),
+    }
+    if index.dimensions:
+        from bedrock_clients import get_client
+
+        # The similarity to tune FAQ_EMBEDDING_THRESHOLD with
+        embedding = question_embedding(index, get_client("bedrock-runtime"), args.question)
+        if embedding is not None:
+            record, similarity = index.nearest(embedding)
+            result["similarity"] = round(similarity, 3)
+            result["nearest_question"] = record["question"] if record else None
+    print(json.dumps(result))
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    build_parser = commands.add_parser("build", help="Answer questions and write an index")
+    build_parser.add_argument("input", help="JSONL or CSV file of questions, local or s3://")
+    build_parser.add_argument("--output", required=True, help="Index file, local or s3://")
+    build_parser.add_argument("--concurrency", type=int, default=4)
+    build_parser.add_argument("--rate", type=float, default=2.0,
+                              help="Maximum questions started per second (0 for no limit)")
+    build_parser.add_argument("--retries", type=int, default=2)
+    build_parser.add_argument("--model-id", default=os.environ.get("DEFAULT_MODEL_ID", "auto"),
+                              help='A Bedrock model id, or "auto" to route each question')
+    build_parser.add_argument("--max-tokens", type=int, default=2000)
+    build_parser.add_argument("--temperature", type=float, default=0.2)
+    build_parser.add_argument("--top-p", type=float, default=0.2)
+    build_parser.add_argument("--embedding-model",
+                              default=os.environ.get("FAQ_EMBEDDING_MODEL_ID", EMBEDDING_MODEL_ID),
+                              help='Titan model embedding the questions, or "" for none')
+    build_parser.add_argument("--embedding-dimensions", type=int, default=256)
+    query_parser = commands.add_parser("query", help="Look a question up in an index")
+    query_parser.add_argument("index")
+    query_parser.add_argument("question")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    from app_logging import configure_logging
+
+    configure_logging(logging.INFO if args.verbose else logging.WARNING)
+    sys.exit(build(args) if args.command == "build" else query(args))
+
+
+if __name__ == "__main__":
+    main()
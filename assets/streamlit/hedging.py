@@ -0,0 +1,308 @@
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+from metrics import percentile
+from resilience import RetryBudget
+
+logger = logging.getLogger(__name__)
+
+# Recent latencies kept per operation and model to compute the hedge deadline
+LATENCY_WINDOW = 200
+# Latencies needed before the median replaces the default delay, and before
+# the percentile is trusted as well
+MIN_SAMPLES = 5
+PERCENTILE_SAMPLES = 20
+# A hedge for a call only just slower than the median rarely wins, so the
+# deadline is never shorter than this multiple of it
+MIN_MEDIAN_FACTOR = 1.5
+# A target failing more often than this is not used as primary or hedge
+MAX_ERROR_RATE = 0.5
+# An unhealthy target is tried again after this long without observations
+RECOVERY_SECONDS = 30
+
+
+@dataclass(frozen=True)
+class HedgeTarget:
+    """A region, optionally with a cross-region inference profile prefix."""
+
+    region: str
+    profile: str = ""
+
+    @property
+    def name(self):
+        return f"{self.region}/{self.profile}" if self.profile else self.region
+
+    def supports(self, model_id):
+        # Inference profiles only cover text models, not embeddings
+        return not self.profile or "embed" not in model_id
+
+    def model_id(self, model_id):
+        if not self.profile or model_id.startswith(f"{self.profile}."):
+            return model_id
+        return f"{self.profile}.{model_id}"
+
+
+class TargetHealth:
+    """Moving averages of a target's latency and error rate."""
+
+    def __init__(self, smoothing=0.2):
+        self.smoothing = smoothing
+        self.latency = None
+        self.error_rate = 0.0
+        self.observed_at = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, latency, ok):
+        with self._lock:
+            self.observed_at = time.monotonic()
+            if ok:
+                self.latency = (
+                    latency
+                    if self.latency is None
+                    else self.latency + self.smoothing * (latency - self.latency)
+                )
+            self.error_rate += self.smoothing * ((0.0 if ok else 1.0) - self.error_rate)
+
+    def score(self):
+        """Lower is healthier; None until the target has answered once."""
+        with self._lock:
+            if self.latency is None:
+                return None
+            return self.latency * (1 + 4 * self.error_rate)
+
+    def healthy(self):
+        with self._lock:
+            return (
+                self.error_rate <= MAX_ERROR_RATE
+                or time.monotonic() - self.observed_at >= RECOVERY_SECONDS
+            )
+
+
+class PrefetchedStream:
+    """An event stream whose first event was read to decide the hedge race."""
+
+    def __init__(self, first, events, body):
+        self._first = first
+        self._events = events
+        self._body = body
+
+    def __iter__(self):
+        yield self._first
+        yield from self._events
+
+    def close(self):
+        close_body(self._body)
+
+
+def close_body(body):
+    close = getattr(body, "close", None)
+    if close is not None:
+        try:
+            close()
+        except Exception as e:
+            logger.debug(f"Could not close abandoned response: {e}")
+
+
+class _Race:
+    """Outcome of one hedged call, shared by the requests racing for it."""
+
+    def __init__(self):
+        self.results = queue.Queue()
+        self.settled = False
+        self.lock = threading.Lock()
+
+
+class HedgedRuntime:
+    """
+    Wraps bedrock-runtime clients in several regions or inference profiles.
+
+    Each call goes to the first target unless it keeps failing. If it has not
+    answered (or, for streams, sent its first event) by the hedge deadline, the
+    same request is sent to the healthiest other target while the hedge budget
+    allows, and so is one whose first target fails before the deadline. The
+    deadline is the given percentile of recent latencies for the operation and
+    model, capped at median_factor times their median: when more calls stall
+    than the percentile leaves out, the percentile is itself a stall and
+    hedging there would not shorten the tail. The first answer wins; the other
+    is closed when it arrives.
+    Knowledge Base calls stay on the bedrock-agent-runtime client, since a
+    Knowledge Base lives in a single region.
+    """
+
+    def __init__(
+        self,
+        targets,
+        client_for,
+        percentile=90,
+        median_factor=3.0,
+        default_delay=1.0,
+        budget=None,
+        max_workers=32,
+    ):
+        self.targets = list(targets)
+        self.client_for = client_for
+        self.percentile = percentile
+        self.median_factor = median_factor
+        self.default_delay = default_delay
+        self.budget = budget or RetryBudget(ratio=0.1, capacity=5.0)
+        self.health = {target.name: TargetHealth() for target in self.targets}
+        self._latencies = {}
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="hedge"
+        )
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.budget_denied = 0
+
+    def __getattr__(self, name):
+        return getattr(self.client_for(self.targets[0].region), name)
+
+    def invoke_model(self, **kwargs):
+        return self._hedge("invoke_model", kwargs)
+
+    def invoke_model_with_response_stream(self, **kwargs):
+        return self._hedge("invoke_model_with_response_stream", kwargs)
+
+    def deadline(self, operation, model_id):
+        with self._lock:
+            samples = list(self._latencies.get((operation, model_id), ()))
+        if len(samples) < MIN_SAMPLES:
+            return self.default_delay
+        median = percentile(samples, 50)
+        cap = median * self.median_factor
+        if len(samples) < PERCENTILE_SAMPLES:
+            return cap
+        return min(max(percentile(samples, self.percentile), median * MIN_MEDIAN_FACTOR), cap)
+
+    def ranked_targets(self, model_id):
+        """
+        Returns the primary and hedge targets for the model. The first target
+        stays primary while it is healthy; the others are ranked by score, with
+        those that have not answered yet last in their configured order.
+        """
+        primary, *others = self.targets
+        candidates = [
+            t for t in others if t.supports(model_id) and self.health[t.name].healthy()
+        ]
+        candidates.sort(
+            key=lambda t: (
+                self.health[t.name].score() is None,
+                self.health[t.name].score() or 0.0,
+            )
+        )
+        if candidates and not self.health[primary.name].healthy():
+            return candidates + [primary]
+        return [primary] + candidates
+
+    def stats(self):
+        with self._lock:
+            counters = {
+                "calls": self.calls,
+                "hedges": self.hedges,
+                "hedge_wins": self.hedge_wins,
+                "budget_denied": self.budget_denied,
+            }
+        return {
+            **counters,
+            "targets": {
+                name: {
+                    "latency": round(health.latency, 3) if health.latency else None,
+                    "error_rate": round(health.error_rate, 3),
+                }
+                for name, health in self.health.items()
+            },
+        }
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def _hedge(self, operation, kwargs):
+        self._count("calls")
+        self.budget.deposit()
+        model_id = kwargs["modelId"]
+        ranked = self.ranked_targets(model_id)
+        race = _Race()
+        self._executor.submit(self._attempt, race, ranked[0], operation, kwargs)
+        launched = 1
+        timeout = self.deadline(operation, model_id)
+        hedged = False
+        error = None
+        while True:
+            try:
+                target, result, attempt_error = race.results.get(
+                    timeout=None if hedged or len(ranked) < 2 else timeout
+                )
+            except queue.Empty:
+                hedged = True
+                reason = f"passed its {timeout:.2f}s deadline"
+                launched += self._send_hedge(race, ranked, operation, kwargs, reason)
+                continue
+            launched -= 1
+            if attempt_error is None:
+                if target != ranked[0]:
+                    self._count("hedge_wins")
+                return result
+            error = attempt_error
+            if not hedged and len(ranked) > 1:
+                # A fast primary failure, such as a throttle, goes straight to
+                # the hedge target instead of failing the call
+                hedged = True
+                launched += self._send_hedge(race, ranked, operation, kwargs, "failed")
+            if launched == 0:
+                raise error
+            # The other request may still answer
+
+    def _send_hedge(self, race, ranked, operation, kwargs, reason):
+        """Sends the request to ranked[1] if the budget allows; returns 1 if sent."""
+        if not self.budget.withdraw():
+            self._count("budget_denied")
+            return 0
+        self._count("hedges")
+        logger.info(
+            f"{operation} on {ranked[0].name} {reason}, hedging to {ranked[1].name}"
+        )
+        self._executor.submit(self._attempt, race, ranked[1], operation, kwargs)
+        return 1
+
+    def _attempt(self, race, target, operation, kwargs):
+        client = self.client_for(target.region)
+        request = {**kwargs, "modelId": target.model_id(kwargs["modelId"])}
+        started_at = time.perf_counter()
+        try:
+            response = getattr(client, operation)(**request)
+            if operation == "invoke_model_with_response_stream":
+                # The race is won by the first event, not by the stream opening
+                events = iter(response["body"])
+                first = next(events)
+                response = {
+                    **response,
+                    "body": PrefetchedStream(first, events, response["body"]),
+                }
+        except Exception as e:
+            self.health[target.name].observe(time.perf_counter() - started_at, False)
+            logger.warning(f"{operation} on {target.name} failed: {e}")
+            race.results.put((target, None, e))
+            return
+        elapsed = time.perf_counter() - started_at
+        self.health[target.name].observe(elapsed, True)
+        if target == self.targets[0]:
+            with self._lock:
+                self._latencies.setdefault(
+                    (operation, kwargs["modelId"]), deque(maxlen=LATENCY_WINDOW)
+                ).append(elapsed)
+        with race.lock:
+            won = not race.settled
+            race.settled = True
+        if won:
+            race.results.put((target, response, None))
+        else:
+            # The other request already answered, so this one is dropped
+            close_body(response["body"])
@@ -0,0 +1,360 @@
+import hashlib
+import hmac
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+logger = logging.getLogger(__name__)
+
+
+def message_digest(role, text):
+    return hashlib.blake2b(f"{role}\n{text}".encode("utf-8"), digest_size=8).hexdigest()
+
+
+@dataclass(slots=True, frozen=True)
+class MessageRecord:
+    """A single chat message: the raw text sent as context and the rendered markdown."""
+
+    id: str
+    role: str
+    text: str
+    rendered: str
+    digest: str
+    created_at: float
+
+    @property
+    def is_user(self):
+        return self.role == "user"
+
+
+@dataclass(slots=True)
+class Conversation:
+    id: str
+    title: str = ""
+    messages: list = field(default_factory=list)
+    bedrock_session_id: str | None = None
+    created_at: float = field(default_factory=time.time)
+    updated_at: float = field(default_factory=time.time)
+
+    def context_turns(self):
+        """
+        Returns the messages in the shape expected by build_message_window,
+        leaving out exchanges whose answer was an error.
+        """
+        turns = []
+        for message in self.messages:
+            if message.role == "assistant" and message.text.startswith("Error:"):
+                if turns and turns[-1]["role"] == "user":
+                    turns.pop()
+                continue
+            turns.append({"role": message.role, "text": message.text})
+        return turns
+
+
+def conversation_record(conversation):
+    """
+    Packs a conversation into the compact shape kept in the state store, with
+    messages as lists and the rendered markdown left out when it is the text.
+    """
+    return [
+        conversation.id,
+        conversation.title,
+        conversation.bedrock_session_id,
+        conversation.created_at,
+        conversation.updated_at,
+        [
+            [
+                m.id,
+                m.role,
+                m.text,
+                None if m.rendered == m.text else m.rendered,
+                m.digest,
+                m.created_at,
+            ]
+            for m in conversation.messages
+        ],
+    ]
+
+
+def conversation_from_record(record):
+    id, title, bedrock_session_id, created_at, updated_at, messages = record
+    return Conversation(
+        id=id,
+        title=title,
+        messages=[
+            MessageRecord(
+                id=m[0],
+                role=m[1],
+                text=m[2],
+                rendered=m[2] if m[3] is None else m[3],
+                digest=m[4],
+                created_at=m[5],
+            )
+            for m in messages
+        ],
+        bedrock_session_id=bedrock_session_id,
+        created_at=created_at,
+        updated_at=updated_at,
+    )
+
+
+def sign_owner(owner, key, ttl_seconds):
+    """
+    Returns "owner.expires_at.signature", an owner id that can go in a URL:
+    it cannot be forged or guessed without the key and stops working after
+    ttl_seconds.
+    """
+    payload = f"{owner}.{int(time.time() + ttl_seconds)}"
+    signature = hmac.new(key.encode("utf-8"), payload.encode("utf-8"), hashlib.sha256)
+    return f"{payload}.{signature.hexdigest()}"
+
+
+def verify_owner(token, key):
+    """Returns the owner id of a token from sign_owner, or None if it is invalid or expired."""
+    try:
+        owner, expires_at, signature = (token or "").split(".")
+        expires_at = int(expires_at)
+    except ValueError:
+        return None
+    expected = hmac.new(
+        key.encode("utf-8"), f"{owner}.{expires_at}".encode("utf-8"), hashlib.sha256
+    ).hexdigest()
+    if not hmac.compare_digest(signature, expected) or expires_at <= time.time():
+        return None
+    return owner
+
+
+class HistoryStore:
+    """
+    Indexed, bounded store of a session's conversations.
+
+    Conversations are kept in least-recently-updated order and capped by count
+    and age; each conversation keeps at most max_messages messages. Consecutive
+    duplicate messages are dropped by digest. When spill_path is set, evicted
+    conversations and trimmed messages are written to a local SQLite database
+    and can be reloaded with get().
+
+    When a StateStore and an owner key are given, every conversation with
+    messages and the owner's list of conversations are also written to the
+    store, and a new HistoryStore for the same owner, in this or any other
+    task, starts from them. Only conversations on the owner's list are
+    reloaded from the store, so a conversation id alone does not open one.
+    """
+
+    def __init__(
+        self,
+        max_conversations=20,
+        max_messages=200,
+        max_age_seconds=86400,
+        spill_path=None,
+        store=None,
+        owner=None,
+    ):
+        self.max_conversations = max_conversations
+        self.max_messages = max_messages
+        self.max_age_seconds = max_age_seconds
+        self.spill_path = spill_path
+        self.store = store if owner else None
+        self.owner = owner
+        self._conversations = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if self.store:
+            self._restore()
+
+    def create(self):
+        conversation = Conversation(id=uuid.uuid4().hex)
+        with self._lock:
+            self._conversations[conversation.id] = conversation
+            self._evict()
+        return conversation
+
+    def get(self, conversation_id):
+        """
+        Returns the conversation, reloading it from the spill database or the
+        state store if it is not in memory, or None if it is unknown.
+        """
+        if not conversation_id:
+            return None
+        with self._lock:
+            conversation = self._conversations.get(conversation_id)
+            if conversation is None:
+                conversation = self._load(conversation_id) or self._fetch(conversation_id)
+                if conversation is not None:
+                    self._conversations[conversation_id] = conversation
+                    self._evict(keep=conversation_id)
+            return conversation
+
+    def add_message(self, conversation_id, role, text, rendered=None):
+        """
+        Appends a message to the conversation unless it repeats the last one.
+        """
+        digest = message_digest(role, text)
+        with self._lock:
+            conversation = self._conversations[conversation_id]
+            if conversation.messages and conversation.messages[-1].digest == digest:
+                return conversation.messages[-1]
+            record = MessageRecord(
+                id=uuid.uuid4().hex,
+                role=role,
+                text=text,
+                rendered=rendered if rendered is not None else text,
+                digest=digest,
+                created_at=time.time(),
+            )
+            conversation.messages.append(record)
+            if not conversation.title and role == "user":
+                conversation.title = text[:60]
+            conversation.updated_at = record.created_at
+            self._conversations.move_to_end(conversation_id)
+            if len(conversation.messages) > self.max_messages:
+                trimmed = conversation.messages[: -self.max_messages]
+                del conversation.messages[: -self.max_messages]
+                self._spill(conversation, trimmed)
+            self._evict()
+            self._save(conversation)
+            return record
+
+    def recent(self, limit=10):
+        """Returns the most recently updated conversations that have messages."""
+        with self._lock:
+            conversations = [c for c in reversed(self._conversations.values()) if c.messages]
+        return conversations[:limit]
+
+    def __len__(self):
+        return len(self._conversations)
+
+    def _evict(self, keep=None):
+        cutoff = time.time() - self.max_age_seconds
+        for conversation_id in list(self._conversations):
+            if conversation_id == keep:
+                continue
+            conversation = self._conversations[conversation_id]
+            over_capacity = len(self._conversations) > self.max_conversations
+            if not over_capacity and conversation.updated_at >= cutoff:
+                break
+            del self._conversations[conversation_id]
+            self._spill(conversation, conversation.messages)
+
+    def _conversation_key(self, conversation_id):
+        return f"conversation:{conversation_id}"
+
+    def _owner_key(self):
+        return f"history:{self.owner}"
+
+    def _save(self, conversation):
+        if not self.store:
+            return
+        self.store.put(
+            self._conversation_key(conversation.id),
+            conversation_record(conversation),
+            ttl_seconds=self.max_age_seconds,
+        )
+        self.store.put(
+            self._owner_key(),
+            [c.id for c in self._conversations.values() if c.messages],
+            ttl_seconds=self.max_age_seconds,
+        )
+
+    def _fetch(self, conversation_id):
+        if not self.store:
+            return None
+        if conversation_id not in (self.store.get(self._owner_key()) or []):
+            return None
+        record = self.store.get(self._conversation_key(conversation_id))
+        return conversation_from_record(record) if record else None
+
+    def _restore(self):
+        conversation_ids = self.store.get(self._owner_key()) or []
+        conversation_ids = conversation_ids[-self.max_conversations :]
+        records = self.store.get_many(self._conversation_key(i) for i in conversation_ids)
+        for conversation_id in conversation_ids:
+            record = records.get(self._conversation_key(conversation_id))
+            if record:
+                self._conversations[conversation_id] = conversation_from_record(record)
+        if self._conversations:
+            logger.info(f"Restored {len(self._conversations)} conversations for {self.owner}")
+        self._evict()
+
+    def _connect(self):
+        if self._db is None:
+            self._db = sqlite3.connect(self.spill_path, check_same_thread=False)
+            self._db.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS conversations (
+                    id TEXT PRIMARY KEY, title TEXT, bedrock_session_id TEXT,
+                    created_at REAL, updated_at REAL
+                );
+                CREATE TABLE IF NOT EXISTS messages (
+                    id TEXT PRIMARY KEY, conversation_id TEXT, role TEXT,
+                    text TEXT, rendered TEXT, digest TEXT, created_at REAL
+                );
+                CREATE INDEX IF NOT EXISTS messages_by_conversation
+                    ON messages (conversation_id, created_at);
+                """
+            )
+        return self._db
+
+    def _spill(self, conversation, messages):
+        if not self.spill_path or not messages:
+            return
+        try:
+            db = self._connect()
+            with db:
+                db.execute(
+                    "INSERT OR REPLACE INTO conversations VALUES (?, ?, ?, ?, ?)",
+                    (
+                        conversation.id,
+                        conversation.title,
+                        conversation.bedrock_session_id,
+                        conversation.created_at,
+                        conversation.updated_at,
+                    ),
+                )
+                db.executemany(
+                    "INSERT OR IGNORE INTO messages VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    [
+                        (
+                            m.id,
+                            conversation.id,
+                            m.role,
+                            m.text,
+                            m.rendered,
+                            m.digest,
+                            m.created_at,
+                        )
+                        for m in messages
+                    ],
+                )
+        except sqlite3.Error as e:
+            logger.warning(f"Could not spill conversation {conversation.id}: {e}")
+
+    def _load(self, conversation_id):
+        if not self.spill_path:
+            return None
+        db = self._connect()
+        row = db.execute(
+            "SELECT id, title, bedrock_session_id, created_at, updated_at "
+            "FROM conversations WHERE id = ?",
+            (conversation_id,),
+        ).fetchone()
+        if row is None:
+            return None
+        rows = db.execute(
+            "SELECT id, role, text, rendered, digest, created_at FROM messages "
+            "WHERE conversation_id = ? ORDER BY created_at DESC LIMIT ?",
+            (conversation_id, self.max_messages),
+        ).fetchall()
+        messages = [MessageRecord(*message) for message in reversed(rows)]
+        return Conversation(
+            id=row[0],
+            title=row[1],
+            messages=messages,
+            bedrock_session_id=row[2],
+            created_at=row[3],
+            updated_at=row[4],
+        )
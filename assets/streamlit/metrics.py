@@ -0,0 +1,149 @@
+import json
+import logging
+import statistics
+import threading
+import time
+from collections import deque
+from dataclasses import asdict, dataclass, field
+
+logger = logging.getLogger(__name__)
+metrics_logger = logging.getLogger("metrics")
+
+EMF_NAMESPACE = "BedrockKnowledgeBot"
+
+# Metric name -> CloudWatch unit for the Embedded Metric Format
+EMF_METRICS = {
+    "time_to_first_byte": "Seconds",
+    "total_latency": "Seconds",
+    "retrieval_time": "Seconds",
+    "generation_time": "Seconds",
+    "render_time": "Seconds",
+    "client_setup_time": "Seconds",
+    "input_tokens": "Count",
+    "output_tokens": "Count",
+    "cache_read_input_tokens": "Count",
+    "cache_write_input_tokens": "Count",
+    "citation_count": "Count",
+    "context_tokens": "Count",
+    "context_tokens_saved": "Count",
+    "faq_hit": "Count",
+}
+
+
+@dataclass
+class TurnMetrics:
+    """
+    Latency and token measurements for a single chat turn.
+
+    Generation code fills in the stages it runs; unmeasured stages stay None.
+    """
+
+    model_id: str
+    pipeline: str = ""
+    prompt_template: str = ""
+    routing_reason: str = ""
+    fallback: bool = False
+    cache_hit: bool = False
+    # 1 when answered from the FAQ index, so its average is the FAQ hit rate
+    faq_hit: int = 0
+    coalesced: bool = False
+    time_to_first_byte: float | None = None
+    total_latency: float | None = None
+    retrieval_time: float | None = None
+    generation_time: float | None = None
+    render_time: float | None = None
+    # Time the turn waited for the process's Bedrock client warm-up
+    client_setup_time: float | None = None
+    input_tokens: int | None = None
+    output_tokens: int | None = None
+    # Prompt tokens read from or written to Bedrock's prompt cache; input_tokens
+    # counts only the rest
+    cache_read_input_tokens: int | None = None
+    cache_write_input_tokens: int | None = None
+    context_tokens: int | None = None
+    context_tokens_saved: int | None = None
+    citation_count: int = 0
+    timestamp: float = field(default_factory=time.time)
+    started_at: float = field(default_factory=time.perf_counter, repr=False)
+
+    def mark_first_byte(self):
+        if self.time_to_first_byte is None:
+            self.time_to_first_byte = time.perf_counter() - self.started_at
+
+    def finish(self):
+        self.total_latency = time.perf_counter() - self.started_at
+        if self.time_to_first_byte is None:
+            self.time_to_first_byte = self.total_latency
+
+    def to_dict(self):
+        record = asdict(self)
+        record.pop("started_at")
+        return record
+
+
+def to_emf(record, namespace=EMF_NAMESPACE):
+    """
+    Wraps a metrics record in CloudWatch Embedded Metric Format so the awslogs
+    driver turns the log line into metrics without any API calls.
+    """
+    metrics = [
+        {"Name": name, "Unit": unit}
+        for name, unit in EMF_METRICS.items()
+        if record.get(name) is not None
+    ]
+    return {
+        "_aws": {
+            "Timestamp": int(record["timestamp"] * 1000),
+            "CloudWatchMetrics": [
+                {
+                    "Namespace": namespace,
+                    "Dimensions": [["model_id"], ["model_id", "cache_hit"]],
+                    "Metrics": metrics,
+                }
+            ],
+        },
+        **{k: str(v) if k == "cache_hit" else v for k, v in record.items()},
+    }
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[q - 1]
+
+
+def summarize(turns, name):
+    """
+    Returns the p50 and p95 of a metric over a sequence of turn records.
+    """
+    values = [turn[name] for turn in turns if turn.get(name) is not None]
+    return {"p50": percentile(values, 50), "p95": percentile(values, 95)}
+
+
+class MetricsRecorder:
+    """
+    Keeps recent turn metrics for the process and emits each turn as a JSON line
+    (or EMF record) through the "metrics" logger.
+    """
+
+    def __init__(self, window=1000, output_format="emf", namespace=EMF_NAMESPACE):
+        self.output_format = output_format
+        self.namespace = namespace
+        self._turns = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, metrics):
+        record = metrics.to_dict()
+        with self._lock:
+            self._turns.append(record)
+        payload = (
+            to_emf(record, self.namespace) if self.output_format == "emf" else record
+        )
+        metrics_logger.info(json.dumps(payload, default=str))
+        return record
+
+    def turns(self):
+        with self._lock:
+            return list(self._turns)
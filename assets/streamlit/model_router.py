@@ -0,0 +1,175 @@
+import logging
+import re
+import threading
+from dataclasses import dataclass
+
+from conversation import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+AUTO_MODEL = "auto"
+LITE_MODEL_ID = "amazon.nova-lite-v1:0"
+PRO_MODEL_ID = "amazon.nova-pro-v1:0"
+
+# Wording that usually means the question needs reasoning rather than a lookup
+COMPLEX_TERMS = re.compile(
+    r"\b(compare|comparison|differences?|versus|vs|why|explain|analy[sz]e|"
+    r"pros and cons|trade-?offs?|step[- ]by[- ]step|plan|recommend|evaluate|"
+    r"summari[sz]e|implications?)\b",
+    re.IGNORECASE,
+)
+CLAUSE_MARKERS = re.compile(r"\b(and|or|but|then|also|if)\b|[;,]", re.IGNORECASE)
+
+# Answers that admit they could not answer, which the larger model may fix
+LOW_CONFIDENCE_ANSWERS = re.compile(
+    r"could not find an exact answer|couldn't find|could not find|"
+    r"i don't know|i do not know|i'm not sure|i am not sure|unable to (find|answer)|"
+    r"do(es)? not contain (any )?information",
+    re.IGNORECASE,
+)
+
+
+def prompt_features(prompt):
+    return {
+        "tokens": estimate_tokens(prompt),
+        "questions": max(1, prompt.count("?")),
+        "complex_terms": len(COMPLEX_TERMS.findall(prompt)),
+        "clauses": len(CLAUSE_MARKERS.findall(prompt)),
+    }
+
+
+def complexity_score(features):
+    """
+    Scores a prompt from 0 (simple lookup) to 1 (multi-part or analytical).
+    """
+    score = min(features["tokens"] / 150, 1.0) * 0.4
+    score += min(features["complex_terms"], 2) * 0.2
+    score += min(features["questions"] - 1, 2) * 0.1
+    score += min(features["clauses"], 4) * 0.025
+    return min(score, 1.0)
+
+
+def retrieval_confidence(passages):
+    """Returns the best retrieval score, or None without scored passages."""
+    scores = [p["score"] for p in passages or [] if p.get("score") is not None]
+    return max(scores) if scores else None
+
+
+def is_low_confidence_answer(answer):
+    return bool(LOW_CONFIDENCE_ANSWERS.search(answer))
+
+
+@dataclass(frozen=True)
+class Route:
+    model_id: str
+    reason: str
+    fallback_model_id: str | None = None
+
+
+class ModelRouter:
+    """
+    Picks Nova Lite or Nova Pro for prompts sent with the "auto" model.
+
+    Analytical or multi-part prompts, and prompts whose retrieved passages
+    score below min_retrieval_score, go to the larger model; the rest go to
+    the smaller one, falling back to the larger model when the answer admits
+    it could not answer. When the larger model's recent generation latency
+    exceeds latency_slo_seconds, prompts below hard_threshold are kept on the
+    smaller model. Generation latency per model is tracked as a moving average
+    so routing decisions can be logged with their latency impact.
+    """
+
+    def __init__(
+        self,
+        lite_model_id=LITE_MODEL_ID,
+        pro_model_id=PRO_MODEL_ID,
+        complexity_threshold=0.5,
+        hard_threshold=0.8,
+        min_retrieval_score=0.4,
+        latency_slo_seconds=None,
+        fallback=True,
+        smoothing=0.2,
+    ):
+        self.lite_model_id = lite_model_id
+        self.pro_model_id = pro_model_id
+        self.complexity_threshold = complexity_threshold
+        self.hard_threshold = hard_threshold
+        self.min_retrieval_score = min_retrieval_score
+        self.latency_slo_seconds = latency_slo_seconds
+        self.fallback = fallback
+        self.smoothing = smoothing
+        self._latency = {}
+        self._lock = threading.Lock()
+
+    def route(self, prompt, model_id, passages=None):
+        if model_id != AUTO_MODEL:
+            return Route(model_id, "selected")
+
+        complexity = complexity_score(prompt_features(prompt))
+        confidence = retrieval_confidence(passages)
+        if complexity >= self.complexity_threshold:
+            route = Route(self.pro_model_id, f"complex prompt ({complexity:.2f})")
+        elif confidence is not None and confidence < self.min_retrieval_score:
+            route = Route(
+                self.pro_model_id, f"low retrieval confidence ({confidence:.2f})"
+            )
+        else:
+            route = Route(
+                self.lite_model_id,
+                f"simple prompt ({complexity:.2f})",
+                self.pro_model_id if self.fallback else None,
+            )
+
+        pro_latency = self.latency(self.pro_model_id)
+        if (
+            route.model_id == self.pro_model_id
+            and self.latency_slo_seconds
+            and pro_latency is not None
+            and pro_latency > self.latency_slo_seconds
+            and complexity < self.hard_threshold
+        ):
+            route = Route(
+                self.lite_model_id,
+                f"{route.reason}, but {self.pro_model_id} is over the "
+                f"{self.latency_slo_seconds}s latency SLO ({pro_latency:.2f}s)",
+            )
+        logger.info(f"Routing to {route.model_id}: {route.reason}")
+        return route
+
+    def observe(self, model_id, generation_time):
+        """Records a generation latency for the model's moving average."""
+        if generation_time is None:
+            return
+        with self._lock:
+            previous = self._latency.get(model_id)
+            self._latency[model_id] = (
+                generation_time
+                if previous is None
+                else previous + self.smoothing * (generation_time - previous)
+            )
+
+    def latency(self, model_id):
+        with self._lock:
+            return self._latency.get(model_id)
+
+    def log_outcome(self, route, model_id, generation_time, fallback_after=None):
+        """
+        Logs the model that answered with how its latency compares to the other
+        model's recent average; fallback_after is the time spent on the answer
+        that was discarded.
+        """
+        if route.reason == "selected" or generation_time is None:
+            return
+        other = self.pro_model_id if model_id == self.lite_model_id else self.lite_model_id
+        other_latency = self.latency(other)
+        impact = f", {other} averages {other_latency:.2f}s" if other_latency else ""
+        if fallback_after is not None:
+            impact += f", after {fallback_after:.2f}s on the discarded answer"
+        logger.info(
+            f"Routed turn answered by {model_id} in {generation_time:.2f}s"
+            f"{impact} ({route.reason})"
+        )
+
+    def stats(self):
+        with self._lock:
+            return {model_id: round(value, 3) for model_id, value in self._latency.items()}
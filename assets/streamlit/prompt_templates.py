@@ -0,0 +1,212 @@
+import json
+import logging
+import os
+import re
+import threading
+
+from conversation import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+PROMPTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "prompts")
+PLACEHOLDER = re.compile(r"\$(\w+)\$")
+# Marks the end of the prefix Bedrock may cache; everything before it must be
+# identical between calls for the cache to be read
+CACHE_POINT = {"cachePoint": {"type": "default"}}
+# Models whose invoke_model request body accepts cache points
+PROMPT_CACHING_MODELS = (
+    "amazon.nova-micro",
+    "amazon.nova-lite",
+    "amazon.nova-pro",
+    "amazon.nova-premier",
+)
+# Bedrock ignores cache points after shorter prefixes (estimated tokens)
+MIN_CACHED_TOKENS = 1024
+
+
+def supports_prompt_caching(model_id):
+    # Inference profile ids carry a region prefix, such as "us.amazon.nova-pro-v1:0"
+    return any(model in model_id for model in PROMPT_CACHING_MODELS)
+
+
+def compile_text(text):
+    """
+    Splits a template into alternating literal text and placeholder names, so
+    rendering is a single join.
+    """
+    return tuple(PLACEHOLDER.split(text))
+
+
+def render(parts, values):
+    return "".join(
+        values.get(part, f"${part}$") if i % 2 else part for i, part in enumerate(parts)
+    )
+
+
+def format_search_results(passages):
+    return "\n".join(f"{i}. {passage['text']}" for i, passage in enumerate(passages, 1))
+
+
+def template_text(value):
+    """Template fields are a string or, for readability, a list of lines."""
+    return "\n".join(value) if isinstance(value, list) else value
+
+
+class PromptPart:
+    """
+    Static instructions, sent as the system prompt ahead of anything that
+    changes between turns, and the user message rendered after them.
+    """
+
+    def __init__(self, system, message, placeholders):
+        for placeholder in placeholders:
+            if placeholder not in message:
+                raise ValueError(f"Prompt message needs {placeholder}: {message[:60]!r}")
+        self.system = system
+        self.system_tokens = estimate_tokens(system)
+        # A cache point after a prefix Bedrock will not cache only adds bytes
+        self.cacheable = self.system_tokens >= MIN_CACHED_TOKENS
+        self._message_parts = compile_text(message)
+        self._system_blocks = [{"text": system}]
+        self._cached_system_blocks = (
+            [{"text": system}, CACHE_POINT] if self.cacheable else self._system_blocks
+        )
+
+    @classmethod
+    def from_dict(cls, data, placeholders):
+        return cls(template_text(data["system"]), template_text(data["message"]), placeholders)
+
+    def system_blocks(self, model_id, cache=True):
+        if cache and supports_prompt_caching(model_id):
+            return self._cached_system_blocks
+        return self._system_blocks
+
+    def render(self, values):
+        return render(self._message_parts, values)
+
+
+class PromptTemplate:
+    """
+    A versioned prompt with instructions for each generation path: answers
+    from retrieved passages, direct answers without a Knowledge Base, and the
+    prompt template retrieve_and_generate fills in itself.
+    """
+
+    def __init__(self, name, version, knowledge_base, direct, retrieve_and_generate):
+        if "$search_results$" not in retrieve_and_generate:
+            raise ValueError(f"Prompt template {name} retrieve_and_generate needs $search_results$")
+        self.name = name
+        self.version = version
+        self.label = f"{name}@{version}"
+        self.knowledge_base = knowledge_base
+        self.direct = direct
+        self.knowledge_base_template = retrieve_and_generate
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(
+            data["name"],
+            data["version"],
+            PromptPart.from_dict(data["knowledge_base"], ("$search_results$", "$query$")),
+            PromptPart.from_dict(data["direct"], ("$query$",)),
+            template_text(data["retrieve_and_generate"]),
+        )
+
+    def parts(self):
+        return {"knowledge_base": self.knowledge_base, "direct": self.direct}
+
+    def system_blocks(self, model_id, grounded=True, cache=True):
+        """
+        Returns the Nova "system" field for answers from retrieved passages
+        (grounded) or direct answers. It ends in a cache point when the model
+        supports prompt caching and the instructions are long enough to cache.
+        """
+        part = self.knowledge_base if grounded else self.direct
+        return part.system_blocks(model_id, cache)
+
+    def user_message(self, query, passages=None):
+        """
+        Renders the user message for the question, with the retrieved passages
+        when given.
+        """
+        if passages is None:
+            return self.direct.render({"query": query})
+        return self.knowledge_base.render(
+            {"search_results": format_search_results(passages), "query": query}
+        )
+
+
+class PromptRegistry:
+    """
+    Loads every template in a directory once per process and tallies the
+    cached and uncached input tokens of the calls made with each.
+    """
+
+    def __init__(self, directory=PROMPTS_DIR, cache_prompts=True):
+        self.directory = directory
+        self.cache_prompts = cache_prompts
+        self.templates = {}
+        for file_name in sorted(os.listdir(directory)):
+            if file_name.endswith(".json"):
+                template = PromptTemplate.from_file(os.path.join(directory, file_name))
+                self.templates[template.name] = template
+                for path, part in template.parts().items():
+                    if cache_prompts and not part.cacheable:
+                        logger.info(
+                            f"Prompt template {template.label} {path} instructions have "
+                            f"~{part.system_tokens} tokens, fewer than the {MIN_CACHED_TOKENS} "
+                            f"Bedrock caches, so they are sent without a cache point"
+                        )
+        self._usage = {}
+        self._lock = threading.Lock()
+        labels = ", ".join(template.label for template in self.templates.values())
+        logger.info(f"Loaded prompt templates: {labels}")
+
+    def get(self, name):
+        try:
+            return self.templates[name]
+        except KeyError:
+            raise ValueError(
+                f"Unknown prompt template {name!r}, expected one of {sorted(self.templates)}"
+            ) from None
+
+    def observe(self, label, input_tokens, cache_read_tokens, cache_write_tokens):
+        """Adds the input token counts of one model call made with a template."""
+        with self._lock:
+            usage = self._usage.setdefault(
+                label,
+                {
+                    "calls": 0,
+                    "input_tokens": 0,
+                    "cache_read_input_tokens": 0,
+                    "cache_write_input_tokens": 0,
+                },
+            )
+            usage["calls"] += 1
+            usage["input_tokens"] += input_tokens or 0
+            usage["cache_read_input_tokens"] += cache_read_tokens or 0
+            usage["cache_write_input_tokens"] += cache_write_tokens or 0
+
+    def stats(self):
+        with self._lock:
+            usage = {label: dict(counts) for label, counts in self._usage.items()}
+        for counts in usage.values():
+            total = (
+                counts["input_tokens"]
+                + counts["cache_read_input_tokens"]
+                + counts["cache_write_input_tokens"]
+            )
+            counts["cached_share"] = counts["cache_read_input_tokens"] / total if total else 0.0
+        return {
+            "cache_prompts": self.cache_prompts,
+            "templates": {
+                template.label: {
+                    path: {"static_tokens": part.system_tokens, "cached": part.cacheable}
+                    for path, part in template.parts().items()
+                }
+                for template in self.templates.values()
+            },
+            "usage": usage,
+        }
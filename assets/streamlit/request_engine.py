@@ -0,0 +1,193 @@
+import logging
+import queue
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+_END = object()
+
+
+class EngineBusyError(Exception):
+    """Raised when the engine's queue is full and a request cannot be admitted."""
+
+
+class RequestEngine:
+    """
+    Bounded worker pool that multiplexes Bedrock calls from every session.
+
+    At most max_workers calls run at once, with per-model limits on top. Calls
+    wait in a queue per model and a worker is only handed a call whose model
+    has a free slot, taking models in turn, so a saturated model does not hold
+    up calls for the others. Up to max_queue further requests wait; beyond
+    that, submit waits up to admission_timeout seconds for room and then
+    raises EngineBusyError so the UI can push back on the user instead of
+    piling up blocked threads.
+    """
+
+    def __init__(
+        self,
+        max_workers=32,
+        max_queue=128,
+        model_limits=None,
+        default_model_limit=16,
+        admission_timeout=5.0,
+    ):
+        self.max_workers = max_workers
+        self.admission_timeout = admission_timeout
+        self.default_model_limit = default_model_limit
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="bedrock"
+        )
+        self._admission = threading.BoundedSemaphore(max_workers + max_queue)
+        self._model_limits = dict(model_limits or {})
+        # Calls waiting for a slot, per model, in the order models are served
+        self._queues = OrderedDict()
+        self._model_running = {}
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.running = 0
+        self.completed = 0
+        self.rejected = 0
+
+    def submit(self, model_id, fn, /, *args, **kwargs):
+        """
+        Schedules fn(*args, **kwargs) and returns a Future with its result.
+        """
+        self._admit()
+        future = Future()
+        future.add_done_callback(self._release)
+        with self._lock:
+            self._model_limits.setdefault(model_id, self.default_model_limit)
+            self._queues.setdefault(model_id, deque()).append((future, fn, args, kwargs))
+        self._dispatch()
+        return future
+
+    def stream(self, model_id, fn, /, *args, buffer_size=256, **kwargs):
+        """
+        Runs the generator function fn on a worker and returns an iterator over
+        the items it yields, so the caller can render them as they arrive.
+        """
+        items = queue.Queue(maxsize=buffer_size)
+        cancelled = threading.Event()
+
+        def put(item):
+            while not cancelled.is_set():
+                try:
+                    items.put(item, timeout=1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def produce():
+            try:
+                for item in fn(*args, **kwargs):
+                    if not put(item):
+                        return
+            except Exception as e:
+                put(e)
+            finally:
+                put(_END)
+
+        self.submit(model_id, produce)
+
+        def consume():
+            try:
+                while True:
+                    item = items.get()
+                    if item is _END:
+                        return
+                    if isinstance(item, Exception):
+                        raise item
+                    yield item
+            finally:
+                cancelled.set()
+
+        return consume()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "pending": self.pending,
+                "running": self.running,
+                "completed": self.completed,
+                "rejected": self.rejected,
+            }
+
+    def shutdown(self):
+        with self._lock:
+            waiting = [call for calls in self._queues.values() for call in calls]
+            self._queues.clear()
+            self.pending -= len(waiting)
+        for future, *_ in waiting:
+            future.cancel()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _admit(self):
+        if not self._admission.acquire(timeout=self.admission_timeout):
+            with self._lock:
+                self.rejected += 1
+            raise EngineBusyError("Too many requests in flight")
+        with self._lock:
+            self.pending += 1
+
+    def _release(self, future):
+        self._admission.release()
+        with self._lock:
+            self.completed += 1
+
+    def _next_call(self):
+        """
+        Takes the first waiting call of the first model with a free slot and
+        moves that model to the back of the line. Called with the lock held.
+        """
+        if self.running >= self.max_workers:
+            return None
+        for model_id, calls in self._queues.items():
+            while calls and calls[0][0].cancelled():
+                calls.popleft()
+                self.pending -= 1
+            if calls and self._model_running.get(model_id, 0) < self._model_limits[model_id]:
+                call = calls.popleft()
+                self._queues.move_to_end(model_id)
+                if not calls:
+                    del self._queues[model_id]
+                self._model_running[model_id] = self._model_running.get(model_id, 0) + 1
+                self.pending -= 1
+                self.running += 1
+                return model_id, call
+        return None
+
+    def _dispatch(self):
+        while True:
+            with self._lock:
+                next_call = self._next_call()
+            if next_call is None:
+                return
+            model_id, (future, fn, args, kwargs) = next_call
+            try:
+                self._executor.submit(self._run, model_id, future, fn, args, kwargs)
+            except RuntimeError:
+                # The engine was shut down
+                self._finish(model_id)
+                future.cancel()
+
+    def _finish(self, model_id):
+        with self._lock:
+            self.running -= 1
+            self._model_running[model_id] -= 1
+
+    def _run(self, model_id, future, fn, args, kwargs):
+        try:
+            if future.set_running_or_notify_cancel():
+                try:
+                    result = fn(*args, **kwargs)
+                except BaseException as e:
+                    future.set_exception(e)
+                else:
+                    future.set_result(result)
+        finally:
+            self._finish(model_id)
+            self._dispatch()
@@ -0,0 +1,444 @@
+import hashlib
+import io
+import json
+import logging
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Error codes that mean "try again later" rather than "this request is wrong"
+THROTTLING_ERROR_CODES = {"ThrottlingException", "TooManyRequestsException"}
+RETRYABLE_ERROR_CODES = THROTTLING_ERROR_CODES | {
+    "ServiceUnavailableException",
+    "ModelNotReadyException",
+    "InternalServerException",
+    "ModelTimeoutException",
+}
+
+
+class ResilienceError(Exception):
+    """Raised when a call is refused before it reaches Bedrock."""
+
+
+class CircuitOpenError(ResilienceError):
+    pass
+
+
+class RateLimitedError(ResilienceError):
+    pass
+
+
+def error_code(error):
+    response = getattr(error, "response", None)
+    if isinstance(response, dict):
+        return response.get("Error", {}).get("Code")
+    return None
+
+
+def is_retryable(error):
+    code = error_code(error)
+    if code is not None:
+        return code in RETRYABLE_ERROR_CODES
+    try:
+        from botocore.exceptions import ConnectionError, HTTPClientError
+    except ImportError:
+        return False
+    return isinstance(error, (ConnectionError, HTTPClientError))
+
+
+class TokenBucket:
+    """
+    Allows rate calls per second on average, with bursts of up to capacity.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout=None):
+        """
+        Takes a token, waiting up to timeout seconds for one; returns False
+        when none became available in time.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.capacity, self._tokens + (now - self._updated_at) * self.rate
+                )
+                self._updated_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate
+            if deadline is not None and now + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+class RetryBudget:
+    """
+    Caps retries at a fraction of first attempts across the whole process.
+
+    Every first attempt deposits ratio tokens and every retry spends one, so a
+    sustained outage causes at most ratio extra calls per call instead of
+    multiplying the load on an already throttled service. The budget starts
+    full so isolated failures can always be retried.
+    """
+
+    def __init__(self, ratio=0.1, capacity=10.0):
+        self.ratio = ratio
+        self.capacity = capacity
+        self._tokens = capacity
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self._tokens = min(self.capacity, self._tokens + self.ratio)
+
+    def withdraw(self):
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+class CircuitBreaker:
+    """
+    Stops calls for reset_timeout seconds after failure_threshold consecutive
+    calls failed even after their retries, then lets a single probe call
+    through to decide whether to close again.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open":
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    return False
+                self.state = "half_open"
+            if self._probing:
+                return False
+            self._probing = True
+            return True
+
+    def retry_after(self):
+        with self._lock:
+            return max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at))
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self._failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probing = False
+            if self.state == "half_open" or self._failures >= self.failure_threshold:
+                if self.state != "open":
+                    logger.warning(f"Circuit opened after {self._failures} failures")
+                self.state = "open"
+                self._opened_at = time.monotonic()
+
+
+class Flight:
+    """One in-flight call that later callers with the same key wait on."""
+
+    def __init__(self):
+        self.value = None
+        self.error = None
+        self._done = threading.Event()
+
+    def wait(self, timeout=None):
+        if not self._done.wait(timeout):
+            raise TimeoutError("Timed out waiting for an identical request")
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+class SingleFlight:
+    """
+    Lets concurrent callers with the same key share one call: the first caller
+    runs it and the rest wait for its result.
+    """
+
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.coalesced = 0
+
+    def join(self, key):
+        """
+        Returns (flight, leader). The leader must call finish with the key; the
+        others wait on the flight.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                self.coalesced += 1
+                return flight, False
+            flight = self._flights[key] = Flight()
+            return flight, True
+
+    def finish(self, key, value=None, error=None):
+        with self._lock:
+            flight = self._flights.pop(key)
+        flight.value = value
+        flight.error = error
+        flight._done.set()
+
+    def do(self, key, fn):
+        flight, leader = self.join(key)
+        if not leader:
+            return flight.wait()
+        try:
+            value = fn()
+        except Exception as e:
+            self.finish(key, error=e)
+            raise
+        self.finish(key, value)
+        return value
+
+
+def request_key(operation, params):
+    return hashlib.sha256(
+        json.dumps([operation, params], sort_keys=True, default=str).encode("utf-8")
+    ).hexdigest()
+
+
+class ResiliencePolicy:
+    """
+    Rate limits, retries and circuit breaking shared by every Bedrock client.
+
+    Calls are grouped by a limit key, usually the model id. Each key gets a
+    token bucket when rate_limits has a requests-per-minute entry for it (or
+    default_rate_limit is set) and its own circuit breaker. Retryable errors
+    are retried up to max_retries times with full-jitter exponential backoff
+    while the process-wide retry budget allows; a call that still fails counts
+    against the key's circuit breaker.
+    """
+
+    def __init__(
+        self,
+        rate_limits=None,
+        default_rate_limit=None,
+        burst_seconds=5.0,
+        rate_limit_wait=10.0,
+        max_retries=3,
+        base_delay=0.25,
+        max_delay=8.0,
+        retry_budget=None,
+        failure_threshold=5,
+        reset_timeout=30.0,
+    ):
+        self.rate_limits = rate_limits or {}
+        self.default_rate_limit = default_rate_limit
+        self.burst_seconds = burst_seconds
+        self.rate_limit_wait = rate_limit_wait
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_budget = retry_budget or RetryBudget()
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.flights = SingleFlight()
+        self._buckets = {}
+        self._breakers = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.retries = 0
+        self.budget_exhausted = 0
+        self.rate_limited = 0
+        self.short_circuited = 0
+
+    def call(self, key, fn, coalesce_key=None):
+        """
+        Runs fn under the key's limits; with coalesce_key, concurrent calls
+        with the same key share one execution.
+        """
+        if coalesce_key is not None:
+            return self.flights.do(coalesce_key, lambda: self._call(key, fn))
+        return self._call(key, fn)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "retries": self.retries,
+                "budget_exhausted": self.budget_exhausted,
+                "rate_limited": self.rate_limited,
+                "short_circuited": self.short_circuited,
+                "coalesced": self.flights.coalesced,
+                "circuits": {
+                    key: breaker.state for key, breaker in self._breakers.items()
+                },
+            }
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def _bucket(self, key):
+        with self._lock:
+            if key not in self._buckets:
+                per_minute = self.rate_limits.get(key, self.default_rate_limit)
+                # A call needs a whole token, so limits under 60 / burst_seconds
+                # per minute still get a bucket that holds one
+                self._buckets[key] = (
+                    TokenBucket(
+                        per_minute / 60,
+                        max(1.0, per_minute / 60 * self.burst_seconds),
+                    )
+                    if per_minute
+                    else None
+                )
+            return self._buckets[key]
+
+    def _breaker(self, key):
+        with self._lock:
+            if key not in self._breakers:
+                self._breakers[key] = CircuitBreaker(
+                    self.failure_threshold, self.reset_timeout
+                )
+            return self._breakers[key]
+
+    def _call(self, key, fn):
+        bucket = self._bucket(key)
+        breaker = self._breaker(key)
+        self._count("calls")
+        self.retry_budget.deposit()
+        if bucket is not None and not bucket.acquire(self.rate_limit_wait):
+            self._count("rate_limited")
+            raise RateLimitedError(
+                f"Too many requests to {key}, please try again in a moment."
+            )
+        if not breaker.allow():
+            self._count("short_circuited")
+            raise CircuitOpenError(
+                f"{key} is unavailable after repeated failures, "
+                f"retrying in {breaker.retry_after():.0f}s."
+            )
+        attempt = 0
+        while True:
+            try:
+                result = fn()
+            except Exception as e:
+                if not is_retryable(e):
+                    # The service answered, so the circuit stays closed
+                    breaker.record_success()
+                    raise
+                if attempt >= self.max_retries:
+                    breaker.record_failure()
+                    raise
+                if not self.retry_budget.withdraw():
+                    self._count("budget_exhausted")
+                    logger.warning(f"Retry budget exhausted, not retrying {key}")
+                    breaker.record_failure()
+                    raise
+                delay = random.uniform(
+                    0, min(self.max_delay, self.base_delay * 2**attempt)
+                )
+                attempt += 1
+                self._count("retries")
+                logger.warning(
+                    f"{error_code(e) or type(e).__name__} from {key}, "
+                    f"retry {attempt} in {delay:.2f}s"
+                )
+                time.sleep(delay)
+                if bucket is not None and not bucket.acquire(self.rate_limit_wait):
+                    self._count("rate_limited")
+                    breaker.record_failure()
+                    raise
+                continue
+            breaker.record_success()
+            return result
+
+
+def _model_from_configuration(configuration):
+    arn = configuration.get("knowledgeBaseConfiguration", {}).get("modelArn", "")
+    return arn.rsplit("/", 1)[-1] or "retrieve_and_generate"
+
+
+def _buffered(response):
+    """Reads the response body so a coalesced result can be handed out again."""
+    return {**response, "body": response["body"].read()}
+
+
+def _unbuffered(response):
+    return {**response, "body": io.BytesIO(response["body"])}
+
+
+class ResilientClient:
+    """
+    Wraps a bedrock-runtime or bedrock-agent-runtime client so its calls go
+    through a ResiliencePolicy. Identical invoke_model and retrieve calls made
+    at the same time share one request; retrieve_and_generate is never
+    coalesced because each call starts its own Bedrock session. Streaming
+    calls are limited and retried only until the stream opens. A scope, such
+    as "us-west-2/", prefixes the policy and coalescing keys so clients for
+    other regions get their own limits and circuits.
+    """
+
+    def __init__(self, client, policy, scope=""):
+        self._client = client
+        self._policy = policy
+        self._scope = scope
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    def invoke_model(self, **kwargs):
+        return _unbuffered(
+            self._policy.call(
+                self._scope + kwargs["modelId"],
+                lambda: _buffered(self._client.invoke_model(**kwargs)),
+                coalesce_key=request_key(self._scope + "invoke_model", kwargs),
+            )
+        )
+
+    def invoke_model_with_response_stream(self, **kwargs):
+        return self._policy.call(
+            self._scope + kwargs["modelId"],
+            lambda: self._client.invoke_model_with_response_stream(**kwargs),
+        )
+
+    def retrieve(self, **kwargs):
+        return self._policy.call(
+            self._scope + "retrieve",
+            lambda: self._client.retrieve(**kwargs),
+            coalesce_key=request_key(self._scope + "retrieve", kwargs),
+        )
+
+    def retrieve_and_generate(self, **kwargs):
+        return self._policy.call(
+            self._scope
+            + _model_from_configuration(kwargs["retrieveAndGenerateConfiguration"]),
+            lambda: self._client.retrieve_and_generate(**kwargs),
+        )
+
+    def retrieve_and_generate_stream(self, **kwargs):
+        return self._policy.call(
+            self._scope
+            + _model_from_configuration(kwargs["retrieveAndGenerateConfiguration"]),
+            lambda: self._client.retrieve_and_generate_stream(**kwargs),
+        )
@@ -0,0 +1,231 @@
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from answer_cache import normalize_prompt
+from conversation import CHARS_PER_TOKEN, estimate_tokens
+
+# Metadata key Bedrock sets on chunks of paginated documents such as PDFs
+PAGE_NUMBER_KEY = "x-amz-bedrock-kb-document-page-number"
+# Shortest shared text that counts as the overlap between two chunks
+MIN_CHUNK_OVERLAP = 30
+MAX_CHUNK_OVERLAP = 400
+# Smallest remainder of the budget worth filling with a truncated passage
+MIN_TRUNCATED_TOKENS = 40
+
+logger = logging.getLogger(__name__)
+
+
+def retrieve_passages(client, knowledge_base_id, query, number_of_results=5):
+    """
+    Runs a vector search against the Knowledge Base and returns the passages as
+    dicts with "text", "location", "score" and "metadata" keys.
+    """
+    response = client.retrieve(
+        knowledgeBaseId=knowledge_base_id,
+        retrievalQuery={"text": query},
+        retrievalConfiguration={
+            "vectorSearchConfiguration": {"numberOfResults": number_of_results}
+        },
+    )
+    return [
+        {
+            "text": result.get("content", {}).get("text", ""),
+            "location": result.get("location", {}),
+            "score": result.get("score"),
+            "metadata": result.get("metadata", {}),
+        }
+        for result in response.get("retrievalResults", [])
+    ]
+
+
+def source_key(passage):
+    location = passage["location"]
+    return (
+        location.get("s3Location", {}).get("uri")
+        or location.get("webLocation", {}).get("url")
+        or str(location)
+    )
+
+
+def shingles(text, size=3):
+    words = re.findall(r"\w+", text.casefold())
+    return {tuple(words[i : i + size]) for i in range(max(1, len(words) - size + 1))}
+
+
+def jaccard(a, b):
+    return len(a & b) / len(a | b) if a or b else 1.0
+
+
+def chunk_overlap(first, second):
+    """
+    Returns how many characters at the end of first repeat at the start of
+    second, as with chunks split with an overlap.
+    """
+    longest = min(len(first), len(second), MAX_CHUNK_OVERLAP)
+    for size in range(longest, MIN_CHUNK_OVERLAP - 1, -1):
+        if first.endswith(second[:size]):
+            return size
+    return 0
+
+
+def merge_chunks(first, second):
+    """
+    Merges two chunks of the same document into one passage when they overlap
+    or sit on the same or consecutive pages; returns None otherwise.
+    """
+    overlap = chunk_overlap(first["text"], second["text"])
+    if not overlap:
+        reverse_overlap = chunk_overlap(second["text"], first["text"])
+        if reverse_overlap:
+            first, second, overlap = second, first, reverse_overlap
+    if overlap:
+        text = first["text"] + second["text"][overlap:]
+    else:
+        first_page = first["metadata"].get(PAGE_NUMBER_KEY)
+        second_page = second["metadata"].get(PAGE_NUMBER_KEY)
+        if first_page is None or second_page is None or abs(first_page - second_page) > 1:
+            return None
+        if second_page < first_page:
+            first, second = second, first
+        text = f"{first['text']}\n{second['text']}"
+    scores = [p["score"] for p in (first, second) if p["score"] is not None]
+    return {
+        **first,
+        "text": text,
+        "score": max(scores) if scores else None,
+    }
+
+
+def compress_passages(passages, budget_tokens=None, similarity_threshold=0.8):
+    """
+    Shapes retrieved passages before they are put in the prompt: drops
+    near-duplicates (word shingle Jaccard similarity at or above
+    similarity_threshold), merges adjacent or overlapping chunks of the same
+    document, ranks the rest by score and packs them into budget_tokens,
+    truncating the last passage that only partly fits. Returns the passages
+    and a report of the estimated tokens before and after.
+    """
+    ranked = sorted(
+        passages,
+        key=lambda p: p["score"] if p["score"] is not None else 0.0,
+        reverse=True,
+    )
+    kept = []
+    duplicates = 0
+    for passage in ranked:
+        fingerprint = shingles(passage["text"])
+        if any(jaccard(fingerprint, other) >= similarity_threshold for _, other in kept):
+            duplicates += 1
+            continue
+        kept.append((passage, fingerprint))
+
+    merged = []
+    merges = 0
+    for passage, _ in kept:
+        for i, other in enumerate(merged):
+            if source_key(other) != source_key(passage):
+                continue
+            combined = merge_chunks(other, passage)
+            if combined is not None:
+                merged[i] = combined
+                merges += 1
+                break
+        else:
+            merged.append(passage)
+
+    packed = []
+    used = 0
+    for passage in merged:
+        tokens = estimate_tokens(passage["text"])
+        if budget_tokens is None or used + tokens <= budget_tokens:
+            packed.append(passage)
+            used += tokens
+            continue
+        remaining = budget_tokens - used
+        if remaining >= MIN_TRUNCATED_TOKENS:
+            text = truncate_to_tokens(passage["text"], remaining)
+            packed.append({**passage, "text": text})
+            used += estimate_tokens(text)
+        break
+
+    tokens_before = sum(estimate_tokens(p["text"]) for p in passages)
+    report = {
+        "passages_before": len(passages),
+        "passages_after": len(packed),
+        "duplicates": duplicates,
+        "merges": merges,
+        "tokens_before": tokens_before,
+        "tokens_after": used,
+        "tokens_saved": tokens_before - used,
+    }
+    return packed, report
+
+
+def truncate_to_tokens(text, budget_tokens):
+    """
+    Cuts text to roughly budget_tokens, at the last sentence end when there is
+    one in the second half.
+    """
+    limit = budget_tokens * CHARS_PER_TOKEN
+    if len(text) <= limit:
+        return text
+    cut = text[:limit]
+    sentence_end = max(cut.rfind(". "), cut.rfind(".\n"))
+    return cut[: sentence_end + 1] if sentence_end > limit // 2 else cut
+
+
+def passage_citations(passages):
+    """
+    Wraps passages in the citation shape returned by retrieve_and_generate so
+    they can be formatted with the same helpers.
+    """
+    return [
+        {"retrievedReferences": [{"location": passage["location"]}]}
+        for passage in passages
+    ]
+
+
+class RetrievalCache:
+    """
+    Thread-safe LRU cache of retrieved passages with its own TTL, so reruns of
+    the same question skip the vector search.
+    """
+
+    def __init__(self, max_entries=1024, ttl_seconds=900):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(knowledge_base_id, query, number_of_results):
+        return (knowledge_base_id, normalize_prompt(query), number_of_results)
+
+    def get(self, knowledge_base_id, query, number_of_results):
+        key = self.make_key(knowledge_base_id, query, number_of_results)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and time.monotonic() - entry[0] <= self.ttl_seconds:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self._entries.pop(key, None)
+            self.misses += 1
+            return None
+
+    def put(self, knowledge_base_id, query, number_of_results, passages):
+        key = self.make_key(knowledge_base_id, query, number_of_results)
+        with self._lock:
+            self._entries[key] = (time.monotonic(), passages)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,331 @@
+import atexit
+import json
+import logging
+import random
+import sqlite3
+import threading
+import time
+import zlib
+
+logger = logging.getLogger(__name__)
+
+# Values at least this large are zlib-compressed before they are stored
+COMPRESS_MIN_BYTES = 512
+# DynamoDB limits on keys per BatchGetItem and items per BatchWriteItem
+DYNAMODB_GET_BATCH = 100
+DYNAMODB_WRITE_BATCH = 25
+# Unprocessed keys and items are retried with full-jitter exponential backoff,
+# as DynamoDB asks, before the batch is given up as an error
+DYNAMODB_MAX_ATTEMPTS = 8
+DYNAMODB_BASE_DELAY = 0.05
+DYNAMODB_MAX_DELAY = 2.0
+
+
+def encode(value):
+    """
+    Serializes a JSON-compatible value to compact bytes, compressing it when
+    that pays off. The first byte records the format.
+    """
+    data = json.dumps(value, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    if len(data) >= COMPRESS_MIN_BYTES:
+        return b"z" + zlib.compress(data, 6)
+    return b"j" + data
+
+
+def decode(data):
+    data = bytes(data)
+    if data[:1] == b"z":
+        return json.loads(zlib.decompress(data[1:]))
+    return json.loads(data[1:])
+
+
+class MemoryBackend:
+    """Process-local backend, for a single task or local development."""
+
+    def __init__(self):
+        self._items = {}
+        self._lock = threading.Lock()
+
+    def get_many(self, keys):
+        now = time.time()
+        with self._lock:
+            found = {}
+            for key in keys:
+                item = self._items.get(key)
+                if item and (item[1] is None or item[1] > now):
+                    found[key] = item[0]
+            return found
+
+    def put_many(self, items):
+        with self._lock:
+            self._items.update(items)
+
+    def delete(self, key):
+        with self._lock:
+            self._items.pop(key, None)
+
+
+class SQLiteBackend:
+    """Backend in a local SQLite file, shared by processes on the same host."""
+
+    def __init__(self, path):
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._db:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS state "
+                "(key TEXT PRIMARY KEY, value BLOB, expires_at REAL)"
+            )
+
+    def get_many(self, keys):
+        keys = list(keys)
+        if not keys:
+            return {}
+        placeholders = ",".join("?" * len(keys))
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT key, value FROM state WHERE key IN ({placeholders}) "
+                "AND (expires_at IS NULL OR expires_at > ?)",
+                (*keys, time.time()),
+            ).fetchall()
+        return dict(rows)
+
+    def put_many(self, items):
+        with self._lock, self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO state VALUES (?, ?, ?)",
+                [(key, value, expires_at) for key, (value, expires_at) in items.items()],
+            )
+
+    def delete(self, key):
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM state WHERE key = ?", (key,))
+
+
+class RedisBackend:
+    """Backend in Redis or a Redis-compatible service such as ElastiCache."""
+
+    def __init__(self, url):
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError(
+                "STATE_BACKEND=redis needs the redis package (pip install redis)"
+            ) from e
+        self._redis = redis.Redis.from_url(url)
+
+    def get_many(self, keys):
+        keys = list(keys)
+        if not keys:
+            return {}
+        return {
+            key: value
+            for key, value in zip(keys, self._redis.mget(keys))
+            if value is not None
+        }
+
+    def put_many(self, items):
+        pipeline = self._redis.pipeline(transaction=False)
+        for key, (value, expires_at) in items.items():
+            if expires_at is None:
+                pipeline.set(key, value)
+            else:
+                pipeline.set(key, value, exat=int(expires_at))
+        pipeline.execute()
+
+    def delete(self, key):
+        self._redis.delete(key)
+
+
+class DynamoDBBackend:
+    """
+    Backend in a DynamoDB table with a string partition key "pk", a binary
+    "value" and a numeric "expires_at" TTL attribute, as the stack creates it.
+    """
+
+    def __init__(self, table_name, client):
+        self.table_name = table_name
+        self._client = client
+
+    def _backoff(self, attempt, operation, unprocessed):
+        """
+        Sleeps before retrying what DynamoDB left unprocessed, usually because
+        the table is being throttled; raises after the last attempt.
+        """
+        count = sum(
+            len(request["Keys"]) if isinstance(request, dict) else len(request)
+            for request in unprocessed.values()
+        )
+        if attempt >= DYNAMODB_MAX_ATTEMPTS:
+            raise RuntimeError(
+                f"{operation} left {count} unprocessed after {attempt} attempts"
+            )
+        time.sleep(random.uniform(0, min(DYNAMODB_MAX_DELAY, DYNAMODB_BASE_DELAY * 2**attempt)))
+
+    def get_many(self, keys):
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        for start in range(0, len(keys), DYNAMODB_GET_BATCH):
+            request = {
+                self.table_name: {
+                    "Keys": [{"pk": {"S": key}} for key in keys[start : start + DYNAMODB_GET_BATCH]],
+                    "ProjectionExpression": "pk, #v, expires_at",
+                    "ExpressionAttributeNames": {"#v": "value"},
+                }
+            }
+            attempt = 0
+            while True:
+                response = self._client.batch_get_item(RequestItems=request)
+                now = time.time()
+                for item in response["Responses"].get(self.table_name, []):
+                    # Expired items linger until DynamoDB's TTL sweep deletes them
+                    if "expires_at" in item and float(item["expires_at"]["N"]) <= now:
+                        continue
+                    found[item["pk"]["S"]] = item["value"]["B"]
+                request = response.get("UnprocessedKeys")
+                if not request:
+                    break
+                attempt += 1
+                self._backoff(attempt, "BatchGetItem", request)
+        return found
+
+    def put_many(self, items):
+        requests = []
+        for key, (value, expires_at) in items.items():
+            item = {"pk": {"S": key}, "value": {"B": value}}
+            if expires_at is not None:
+                item["expires_at"] = {"N": str(int(expires_at))}
+            requests.append({"PutRequest": {"Item": item}})
+        for start in range(0, len(requests), DYNAMODB_WRITE_BATCH):
+            batch = {self.table_name: requests[start : start + DYNAMODB_WRITE_BATCH]}
+            attempt = 0
+            while True:
+                response = self._client.batch_write_item(RequestItems=batch)
+                batch = response.get("UnprocessedItems")
+                if not batch:
+                    break
+                attempt += 1
+                self._backoff(attempt, "BatchWriteItem", batch)
+
+    def delete(self, key):
+        self._client.delete_item(TableName=self.table_name, Key={"pk": {"S": key}})
+
+
+class StateStore:
+    """
+    Session history and shared caches kept outside the process, so any task
+    can serve any user and new tasks start with warm caches.
+
+    Values are serialized with encode() and writes are buffered: repeated
+    writes to a key within flush_interval seconds collapse into one, and a
+    background thread sends them to the backend in batches. Reads see
+    buffered writes first and then go to the backend; callers keep their own
+    in-memory copy of what they read. Backend errors are logged, never raised,
+    so the app keeps working on its local state.
+    """
+
+    def __init__(self, backend, flush_interval=0.25, max_pending=500):
+        self.backend = backend
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self.reads = 0
+        self.read_hits = 0
+        self.writes = 0
+        self.flushes = 0
+        self.errors = 0
+
+    def get(self, key):
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys):
+        """Returns the stored values of the keys that exist."""
+        keys = list(keys)
+        found = {}
+        with self._lock:
+            self.reads += len(keys)
+            for key in keys:
+                if key in self._pending:
+                    found[key] = self._pending[key][0]
+        missing = [key for key in keys if key not in found]
+        if missing:
+            try:
+                for key, data in self.backend.get_many(missing).items():
+                    found[key] = decode(data)
+            except Exception as e:
+                self._count_error()
+                logger.warning(f"Could not read {len(missing)} keys from the state store: {e}")
+        with self._lock:
+            self.read_hits += len(found)
+        return found
+
+    def put(self, key, value, ttl_seconds=None):
+        """Queues a write; it reaches the backend within flush_interval seconds."""
+        expires_at = time.time() + ttl_seconds if ttl_seconds else None
+        with self._lock:
+            self._pending[key] = (value, expires_at)
+            self.writes += 1
+            full = len(self._pending) >= self.max_pending
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="state-store-flush", daemon=True
+                )
+                self._thread.start()
+                atexit.register(self.flush)
+        if full:
+            self._wake.set()
+
+    def delete(self, key):
+        with self._lock:
+            self._pending.pop(key, None)
+        try:
+            self.backend.delete(key)
+        except Exception as e:
+            self._count_error()
+            logger.warning(f"Could not delete {key} from the state store: {e}")
+
+    def flush(self):
+        """Writes every buffered value to the backend."""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return
+            items = {
+                key: (encode(value), expires_at)
+                for key, (value, expires_at) in pending.items()
+            }
+            try:
+                self.backend.put_many(items)
+            except Exception as e:
+                self._count_error()
+                logger.warning(f"Could not write {len(items)} keys to the state store: {e}")
+                return
+            with self._lock:
+                self.flushes += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "backend": type(self.backend).__name__,
+                "reads": self.reads,
+                "read_hits": self.read_hits,
+                "writes": self.writes,
+                "flushes": self.flushes,
+                "pending": len(self._pending),
+                "errors": self.errors,
+            }
+
+    def _count_error(self):
+        with self._lock:
+            self.errors += 1
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
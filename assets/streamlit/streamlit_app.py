@@ -1,16 +1,33 @@
-import json
 import logging
 import os
+import threading
+import time
+import uuid
+from collections import deque
 
-import boto3
 import streamlit as st
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    handlers=[logging.StreamHandler(), logging.FileHandler("app.log")],
+import api_client
+from app_logging import configure_logging
+from bedrock_clients import warm_clients
+from bedrock_streaming import citation_locations, format_citations
+from chat_service import (
+    DEFAULT_MODEL_ID,
+    KB_PIPELINE,
+    KNOWLEDGE_BASE_ID,
+    answer_events,
+    get_answer_cache,
+    get_faq_matcher,
+    get_metrics_recorder,
+    get_state_store,
 )
+from conversation import answer_text, split_footer
+from history_store import HistoryStore, sign_owner, verify_owner
+from metrics import TurnMetrics, summarize
+from model_router import AUTO_MODEL
+
+# Configure logging
+configure_logging()
 logger = logging.getLogger(__name__)
 
 # Main layout
@@ -70,145 +87,201 @@ st.markdown(
     unsafe_allow_html=True,
 )
 
-# Initialize session state variables
-if "history" not in st.session_state:
-    st.session_state["history"] = []
 
-if "current_conversation" not in st.session_state:
-    st.session_state["current_conversation"] = []
+@st.cache_resource
+def warm_bedrock_clients():
+    """
+    Warms the shared Bedrock clients once per process, in the background so the
+    first page renders without waiting for boto3 and the TLS handshake. Returns
+    the warm-up thread.
+    """
 
-bedrock_runtime = boto3.client(
-    service_name="bedrock-runtime",
-    region_name="us-east-1",  # Replace with your AWS region
-)
+    def warm():
+        started_at = time.perf_counter()
+        warm_clients(KNOWLEDGE_BASE_ID)
+        logger.info(f"Client warm-up took {time.perf_counter() - started_at:.2f}s")
 
-# Initialize Bedrock Agent client
-bedrock_agent = boto3.client(
-    service_name="bedrock-agent-runtime",
-    region_name="us-east-1",
-)
+    thread = threading.Thread(target=warm, name="warm-clients", daemon=True)
+    thread.start()
+    return thread
 
-KNOWLEDGE_BASE_ID = os.environ.get("KNOWLEDGE_BASE_ID")
 
+@st.cache_data(ttl=10, show_spinner=False)
+def answer_cache_stats():
+    """
+    Returns the answer cache and FAQ index counters, from the inference API in
+    thin-client mode.
+    """
+    if api_client.INFERENCE_API_URL:
+        stats = api_client.fetch_stats()
+        return (stats["answer_cache"], stats.get("faq")) if stats else (None, None)
+    faq_matcher = get_faq_matcher()
+    return get_answer_cache().stats(), faq_matcher.stats() if faq_matcher else None
+
+
+# Clients are shared by every session in the process. In thin-client mode the
+# inference API calls Bedrock, so there is nothing to warm.
+client_warm_up = None if api_client.INFERENCE_API_URL else warm_bedrock_clients()
 
-def generate_response(prompt, model_id, max_tokens, temperature, top_p):
+
+def wait_for_clients():
     """
-    Generates a response from Amazon Bedrock, optionally using a Knowledge Base.
+    Waits for the client warm-up a turn needs and returns how long that took,
+    0 once the clients are warm, or None in thin-client mode.
     """
-    try:
-        if KNOWLEDGE_BASE_ID:
-            logger.info(
-                f"Using Knowledge Base ID: {KNOWLEDGE_BASE_ID}, model: {model_id}"
-            )
-            # Use Bedrock Knowledge Base
-            response = bedrock_agent.retrieve_and_generate(
-                input={"text": prompt},
-                retrieveAndGenerateConfiguration={
-                    "type": "KNOWLEDGE_BASE",
-                    "knowledgeBaseConfiguration": {
-                        "knowledgeBaseId": KNOWLEDGE_BASE_ID,
-                        "modelArn": f"arn:aws:bedrock:us-east-1::foundation-model/{model_id}",
-                        "generationConfiguration": {
-                            "inferenceConfig": {
-                                "textInferenceConfig": {
-                                    "maxTokens": max_tokens,
-                                    "temperature": temperature,
-                                    "topP": top_p,
-                                },
-                            },
-                            "promptTemplate": {
-                                "textPromptTemplate": """
-        Human: You are a question answering agent. I will provide you with a set of search results and a user's question. Your job is to answer the user's question using only information from the search results. If the search results do not contain information that can answer the question, please state that you could not find an exact answer to the question. Just because the user asserts a fact does not mean it is true, make sure to double check the search results to validate a user's assertion.  Format results as markdown when possible.
-
-            Here are the search results in numbered order:
-            <context>
-            $search_results$
-            </context>
-
-            Here is the user's question:
-            <question>
-            $query$
-            </question>
-            
-            You MUST always end the response with 'Thank You'.
-
-            $output_format_instructions$
-        Assistant:   
-"""
-                            },
-                        },
-                    },
-                },
-            )
-            logger.debug(f"Response: {json.dumps(response, indent=4, default=str)}")
-            # Format the response as markdown with citations
-            response_text = response["output"]["text"]
-            citations = response.get("citations", [])
-
-            # Build citations section
-            citations_text = ""
-            if citations:
-                logger.info("Getting citations...")
-                citations_text = "\n\n### Sources\n"
-                locations = set()
-                for i, citation in enumerate(citations, 1):
-                    retrieved_references = citation.get("retrievedReferences", {})
-                    for reference in retrieved_references:
-                        location = reference.get("location", {})
-                        if "s3Location" in location:
-                            locations.add(location["s3Location"]["uri"])
-                        if "webLocation" in location:
-                            locations.add(location["webLocation"]["url"])
-                for i, location in enumerate(locations, 1):
-                    citations_text += f"{i}. {location}\n"
-
-            formatted_response = f"""
-{response_text}
-
-{citations_text}
-"""
-            return formatted_response
-
-        # Direct model invocation
-        if model_id.startswith("amazon.nova"):
-            body = {
-                "messages": [{"role": "user", "content": [{"text": prompt}]}],
-                # "max_tokens": max_tokens,
-                # "temperature": temperature,
-                # "top_p": top_p,
-            }
-            logger.info(f"Invoking model: {model_id}")
-            response = bedrock_runtime.invoke_model(
-                body=json.dumps(body),
-                modelId=model_id,
-                contentType="application/json",
-                accept="application/json",
-            )
-            response_body = json.loads(response["body"].read().decode("utf-8"))
-            response_text = response_body["output"]["message"]["content"][0]["text"]
-
-            # Get token usage from response
-            usage = response_body.get("usage", {})
-            output_tokens = usage.get("outputTokens")
-            input_tokens = usage.get("inputTokens")
-            # st.session_state["token_counts"]["output"] += output_tokens
-            # st.session_state["token_counts"]["input"] += input_tokens
-
-            formatted_response = f"""
-{response_text}
-
-*Tokens: Input: {input_tokens}, Output: {output_tokens}*
-"""
-            return formatted_response
+    if client_warm_up is None:
+        return None
+    started_at = time.perf_counter()
+    client_warm_up.join()
+    return time.perf_counter() - started_at
+
+
+def render_response_stream(events, metrics):
+    """
+    Renders answer events into the current chat message as they arrive and
+    returns the final formatted response from the "done" event.
+    """
+    text_placeholder = st.empty()
+    citations_placeholder = st.empty()
+    response_text = ""
+    locations = []
+    response = ""
+    render_time = 0.0
+    for kind, data in events:
+        render_started_at = time.perf_counter()
+        if kind == "text":
+            metrics.mark_first_byte()
+            response_text += data
+            text_placeholder.markdown(response_text + "▌")
+        elif kind == "citation":
+            for location in citation_locations([data]):
+                if location not in locations:
+                    locations.append(location)
+            citations_placeholder.markdown(format_citations(locations))
+        elif kind == "reset":
+            # The router is retrying with a larger model
+            response_text = ""
+            locations = []
+            text_placeholder.markdown("▌")
+            citations_placeholder.empty()
+        elif kind == "done":
+            response = data
+            citations_placeholder.empty()
+            text_placeholder.markdown(response)
+        render_time += time.perf_counter() - render_started_at
+    metrics.render_time = render_time
+    return response
+
+
+def show_earlier_messages(conversation_id):
+    pages = st.session_state["transcript_pages"]
+    pages[conversation_id] = pages.get(conversation_id, 1) + 1
+
+
+def render_message(message, sources_expanded):
+    """
+    Renders a stored message; unless sources_expanded, an answer's sources are
+    collapsed under an expander.
+    """
+    with st.chat_message(message.role):
+        text, footer = split_footer(message.rendered)
+        if not footer or sources_expanded:
+            st.markdown(message.rendered)
+        elif footer.startswith("### Sources"):
+            st.markdown(text)
+            with st.expander("📚 Sources", expanded=False):
+                st.markdown(footer)
         else:
-            return "Model not supported yet."
-    except Exception as e:
-        logger.error(f"Error generating response: {str(e)}")
-        return f"Error: {e}"
+            st.markdown(text)
+            st.caption(footer.strip("*"))
+
+
+@st.fragment
+def render_transcript(conversation):
+    """
+    Renders the latest TRANSCRIPT_PAGE_TURNS turns of the conversation, so a
+    rerun costs the same however long the chat is. Earlier turns are revealed
+    a page at a time, which reruns only this fragment.
+    """
+    messages = conversation.messages
+    pages = st.session_state["transcript_pages"].get(conversation.id, 1)
+    hidden = (
+        max(0, len(messages) - TRANSCRIPT_PAGE_TURNS * 2 * pages)
+        if TRANSCRIPT_PAGE_TURNS
+        else 0
+    )
+    if hidden:
+        st.button(
+            f"⬆️ Show earlier messages ({hidden} hidden)",
+            key=f"show_earlier_{conversation.id}",
+            on_click=show_earlier_messages,
+            args=(conversation.id,),
+        )
+    answers = [i for i, message in enumerate(messages) if message.role == "assistant"]
+    expanded_from = len(messages)
+    if TRANSCRIPT_OPEN_SOURCES and answers:
+        expanded_from = answers[-min(TRANSCRIPT_OPEN_SOURCES, len(answers))]
+    for i in range(hidden, len(messages)):
+        render_message(messages[i], sources_expanded=i >= expanded_from)
 
 
 logger.info("Starting Streamlit app")
 
+metrics_recorder = get_metrics_recorder()
+# Turns are answered in-process or, in thin-client mode, by the inference API
+turn_events = api_client.answer_events if api_client.INFERENCE_API_URL else answer_events
+
+# Turns shown before the "Show earlier messages" button; 0 shows them all
+TRANSCRIPT_PAGE_TURNS = int(os.environ.get("TRANSCRIPT_PAGE_TURNS", "20"))
+# Latest answers whose sources are shown expanded
+TRANSCRIPT_OPEN_SOURCES = int(os.environ.get("TRANSCRIPT_OPEN_SOURCES", "1"))
+
+if "transcript_pages" not in st.session_state:
+    st.session_state["transcript_pages"] = {}
+
+if "turn_metrics" not in st.session_state:
+    st.session_state["turn_metrics"] = deque(maxlen=200)
+
+# With a state store and a session key, the signed session id and the chat id
+# in the URL let any task pick up the conversation after a load balancer move
+# or a scale-in. Without a key the owner id stays in this session's state.
+state_store = get_state_store()
+STATE_SESSION_KEY = os.environ.get("STATE_SESSION_KEY")
+HISTORY_MAX_AGE_SECONDS = int(os.environ.get("HISTORY_MAX_AGE_SECONDS", "86400"))
+
+# Initialize session state variables
+if "history_store" not in st.session_state:
+    owner = None
+    if state_store:
+        if STATE_SESSION_KEY:
+            owner = verify_owner(st.query_params.get("session"), STATE_SESSION_KEY)
+        owner = owner or uuid.uuid4().hex
+        if STATE_SESSION_KEY:
+            st.query_params["session"] = sign_owner(
+                owner, STATE_SESSION_KEY, HISTORY_MAX_AGE_SECONDS
+            )
+            st.session_state.setdefault("conversation_id", st.query_params.get("chat"))
+    st.session_state["history_store"] = HistoryStore(
+        max_conversations=int(os.environ.get("HISTORY_MAX_CONVERSATIONS", "20")),
+        max_messages=int(os.environ.get("HISTORY_MAX_MESSAGES", "200")),
+        max_age_seconds=HISTORY_MAX_AGE_SECONDS,
+        spill_path=os.environ.get("HISTORY_SPILL_PATH"),
+        store=state_store,
+        owner=owner,
+    )
+history_store = st.session_state["history_store"]
+
+current_conversation = history_store.get(st.session_state.get("conversation_id"))
+if current_conversation is None:
+    current_conversation = history_store.create()
+    st.session_state["conversation_id"] = current_conversation.id
+if (
+    state_store
+    and STATE_SESSION_KEY
+    and st.query_params.get("chat") != current_conversation.id
+):
+    st.query_params["chat"] = current_conversation.id
+
 
 # Sidebar configuration
 with st.sidebar:
@@ -217,48 +290,45 @@ with st.sidebar:
 
     # New chat button
     if st.button("🆕 Start New Chat", use_container_width=True):
-        st.session_state["current_conversation"] = []
+        if current_conversation.messages:
+            st.session_state["conversation_id"] = history_store.create().id
         st.rerun()
 
     # Conversation history
-    # st.markdown("### 📚 Conversation History")
-    # logger.info(
-    #     f"History: {json.dumps(st.session_state['history'], indent=4, default=str)}"
-    # )
-    # logger.info(f"Conversation length: {len(st.session_state['history'])}")
-    # for i, conversation in enumerate(st.session_state["history"], start=0):
-    #     # Get the first message from the conversation
-    #     logger.info(f"Processing conversation: {i}")
-    #     # logger.info(f"Conversation: {json.dumps(conversation, indent=4, default=str)}")
-    #     current_message = conversation[i]["message"] if conversation else ""
-    #     is_user = conversation[i].get("is_user", False) if conversation else False
-
-    #     if is_user:
-    #         button_label = (
-    #             f"💬 {current_message[:30]}..."
-    #             if len(current_message) > 30
-    #             else f"💬 {current_message}"
-    #         )
-
-    #         if st.button(
-    #             button_label, use_container_width=True, key=f"conversation_{i}"
-    #         ):
-    #             st.session_state["current_conversation"] = conversation
-    #             st.rerun()
+    recent_conversations = history_store.recent()
+    if recent_conversations:
+        st.markdown("### 📚 Conversation History")
+    for conversation in recent_conversations:
+        button_label = (
+            f"💬 {conversation.title[:30]}..."
+            if len(conversation.title) > 30
+            else f"💬 {conversation.title}"
+        )
+        if st.button(
+            button_label,
+            use_container_width=True,
+            key=f"conversation_{conversation.id}",
+            disabled=conversation.id == current_conversation.id,
+        ):
+            st.session_state["conversation_id"] = conversation.id
+            st.rerun()
 
     # Advanced settings expander
     with st.expander("⚙️ Advanced Settings", expanded=False):
         st.markdown("### 🛠️ Configuration")
 
         # Model selection
+        model_options = [AUTO_MODEL, "amazon.nova-pro-v1:0", "amazon.nova-lite-v1:0"]
         model_id = st.selectbox(
             "🤖 Choose a Bedrock Model",
-            [
-                "amazon.nova-pro-v1:0",
-                "amazon.nova-lite-v1:0",
-            ],
-            index=0,
-            help="Select the model to use. Nova Pro is the recommended default for most use cases. ",
+            model_options,
+            index=model_options.index(DEFAULT_MODEL_ID)
+            if DEFAULT_MODEL_ID in model_options
+            else 0,
+            format_func=lambda option: "Auto (Nova Lite or Pro per question)"
+            if option == AUTO_MODEL
+            else option,
+            help="Select the model to use. Auto answers simple questions with Nova Lite and harder ones with Nova Pro.",
         )
 
         # Knowledge Base selection
@@ -298,6 +368,54 @@ with st.sidebar:
             step=0.1,
             help="Controls how focused the responses are. Lower values make answers more precise and on-topic. Higher values allow for more diverse responses.",
         )
+        stream_responses = st.toggle(
+            "⚡ Stream responses",
+            value=True,
+            help="Show the answer as it is generated instead of waiting for the full response.",
+        )
+
+        st.markdown("### 📈 Answer Cache")
+        cache_stats, faq_stats = answer_cache_stats()
+        if faq_stats:
+            st.caption(
+                f"FAQ answers: {faq_stats['hits']} of {faq_stats['lookups']} questions "
+                f"({faq_stats['hit_rate']:.0%}) from {faq_stats['entries']} FAQs"
+            )
+        if cache_stats:
+            st.caption(
+                f"Hits: {cache_stats['hits']} ({cache_stats['similar_hits']} similar) · "
+                f"Misses: {cache_stats['misses']} · "
+                f"Hit rate: {cache_stats['hit_rate']:.0%} · "
+                f"Bedrock time saved: {cache_stats['saved_seconds']}s"
+            )
+        else:
+            st.caption("Answer cache statistics are unavailable.")
+
+    # Latency panel
+    with st.expander("📊 Latency", expanded=False):
+
+        def format_seconds(value):
+            return f"{value:.2f}s" if value is not None else "–"
+
+        for label, turns in (
+            ("This session", list(st.session_state["turn_metrics"])),
+            ("All sessions", metrics_recorder.turns()),
+        ):
+            st.markdown(f"**{label}** ({len(turns)} turns)")
+            st.table(
+                {
+                    metric: {
+                        percentile: format_seconds(value)
+                        for percentile, value in summarize(turns, metric).items()
+                    }
+                    for metric in (
+                        "time_to_first_byte",
+                        "total_latency",
+                        "retrieval_time",
+                        "generation_time",
+                    )
+                }
+            )
 
 # Main chat interface
 # colored_header(
@@ -310,9 +428,7 @@ st.header("Chat with Campus Services Assistant", divider="rainbow")
 st.caption("Ask me anything about campus services!")
 
 # Display current conversation
-for message in st.session_state["current_conversation"]:
-    with st.chat_message("user" if message["is_user"] else "assistant"):
-        st.markdown(message["message"])
+render_transcript(current_conversation)
 
 # Chat input at the bottom
 st.markdown('<div class="chat-input">', unsafe_allow_html=True)
@@ -321,10 +437,14 @@ st.markdown("</div>", unsafe_allow_html=True)
 
 # Process new messages
 if prompt:
+    # Context from earlier turns, captured before this prompt is added
+    conversation = {
+        "history": current_conversation.context_turns(),
+        "bedrock_session_id": current_conversation.bedrock_session_id,
+    }
+
     # Add user message to current conversation
-    st.session_state["current_conversation"].append(
-        {"message": prompt, "is_user": True}
-    )
+    history_store.add_message(current_conversation.id, "user", prompt)
 
     # Display user message
     with st.chat_message("user"):
@@ -332,32 +452,31 @@ if prompt:
 
     # Generate and display assistant response
     with st.chat_message("assistant"):
-        with st.spinner("🤔 Thinking..."):
-            response = generate_response(
-                prompt=prompt,
-                model_id=model_id,
-                max_tokens=max_tokens,
-                temperature=temperature,
-                top_p=top_p,
-            )
-            st.markdown(response)
-            st.session_state["current_conversation"].append(
-                {"message": response, "is_user": False}
-            )
-
-    # Save conversation to history if it's not empty
-    if len(st.session_state["current_conversation"]) > 0:
-        # Check if this conversation is already in history
-        logger.info(
-            f"Current conversation: {st.session_state['current_conversation'][0]}"
+        turn_metrics = TurnMetrics(
+            model_id=model_id,
+            pipeline=KB_PIPELINE if KNOWLEDGE_BASE_ID else "direct",
+            client_setup_time=wait_for_clients(),
+        )
+        events = turn_events(
+            prompt=prompt,
+            model_id=model_id,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            top_p=top_p,
+            metrics=turn_metrics,
+            conversation=conversation,
+            stream=stream_responses,
+        )
+        if stream_responses:
+            response = render_response_stream(events, turn_metrics)
+        else:
+            with st.spinner("🤔 Thinking..."):
+                response = render_response_stream(events, turn_metrics)
+        current_conversation.bedrock_session_id = conversation["bedrock_session_id"]
+        history_store.add_message(
+            current_conversation.id, "assistant", answer_text(response), response
+        )
+        turn_metrics.finish()
+        st.session_state["turn_metrics"].append(
+            metrics_recorder.record(turn_metrics)
         )
-        if (
-            st.session_state["current_conversation"][0]
-            not in st.session_state["history"]
-        ):
-            logger.info(
-                f"Appending current conversation to history: {st.session_state['current_conversation']}"
-            )
-            st.session_state["history"].append(
-                st.session_state["current_conversation"].copy()
-            )
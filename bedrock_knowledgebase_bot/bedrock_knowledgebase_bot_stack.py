@@ -1,6 +1,9 @@
 import datetime
+import json
 
-from aws_cdk import Duration, Stack
+from aws_cdk import Duration, RemovalPolicy, Stack, TimeZone
+from aws_cdk import aws_applicationautoscaling as appscaling
+from aws_cdk import aws_dynamodb as dynamodb
 from aws_cdk import aws_ec2 as ec2
 from aws_cdk import aws_ecr as ecr
 from aws_cdk import aws_ecs as ecs
@@ -9,6 +12,13 @@ from aws_cdk import aws_events as events
 from aws_cdk import aws_events_targets as targets
 from aws_cdk import aws_iam as iam
 from aws_cdk import aws_lambda as _lambda
+from aws_cdk import aws_lambda_event_sources as lambda_event_sources
+from aws_cdk import aws_s3 as s3
+from aws_cdk import aws_secretsmanager as secretsmanager
+from aws_cdk import aws_sqs as sqs
+from aws_cdk import aws_ssm as ssm
+from aws_cdk import aws_stepfunctions as sfn
+from aws_cdk import aws_stepfunctions_tasks as tasks
 from constructs import Construct
 
 
@@ -46,6 +56,7 @@ class BedrockKnowledgeBotStack(Stack):
             iam.PolicyStatement(
                 actions=[
                     "bedrock:InvokeModel",
+                    "bedrock:InvokeModelWithResponseStream",
                     "bedrock:RetrieveAndGenerate",
                     "bedrock:Retrieve",
                     "bedrock:ListFoundationModels",
@@ -55,10 +66,28 @@ class BedrockKnowledgeBotStack(Stack):
             )
         )
 
-        # Determine the model type from context, defaulting to Nova Lite
-        model_type = self.node.try_get_context("model_type") or "Nova Lite"
-        if model_type not in ["Nova Lite", "Nova Pro"]:
-            raise ValueError("Invalid model_type. Must be 'Nova Lite' or 'Nova Pro'.")
+        # Region used for Bedrock calls, defaulting to the stack's region
+        bedrock_region = self.node.try_get_context("bedrock_region") or self.region
+        # Regions and cross-region inference profile (e.g. "us") that slow
+        # model calls are hedged to
+        hedge_regions = self.node.try_get_context("bedrock_hedge_regions") or []
+        if isinstance(hedge_regions, str):
+            hedge_regions = hedge_regions.split(",")
+        hedge_profile = self.node.try_get_context("bedrock_hedge_inference_profile") or ""
+
+        # Determine the model type from context. "Auto" routes each question to
+        # Nova Lite or Nova Pro by its complexity and the retrieval scores.
+        model_type = self.node.try_get_context("model_type") or "Auto"
+        model_ids = {
+            "Auto": "auto",
+            "Nova Lite": "amazon.nova-lite-v1:0",
+            "Nova Pro": "amazon.nova-pro-v1:0",
+        }
+        if model_type not in model_ids:
+            raise ValueError(
+                "Invalid model_type. Must be 'Auto', 'Nova Lite' or 'Nova Pro'."
+            )
+        default_model_id = model_ids[model_type]
 
         # Create an ECS execution role with the required policy
         execution_role = iam.Role(
@@ -72,6 +101,91 @@ class BedrockKnowledgeBotStack(Stack):
             )
         )
 
+        # Parameter updated after every completed sync so the app can invalidate its answer cache
+        sync_generation_parameter = ssm.StringParameter(
+            self,
+            "KnowledgeBaseSyncGeneration",
+            string_value="initial",
+            description="Latest Knowledge Base ingestion job, used to invalidate cached answers",
+        )
+        sync_generation_parameter.grant_read(task_role)
+
+        # Session history and the shared answer cache, so any task can serve any
+        # user. "none" keeps them in each task's memory.
+        state_backend = self.node.try_get_context("state_backend") or "dynamodb"
+        state_environment = {}
+        state_secrets = {}
+        if state_backend == "dynamodb":
+            state_table = dynamodb.Table(
+                self,
+                "StateTable",
+                partition_key=dynamodb.Attribute(
+                    name="pk", type=dynamodb.AttributeType.STRING
+                ),
+                billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+                time_to_live_attribute="expires_at",
+                removal_policy=RemovalPolicy.DESTROY,
+            )
+            state_table.grant_read_write_data(task_role)
+            state_environment = {
+                "STATE_BACKEND": "dynamodb",
+                "STATE_TABLE_NAME": state_table.table_name,
+            }
+            # Signs the session id the UI puts in chat URLs, so a URL cannot be
+            # made up to open someone else's history
+            session_key = secretsmanager.Secret(
+                self,
+                "StateSessionKey",
+                generate_secret_string=secretsmanager.SecretStringGenerator(
+                    exclude_punctuation=True, password_length=48
+                ),
+            )
+            state_secrets = {
+                "STATE_SESSION_KEY": ecs.Secret.from_secrets_manager(session_key)
+            }
+        elif state_backend != "none":
+            raise ValueError(
+                f"Invalid state_backend {state_backend!r}: expected dynamodb or none"
+            )
+
+        # Bucket holding the data source manifest recorded after each successful sync
+        sync_state_bucket = s3.Bucket(
+            self,
+            "KnowledgeBaseSyncStateBucket",
+            block_public_access=s3.BlockPublicAccess.BLOCK_ALL,
+            encryption=s3.BucketEncryption.S3_MANAGED,
+            enforce_ssl=True,
+        )
+
+        # Curated questions answered after every successful sync into an index
+        # the app serves without calling Bedrock
+        faq_questions_uri = self.node.try_get_context("faq_questions_uri")
+        faq_environment = {}
+        if faq_questions_uri:
+            faq_index_key = "faq/faq.idx"
+            sync_state_bucket.grant_read(task_role, faq_index_key)
+            faq_environment = {
+                "FAQ_INDEX_URI": f"s3://{sync_state_bucket.bucket_name}/{faq_index_key}",
+                "FAQ_MATCH_THRESHOLD": str(
+                    self.node.try_get_context("faq_match_threshold") or 0.75
+                ),
+                "FAQ_EMBEDDING_THRESHOLD": str(
+                    self.node.try_get_context("faq_embedding_threshold") or 0.9
+                ),
+            }
+
+        # Buckets backing the Knowledge Base data sources, used for change detection.
+        # Accepts a single name or a list of names.
+        data_source_bucket_names = (
+            self.node.try_get_context("data_source_bucket_name") or []
+        )
+        if isinstance(data_source_bucket_names, str):
+            data_source_bucket_names = [data_source_bucket_names]
+
+        # Knowledge base/data source pairs to sync, e.g.
+        # [{"knowledgeBaseId": "KB1"}, {"knowledgeBaseId": "KB2", "dataSourceId": "DS1"}]
+        sync_targets = self.node.try_get_context("sync_targets") or []
+
         # Create Lambda function for knowledge base sync
         sync_lambda = _lambda.Function(
             self,
@@ -82,18 +196,110 @@ class BedrockKnowledgeBotStack(Stack):
             environment={
                 "DATA_SOURCE_ID": self.node.try_get_context("data_source_id"),
                 "KNOWLEDGE_BASE_ID": self.node.try_get_context("knowledge_base_id"),
+                "SYNC_GENERATION_PARAMETER": sync_generation_parameter.parameter_name,
+                "SYNC_STATE_BUCKET": sync_state_bucket.bucket_name,
+                "SYNC_TARGETS": json.dumps(sync_targets),
+                "SYNC_CONCURRENCY": str(
+                    self.node.try_get_context("sync_concurrency") or 4
+                ),
             },
             timeout=Duration.minutes(15),
+            # A single concurrent invocation, so bursts of change events cannot
+            # race each other into starting overlapping ingestion jobs
+            reserved_concurrent_executions=1,
         )
+        sync_generation_parameter.grant_write(sync_lambda)
+        sync_state_bucket.grant_read_write(sync_lambda)
 
         # Add Bedrock permissions to the Lambda function
         sync_lambda.add_to_role_policy(
             iam.PolicyStatement(
-                actions=["bedrock:StartIngestionJob", "bedrock:GetIngestionJob"],
+                actions=[
+                    "bedrock:StartIngestionJob",
+                    "bedrock:GetIngestionJob",
+                    "bedrock:ListIngestionJobs",
+                    "bedrock:GetDataSource",
+                    "bedrock:ListDataSources",
+                ],
                 resources=["*"],
             )
         )
 
+        # Allow the Lambda to announce finished syncs on the default event bus
+        sync_lambda.add_to_role_policy(
+            iam.PolicyStatement(actions=["events:PutEvents"], resources=["*"])
+        )
+
+        # Allow the Lambda to list the data source buckets to build their manifests
+        sync_lambda.add_to_role_policy(
+            iam.PolicyStatement(
+                actions=["s3:ListBucket"],
+                resources=[
+                    f"arn:aws:s3:::{bucket_name}"
+                    for bucket_name in data_source_bucket_names
+                ]
+                or ["arn:aws:s3:::*"],
+            )
+        )
+
+        # Ingestion jobs can outlast the Lambda timeout, so one invocation starts
+        # them and the state machine invokes it again to check on them until
+        # none is running
+        def invoke_sync(name, payload=None):
+            invoke = tasks.LambdaInvoke(
+                self,
+                name,
+                lambda_function=sync_lambda,
+                payload=payload,
+                payload_response_only=True,
+            )
+            # Invocations from overlapping syncs queue behind the reserved concurrency
+            invoke.add_retry(
+                errors=["Lambda.TooManyRequestsException"],
+                interval=Duration.seconds(10),
+                max_attempts=10,
+                backoff_rate=2,
+            )
+            return invoke
+
+        check_sync = invoke_sync(
+            "CheckKnowledgeBaseSync",
+            sfn.TaskInput.from_object(
+                {"action": "check", "targets": sfn.JsonPath.list_at("$.targets")}
+            ),
+        )
+        # Syncs the same targets again, to pick up documents that changed
+        # while a job ran
+        resync = invoke_sync(
+            "ResyncKnowledgeBase",
+            sfn.TaskInput.from_object({"targets": sfn.JsonPath.list_at("$.targets")}),
+        )
+        sync_poll = Duration.seconds(self.node.try_get_context("sync_poll_seconds") or 60)
+        wait_for_sync = sfn.Wait(
+            self, "WaitForIngestionJobs", time=sfn.WaitTime.duration(sync_poll)
+        )
+        wait_to_resync = sfn.Wait(
+            self, "WaitBeforeResync", time=sfn.WaitTime.duration(sync_poll)
+        )
+        sync_running = (
+            sfn.Choice(self, "IngestionJobsRunning")
+            .when(sfn.Condition.is_present("$.summary.started"), wait_for_sync)
+            .when(sfn.Condition.boolean_equals("$.resync", True), wait_to_resync)
+            .otherwise(sfn.Succeed(self, "SyncFinished"))
+        )
+        wait_for_sync.next(check_sync)
+        check_sync.next(sync_running)
+        wait_to_resync.next(resync)
+        resync.next(sync_running)
+        sync_state_machine = sfn.StateMachine(
+            self,
+            "KnowledgeBaseSyncStateMachine",
+            definition_body=sfn.DefinitionBody.from_chainable(
+                invoke_sync("StartKnowledgeBaseSync").next(sync_running)
+            ),
+            timeout=Duration.hours(24),
+        )
+
         # Create EventBridge rule for weekly sync
         weekly_sync_rule = events.Rule(
             self,
@@ -107,20 +313,148 @@ class BedrockKnowledgeBotStack(Stack):
             ),
         )
 
-        # Add Lambda as target for the EventBridge rule
-        weekly_sync_rule.add_target(targets.LambdaFunction(sync_lambda))
+        # Add the sync state machine as target for the EventBridge rule
+        weekly_sync_rule.add_target(targets.SfnStateMachine(sync_state_machine))
+
+        # Sync when documents change in the data source bucket. The bucket must
+        # have Amazon EventBridge notifications enabled. Change events are
+        # queued and handed over in batches collected for sync_debounce_seconds,
+        # so a burst of uploads starts one sync instead of one per object.
+        if data_source_bucket_names:
+            change_queue = sqs.Queue(
+                self,
+                "KnowledgeBaseDataSourceChangeQueue",
+                retention_period=Duration.days(1),
+                visibility_timeout=Duration.minutes(3),
+            )
+            data_source_change_rule = events.Rule(
+                self,
+                "KnowledgeBaseDataSourceChangeRule",
+                event_pattern=events.EventPattern(
+                    source=["aws.s3"],
+                    detail_type=["Object Created", "Object Deleted"],
+                    detail={"bucket": {"name": data_source_bucket_names}},
+                ),
+            )
+            data_source_change_rule.add_target(targets.SqsQueue(change_queue))
+            sync_trigger_lambda = _lambda.Function(
+                self,
+                "KnowledgeBaseSyncTriggerFunction",
+                runtime=_lambda.Runtime.PYTHON_3_12,
+                handler="index.changes_handler",
+                code=_lambda.Code.from_asset("lambda/knowledge_base_sync"),
+                environment={
+                    "SYNC_STATE_MACHINE_ARN": sync_state_machine.state_machine_arn,
+                },
+                timeout=Duration.seconds(30),
+            )
+            sync_state_machine.grant_start_execution(sync_trigger_lambda)
+            sync_trigger_lambda.add_event_source(
+                lambda_event_sources.SqsEventSource(
+                    change_queue,
+                    batch_size=1000,
+                    max_batching_window=Duration.seconds(
+                        self.node.try_get_context("sync_debounce_seconds") or 120
+                    ),
+                )
+            )
+
+        # The UI and the inference API run from the same image
+        image = ecs.ContainerImage.from_ecr_repository(
+            ecr.Repository.from_repository_name(
+                self, "BedrockKnowledgeBotRepo", ecr_repository_name
+            )
+        )
+        deploy_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+        # New tasks take traffic after two passing checks 10s apart instead of
+        # the default five checks 30s apart
+        fast_health_check = {
+            "interval": Duration.seconds(10),
+            "timeout": Duration.seconds(5),
+            "healthy_threshold_count": 2,
+        }
+
+        # Stateless inference API behind an internal load balancer, scaled
+        # separately from the UI
+        api_port = self.node.try_get_context("api_container_port") or 8080
+        api_service = ecs_patterns.ApplicationLoadBalancedFargateService(
+            self,
+            "BedrockKnowledgeBotApiService",
+            cluster=cluster,
+            cpu=self.node.try_get_context("api_cpu") or 1024,
+            memory_limit_mib=self.node.try_get_context("api_memory_mib") or 2048,
+            desired_count=self.node.try_get_context("api_min_capacity") or 1,
+            health_check_grace_period=Duration.seconds(60),
+            task_image_options={
+                "image": image,
+                "command": ["python", "api_server.py"],
+                "container_port": api_port,
+                "execution_role": execution_role,
+                "task_role": task_role,
+                "environment": {
+                    "KNOWLEDGE_BASE_ID": self.node.try_get_context("knowledge_base_id"),
+                    "SYNC_GENERATION_PARAMETER": sync_generation_parameter.parameter_name,
+                    "BEDROCK_REGION": bedrock_region,
+                    "API_PORT": str(api_port),
+                    "HEALTHCHECK_URL": f"http://localhost:{api_port}/health",
+                    "METRICS_NAMESPACE": "BedrockKnowledgeBot/Api",
+                    "DEFAULT_MODEL_ID": default_model_id,
+                    # Requests per minute each task may send per model, e.g. the
+                    # account quota divided by api_max_capacity
+                    "BEDROCK_RATE_LIMITS": json.dumps(
+                        self.node.try_get_context("bedrock_rate_limits") or {}
+                    ),
+                    # Keeps routed questions off Nova Pro while it is slower than this
+                    "ROUTER_LATENCY_SLO_SECONDS": str(
+                        self.node.try_get_context("router_latency_slo_seconds") or ""
+                    ),
+                    "BEDROCK_HEDGE_REGIONS": ",".join(hedge_regions),
+                    "BEDROCK_HEDGE_INFERENCE_PROFILE": hedge_profile,
+                    "BEDROCK_HEDGE_PERCENTILE": str(
+                        self.node.try_get_context("bedrock_hedge_percentile") or 90
+                    ),
+                    "DEPLOY_TIME": deploy_time,
+                    **state_environment,
+                    **faq_environment,
+                },
+            },
+            public_load_balancer=False,
+            runtime_platform=ecs.RuntimePlatform(
+                cpu_architecture=ecs.CpuArchitecture.ARM64,
+                operating_system_family=ecs.OperatingSystemFamily.LINUX,
+            ),
+        )
+        api_service.target_group.configure_health_check(
+            path="/health", **fast_health_check
+        )
+        # Long generations keep a stream open well past the default 60 seconds
+        api_service.load_balancer.set_attribute("idle_timeout.timeout_seconds", "300")
+        # Matches the API's drain window after SIGTERM
+        api_service.target_group.set_attribute(
+            "deregistration_delay.timeout_seconds", "30"
+        )
+        self.add_autoscaling(
+            api_service,
+            "api",
+            min_capacity=1,
+            max_capacity=10,
+            cpu_target=60,
+            # Requests per task stands in for concurrency: each request is one turn
+            requests_per_target=300,
+        )
 
         load_balanced_fargate_service = (
             ecs_patterns.ApplicationLoadBalancedFargateService(
                 self,
                 "BedrockKnowledgeBotService",
                 cluster=cluster,
+                cpu=self.node.try_get_context("ui_cpu") or 512,
+                memory_limit_mib=self.node.try_get_context("ui_memory_mib") or 1024,
+                desired_count=self.node.try_get_context("ui_min_capacity") or 2,
+                health_check_grace_period=Duration.seconds(60),
                 task_image_options={
-                    "image": ecs.ContainerImage.from_ecr_repository(
-                        ecr.Repository.from_repository_name(
-                            self, "BedrockKnowledgeBotRepo", ecr_repository_name
-                        )
-                    ),
+                    "image": image,
                     "container_port": container_port,
                     "execution_role": execution_role,
                     "task_role": task_role,
@@ -128,10 +462,16 @@ class BedrockKnowledgeBotStack(Stack):
                         "KNOWLEDGE_BASE_ID": self.node.try_get_context(
                             "knowledge_base_id"
                         ),
-                        "DEPLOY_TIME": datetime.datetime.now().strftime(
-                            "%Y-%m-%d %H:%M:%S"
-                        ),
+                        "SYNC_GENERATION_PARAMETER": sync_generation_parameter.parameter_name,
+                        "BEDROCK_REGION": bedrock_region,
+                        # Answer turns through the inference API
+                        "INFERENCE_API_URL": f"http://{api_service.load_balancer.load_balancer_dns_name}",
+                        "DEFAULT_MODEL_ID": default_model_id,
+                        "DEPLOY_TIME": deploy_time,
+                        **state_environment,
+                        **faq_environment,
                     },
+                    "secrets": state_secrets,
                 },
                 public_load_balancer=True,
                 runtime_platform=ecs.RuntimePlatform(
@@ -140,3 +480,209 @@ class BedrockKnowledgeBotStack(Stack):
                 ),
             )
         )
+
+        load_balanced_fargate_service.target_group.configure_health_check(
+            path="/_stcore/health", **fast_health_check
+        )
+
+        # Streamlit keeps each session's state in the task serving its
+        # websocket, so reconnects must return to the same task and idle
+        # connections must outlive a user reading an answer
+        load_balanced_fargate_service.target_group.enable_cookie_stickiness(
+            Duration.hours(self.node.try_get_context("ui_stickiness_hours") or 8)
+        )
+        load_balanced_fargate_service.load_balancer.set_attribute(
+            "idle_timeout.timeout_seconds",
+            str(self.node.try_get_context("ui_idle_timeout_seconds") or 3600),
+        )
+        # Answer a file of common questions through the API after every
+        # successful sync, so the first students after it hit a warm cache
+        prewarm_questions_uri = self.node.try_get_context("prewarm_questions_uri")
+        if prewarm_questions_uri:
+            bucket_name, key = prewarm_questions_uri[len("s3://") :].split("/", 1)
+            task_role.add_to_policy(
+                iam.PolicyStatement(
+                    actions=["s3:GetObject"],
+                    resources=[f"arn:aws:s3:::{bucket_name}/{key}"],
+                )
+            )
+            prewarm_task = ecs.FargateTaskDefinition(
+                self,
+                "AnswerCachePrewarmTask",
+                cpu=256,
+                memory_limit_mib=512,
+                execution_role=execution_role,
+                task_role=task_role,
+                runtime_platform=ecs.RuntimePlatform(
+                    cpu_architecture=ecs.CpuArchitecture.ARM64,
+                    operating_system_family=ecs.OperatingSystemFamily.LINUX,
+                ),
+            )
+            prewarm_task.add_container(
+                "prewarm",
+                image=image,
+                command=[
+                    "python",
+                    "batch_answer.py",
+                    prewarm_questions_uri,
+                    "--concurrency",
+                    str(self.node.try_get_context("prewarm_concurrency") or 4),
+                    "--rate",
+                    str(self.node.try_get_context("prewarm_rate") or 2),
+                ],
+                environment={
+                    "INFERENCE_API_URL": f"http://{api_service.load_balancer.load_balancer_dns_name}",
+                    # Answers are cached per model, so prewarm with the UI's model
+                    "DEFAULT_MODEL_ID": default_model_id,
+                },
+                logging=ecs.LogDrivers.aws_logs(stream_prefix="prewarm"),
+            )
+            prewarm_rule = events.Rule(
+                self,
+                "AnswerCachePrewarmRule",
+                event_pattern=events.EventPattern(
+                    source=["bedrock-knowledge-bot.sync"],
+                    detail_type=["Knowledge Base Sync Completed"],
+                ),
+            )
+            prewarm_rule.add_target(
+                targets.EcsTask(cluster=cluster, task_definition=prewarm_task)
+            )
+
+        if faq_questions_uri:
+            bucket_name, key = faq_questions_uri[len("s3://") :].split("/", 1)
+            faq_build_role = iam.Role(
+                self,
+                "FaqIndexBuildRole",
+                assumed_by=iam.ServicePrincipal("ecs-tasks.amazonaws.com"),
+            )
+            faq_build_role.add_to_policy(
+                iam.PolicyStatement(
+                    actions=[
+                        "bedrock:InvokeModel",
+                        "bedrock:InvokeModelWithResponseStream",
+                        "bedrock:RetrieveAndGenerate",
+                        "bedrock:Retrieve",
+                    ],
+                    resources=["*"],
+                )
+            )
+            faq_build_role.add_to_policy(
+                iam.PolicyStatement(
+                    actions=["s3:GetObject"],
+                    resources=[f"arn:aws:s3:::{bucket_name}/{key}"],
+                )
+            )
+            sync_state_bucket.grant_put(faq_build_role, faq_index_key)
+            sync_generation_parameter.grant_read(faq_build_role)
+            faq_build_task = ecs.FargateTaskDefinition(
+                self,
+                "FaqIndexBuildTask",
+                cpu=512,
+                memory_limit_mib=1024,
+                execution_role=execution_role,
+                task_role=faq_build_role,
+                runtime_platform=ecs.RuntimePlatform(
+                    cpu_architecture=ecs.CpuArchitecture.ARM64,
+                    operating_system_family=ecs.OperatingSystemFamily.LINUX,
+                ),
+            )
+            # Answers in-process rather than through the API, which would answer
+            # from the index being replaced
+            faq_build_task.add_container(
+                "faq-build",
+                image=image,
+                command=[
+                    "python",
+                    "faq_index.py",
+                    "build",
+                    faq_questions_uri,
+                    "--output",
+                    faq_environment["FAQ_INDEX_URI"],
+                    "--concurrency",
+                    str(self.node.try_get_context("faq_build_concurrency") or 4),
+                    "--rate",
+                    str(self.node.try_get_context("faq_build_rate") or 2),
+                ],
+                environment={
+                    "KNOWLEDGE_BASE_ID": self.node.try_get_context("knowledge_base_id"),
+                    "SYNC_GENERATION_PARAMETER": sync_generation_parameter.parameter_name,
+                    "BEDROCK_REGION": bedrock_region,
+                    "DEFAULT_MODEL_ID": default_model_id,
+                },
+                logging=ecs.LogDrivers.aws_logs(stream_prefix="faq-build"),
+            )
+            faq_build_rule = events.Rule(
+                self,
+                "FaqIndexBuildRule",
+                event_pattern=events.EventPattern(
+                    source=["bedrock-knowledge-bot.sync"],
+                    detail_type=["Knowledge Base Sync Completed"],
+                ),
+            )
+            faq_build_rule.add_target(
+                targets.EcsTask(cluster=cluster, task_definition=faq_build_task)
+            )
+
+        self.add_autoscaling(
+            load_balanced_fargate_service,
+            "ui",
+            min_capacity=2,
+            max_capacity=8,
+            cpu_target=50,
+            requests_per_target=1000,
+        )
+
+    def add_autoscaling(
+        self,
+        service,
+        prefix,
+        min_capacity,
+        max_capacity,
+        cpu_target,
+        requests_per_target,
+    ):
+        """
+        Adds target tracking on CPU and on ALB requests per target, plus any
+        scheduled capacity from the "<prefix>_scaling_schedules" context, e.g.
+        [{"name": "ExamWeek", "cron": {"hour": "7", "minute": "0", "week_day": "MON-FRI"},
+          "min_capacity": 6, "max_capacity": 20, "time_zone": "America/New_York"}].
+        Each default can be overridden with the "<prefix>_<setting>" context.
+        """
+        context = self.node.try_get_context
+        scaling = service.service.auto_scale_task_count(
+            min_capacity=context(f"{prefix}_min_capacity") or min_capacity,
+            max_capacity=context(f"{prefix}_max_capacity") or max_capacity,
+        )
+        # Scale out quickly and in slowly, so capacity stays warm between bursts
+        scale_in_cooldown = Duration.seconds(
+            context(f"{prefix}_scale_in_cooldown_seconds") or 600
+        )
+        scale_out_cooldown = Duration.seconds(
+            context(f"{prefix}_scale_out_cooldown_seconds") or 60
+        )
+        scaling.scale_on_cpu_utilization(
+            f"{prefix.title()}CpuScaling",
+            target_utilization_percent=context(f"{prefix}_cpu_target") or cpu_target,
+            scale_in_cooldown=scale_in_cooldown,
+            scale_out_cooldown=scale_out_cooldown,
+        )
+        scaling.scale_on_request_count(
+            f"{prefix.title()}RequestScaling",
+            requests_per_target=context(f"{prefix}_requests_per_target")
+            or requests_per_target,
+            target_group=service.target_group,
+            scale_in_cooldown=scale_in_cooldown,
+            scale_out_cooldown=scale_out_cooldown,
+        )
+        for schedule in context(f"{prefix}_scaling_schedules") or []:
+            scaling.scale_on_schedule(
+                f"{prefix.title()}Schedule{schedule['name']}",
+                schedule=appscaling.Schedule.cron(**schedule["cron"]),
+                min_capacity=schedule.get("min_capacity"),
+                max_capacity=schedule.get("max_capacity"),
+                time_zone=TimeZone.of(schedule["time_zone"])
+                if schedule.get("time_zone")
+                else None,
+            )
+        return scaling
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+FAQ index build, lookup latency and hit rate.
+
+Builds an index of --faqs generated campus questions with the local Bedrock
+fakes, through the same build step as `faq_index.py build`, then reports:
+
+    lookup   the time to match exact and reworded FAQs, the same questions
+             about places not in the FAQ, and unrelated questions, with the
+             median word-overlap score and embedding similarity and the share
+             answered at the --threshold and --embedding-threshold scores
+    turns    the time to answer a mix of FAQ, reworded and new first
+             questions through answer_events, with the FAQ hit rate
+
+No AWS access is needed. The fake embedding model sums a random vector per
+word and maps a few reworded words onto each other, so its similarities are
+only a stand-in for Titan's; check a threshold against real questions with
+`faq_index.py query`.
+
+    python benchmarks/bench_faq.py
+    python benchmarks/bench_faq.py --faqs 5000 --turns 200
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+APP_DIR = os.path.join(os.path.dirname(__file__), "..", "assets", "streamlit")
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, os.path.dirname(__file__))
+
+SUBJECTS = [
+    "the library", "the gym", "the dining hall", "the bookstore", "the health centre",
+    "the registrar", "the career office", "the computer lab", "the pool", "the print shop",
+    "the writing centre", "the chapel", "the art studio", "the music rooms", "the cafe",
+    "the language lab", "the science library", "the archives", "the parking office",
+    "the international office",
+]
+ASKS = [
+    "When is {s} open on {d}?",
+    "How do I book a room at {s} for {d}?",
+    "Is {s} closed on {d}?",
+    "Who do I contact at {s} about {d} hours?",
+    "Can I study at {s} during {d}?",
+]
+DAYS = ["weekdays", "weekends", "holidays", "exam weeks", "public holidays", "mondays",
+        "fridays", "summer", "winter break", "reading week"]
+REWORDINGS = [
+    ("When is", "What time is"),
+    ("How do I", "How can I"),
+    ("closed", "shut"),
+    ("Can I study", "Am I allowed to study"),
+]
+# Places the FAQs do not cover, whose questions must not get another place's answer
+OTHER_SUBJECTS = ["the robotics lab", "the rowing club", "the dance studio", "the nursery"]
+
+
+def faq_questions(count):
+    questions = [
+        ask.format(s=subject, d=day) for ask in ASKS for subject in SUBJECTS for day in DAYS
+    ]
+    base = len(questions)
+    while len(questions) < count:
+        questions.append(f"{questions[len(questions) % base][:-1]} on campus {len(questions) // base}?")
+    return questions[:count]
+
+
+def reword(question):
+    for old, new in REWORDINGS:
+        if old in question:
+            return question.replace(old, new)
+    return None
+
+
+def reworded_questions(questions):
+    return [reworded for reworded in map(reword, questions) if reworded]
+
+
+def build(args, path):
+    import faq_index
+    import fake_bedrock
+
+    fake_bedrock.install(
+        fake_bedrock.FakeBedrockRuntime(latency=0.0, time_to_first_token=0.0),
+        fake_bedrock.FakeBedrockAgentRuntime(latency=0.0, retrieval_latency=0.0, time_to_first_token=0.0),
+    )
+    questions_path = os.path.join(os.path.dirname(path), "faq.jsonl")
+    with open(questions_path, "w", encoding="utf-8") as f:
+        for question in faq_questions(args.faqs):
+            f.write(json.dumps({"question": question}) + "\n")
+    build_args = argparse.Namespace(
+        input=questions_path, output=path, concurrency=16, rate=0, retries=0,
+        model_id="amazon.nova-lite-v1:0", max_tokens=2000, temperature=0.2, top_p=0.2,
+        embedding_model="amazon.titan-embed-text-v2:0", embedding_dimensions=256,
+    )
+    started_at = time.perf_counter()
+    faq_index.build(build_args)
+    return time.perf_counter() - started_at
+
+
+def measure_lookups(path, args):
+    from bedrock_clients import get_client
+    from faq_index import FaqMatcher, question_embedding
+
+    client = get_client("bedrock-runtime")
+    matcher = FaqMatcher(
+        path,
+        threshold=args.threshold,
+        embedding_client=client,
+        embedding_threshold=args.embedding_threshold,
+    )
+    matcher.refresh()
+    index = matcher.index
+    questions = faq_questions(args.faqs)
+    samples = {
+        "exact": random.sample(questions, 50),
+        "reworded": random.sample(reworded_questions(questions), 50),
+        "other": [
+            random.choice(ASKS).format(s=random.choice(OTHER_SUBJECTS), d=random.choice(DAYS))
+            for _ in range(50)
+        ],
+        "unrelated": [f"Can I bring my dog {i} to a lecture?" for i in range(50)],
+    }
+    results = []
+    for kind, queries in samples.items():
+        timings, scores, similarities, hits = [], [], [], 0
+        for query in queries:
+            started_at = time.perf_counter()
+            hits += matcher.match(query) is not None
+            timings.append(time.perf_counter() - started_at)
+            scores.append(index.match(query)[1])
+            similarities.append(index.nearest(question_embedding(index, client, query))[1])
+        results.append(
+            {
+                "kind": kind,
+                "lookup_p50_ms": statistics.median(timings) * 1000,
+                "lookup_max_ms": max(timings) * 1000,
+                "score_p50": statistics.median(scores),
+                "similarity_p50": statistics.median(similarities),
+                "hit_rate": hits / len(queries),
+            }
+        )
+    return results
+
+
+def measure_turns(path, args):
+    import bedrock_clients
+    import chat_service
+    import fake_bedrock
+    from metrics import TurnMetrics
+
+    os.environ["FAQ_INDEX_URI"] = path
+    os.environ["FAQ_MATCH_THRESHOLD"] = str(args.threshold)
+    os.environ["FAQ_EMBEDDING_THRESHOLD"] = str(args.embedding_threshold)
+    for getter in (
+        bedrock_clients.get_resilience_policy,
+        chat_service.get_answer_cache,
+        chat_service.get_faq_matcher,
+    ):
+        getter.cache_clear()
+    fake_bedrock.install(
+        fake_bedrock.FakeBedrockRuntime(latency=args.latency, time_to_first_token=0.1),
+        fake_bedrock.FakeBedrockAgentRuntime(latency=args.latency, time_to_first_token=0.1),
+    )
+    questions = faq_questions(args.faqs)
+    reworded = reworded_questions(questions)
+    latencies = {"faq": [], "bedrock": []}
+    for i in range(args.turns):
+        roll = random.random()
+        if roll < args.faq_share / 2:
+            prompt = random.choice(questions)
+        elif roll < args.faq_share:
+            prompt = random.choice(reworded)
+        else:
+            prompt = f"Can I bring my dog to lecture {i}?"
+        metrics = TurnMetrics(model_id="amazon.nova-lite-v1:0")
+        for _ in chat_service.answer_events(
+            prompt, "amazon.nova-lite-v1:0", 2000, 0.2, 0.2, metrics=metrics
+        ):
+            pass
+        metrics.finish()
+        latencies["faq" if metrics.faq_hit else "bedrock"].append(metrics.total_latency)
+    return {
+        "turns": args.turns,
+        **chat_service.get_faq_matcher().stats(),
+        "faq_p50_ms": statistics.median(latencies["faq"]) * 1000 if latencies["faq"] else None,
+        "bedrock_p50_ms": statistics.median(latencies["bedrock"]) * 1000
+        if latencies["bedrock"]
+        else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--faqs", type=int, default=1000)
+    parser.add_argument("--turns", type=int, default=100)
+    parser.add_argument("--faq-share", type=float, default=0.6,
+                        help="Share of turns asking an FAQ, half of them reworded")
+    parser.add_argument("--threshold", type=float, default=0.75, help="Minimum word-overlap score")
+    parser.add_argument("--embedding-threshold", type=float, default=0.9,
+                        help="Minimum embedding similarity (0 to match words only)")
+    parser.add_argument("--latency", type=float, default=0.3, help="Fake generation latency (s)")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON lines")
+    args = parser.parse_args()
+
+    random.seed(7)
+    os.environ.setdefault("METRICS_FORMAT", "json")
+    logging.getLogger("metrics").disabled = True
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "faq.idx")
+        build_seconds = build(args, path)
+        size_kb = os.path.getsize(path) / 1024
+        lookups = measure_lookups(path, args)
+        turns = measure_turns(path, args)
+
+    if args.json:
+        print(json.dumps({"build_seconds": build_seconds, "index_kb": size_kb}))
+        for result in lookups:
+            print(json.dumps(result))
+        print(json.dumps(turns))
+        return
+    print(f"built {turns['entries']} FAQs in {build_seconds:.1f}s, {size_kb:.0f}KB")
+    for result in lookups:
+        print(
+            f"{result['kind']:>9}: lookup p50 {result['lookup_p50_ms']:.3f}ms, "
+            f"max {result['lookup_max_ms']:.3f}ms, score p50 {result['score_p50']:.2f}, "
+            f"similarity p50 {result['similarity_p50']:.2f}, matched {result['hit_rate']:.0%}"
+        )
+    print(
+        f"    turns: {turns['hits']}/{turns['lookups']} answered from the FAQ index "
+        f"({turns['hit_rate']:.0%}, {turns['semantic_hits']} by embedding), p50 {turns['faq_p50_ms']:.2f}ms vs "
+        f"{turns['bedrock_p50_ms']:.0f}ms through Bedrock"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+Offline latency benchmark for the chat pipeline.
+
+Drives generate_response, the inference API (served in-process over HTTP) or
+the full Streamlit script through streamlit.testing AppTest against the local
+Bedrock fakes in fake_bedrock.py at each requested concurrency, and reports
+throughput, p50/p95/p99 latency, time to first token and resident memory per
+session. No AWS access is needed.
+
+    python benchmarks/bench_generate_response.py --concurrency 1 8 32
+    python benchmarks/bench_generate_response.py --mode api --concurrency 1 8 32
+    python benchmarks/bench_generate_response.py --mode apptest --concurrency 4
+    python benchmarks/bench_generate_response.py --max-p95 2.5   # regression gate
+"""
+
+import argparse
+import functools
+import json
+import logging
+import os
+import statistics
+import sys
+import threading
+import time
+import uuid
+
+APP_DIR = os.path.join(os.path.dirname(__file__), "..", "assets", "streamlit")
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, os.path.dirname(__file__))
+
+
+_APPTEST_SETUP_LOCK = threading.Lock()
+
+
+def rss_bytes():
+    """Current resident set size of this process."""
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    import resource
+
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def quantile(values, q):
+    if not values:
+        return None
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[q - 1]
+
+
+def unique_question():
+    # Unique questions keep the retrieval and answer caches out of the measurement
+    return f"When is the library open? ({uuid.uuid4().hex[:8]})"
+
+
+def run_function(concurrency, turns, stream, model_id):
+    """Calls generate_response / generate_response_stream from worker threads."""
+    from chat_service import generate_response, generate_response_stream
+
+    latencies, ttfts = [], []
+    lock = threading.Lock()
+
+    def session():
+        for _ in range(turns):
+            params = {
+                "prompt": unique_question(),
+                "model_id": model_id,
+                "max_tokens": 2000,
+                "temperature": 0.2,
+                "top_p": 0.2,
+            }
+            started_at = time.perf_counter()
+            ttft = None
+            if stream:
+                for kind, _ in generate_response_stream(**params):
+                    if kind == "text" and ttft is None:
+                        ttft = time.perf_counter() - started_at
+            else:
+                generate_response(**params)
+            latency = time.perf_counter() - started_at
+            with lock:
+                latencies.append(latency)
+                ttfts.append(ttft if ttft is not None else latency)
+
+    return _run_sessions(session, concurrency), latencies, ttfts
+
+
+def run_api(concurrency, turns, stream, model_id):
+    """Sends turns through api_client to the inference API served in-process."""
+    import api_client
+
+    api_url = start_api_server()
+    latencies, ttfts = [], []
+    lock = threading.Lock()
+
+    def session():
+        for _ in range(turns):
+            started_at = time.perf_counter()
+            ttft = None
+            for kind, _ in api_client.answer_events(
+                prompt=unique_question(),
+                model_id=model_id,
+                max_tokens=2000,
+                temperature=0.2,
+                top_p=0.2,
+                stream=stream,
+                api_url=api_url,
+            ):
+                if kind == "text" and ttft is None:
+                    ttft = time.perf_counter() - started_at
+            latency = time.perf_counter() - started_at
+            with lock:
+                latencies.append(latency)
+                ttfts.append(ttft if ttft is not None else latency)
+
+    return _run_sessions(session, concurrency), latencies, ttfts
+
+
+@functools.cache
+def start_api_server():
+    """Serves api_server on a free local port from a background thread."""
+    import asyncio
+
+    import tornado.httpserver
+    import tornado.netutil
+
+    import api_server
+
+    sockets = tornado.netutil.bind_sockets(0, "127.0.0.1")
+
+    async def serve():
+        tornado.httpserver.HTTPServer(api_server.make_app()).add_sockets(sockets)
+        await asyncio.Event().wait()
+
+    threading.Thread(target=asyncio.run, args=(serve(),), daemon=True).start()
+    return f"http://127.0.0.1:{sockets[0].getsockname()[1]}"
+
+
+def run_apptest(concurrency, turns, stream, model_id):
+    """Runs the Streamlit script end to end, one AppTest per simulated session."""
+    from streamlit.testing.v1 import AppTest
+
+    latencies = []
+    lock = threading.Lock()
+
+    def session():
+        # Compiling the script is not thread safe on every Python version, so
+        # sessions start one at a time and only their chat turns overlap
+        with _APPTEST_SETUP_LOCK:
+            app = AppTest.from_file(os.path.join(APP_DIR, "streamlit_app.py"), default_timeout=60)
+            app.run()
+            app.toggle[0].set_value(stream).run()
+        for _ in range(turns):
+            started_at = time.perf_counter()
+            app.chat_input[0].set_value(unique_question()).run()
+            latency = time.perf_counter() - started_at
+            with lock:
+                latencies.append(latency)
+        return app
+
+    # AppTest cannot observe partial renders, so TTFT equals total latency here
+    return _run_sessions(session, concurrency), latencies, list(latencies)
+
+
+def _run_sessions(session, concurrency):
+    rss_before = rss_bytes()
+    started_at = time.perf_counter()
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(session()))
+        for _ in range(concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started_at
+    # Sessions stay referenced in results so their memory is still counted
+    rss_per_session = (rss_bytes() - rss_before) / concurrency
+    return {"elapsed": elapsed, "rss_per_session": rss_per_session, "sessions": results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--mode", choices=["function", "api", "apptest"], default="function")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--turns", type=int, default=5, help="Turns per session")
+    parser.add_argument("--no-stream", dest="stream", action="store_false")
+    parser.add_argument("--model-id", default="amazon.nova-pro-v1:0")
+    parser.add_argument("--knowledge-base", action="store_true", help="Exercise the Knowledge Base path")
+    parser.add_argument("--pipeline", choices=["two_stage", "retrieve_and_generate"], default="two_stage")
+    parser.add_argument("--latency", type=float, default=1.0, help="Fake generation latency (s)")
+    parser.add_argument("--ttft", type=float, default=0.3, help="Fake time to first token (s)")
+    parser.add_argument("--retrieval-latency", type=float, default=0.2)
+    parser.add_argument("--max-p95", type=float, help="Fail if any p95 latency exceeds this (s)")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON lines")
+    parser.add_argument("--verbose", action="store_true", help="Also print per-turn metric records")
+    args = parser.parse_args()
+
+    # Configuration is read at import time, so set it before importing the app
+    if args.knowledge_base:
+        os.environ["KNOWLEDGE_BASE_ID"] = "FAKEKNOWLEDGEBASE"
+        os.environ["KB_PIPELINE"] = args.pipeline
+    os.environ.setdefault("METRICS_FORMAT", "json")
+    if not args.verbose:
+        # Per-turn metric records would drown out the results table
+        logging.getLogger("metrics").disabled = True
+
+    import fake_bedrock
+
+    fake_bedrock.install(
+        fake_bedrock.FakeBedrockRuntime(latency=args.latency, time_to_first_token=args.ttft),
+        fake_bedrock.FakeBedrockAgentRuntime(
+            latency=args.latency,
+            time_to_first_token=args.ttft,
+            retrieval_latency=args.retrieval_latency,
+        ),
+    )
+    run = {"function": run_function, "api": run_api, "apptest": run_apptest}[args.mode]
+
+    failed = False
+    if not args.json:
+        print(
+            f"{'sessions':>8} {'turns/s':>8} {'p50':>7} {'p95':>7} {'p99':>7} "
+            f"{'ttft50':>7} {'ttft95':>7} {'rss/session':>12}"
+        )
+    for concurrency in args.concurrency:
+        summary, latencies, ttfts = run(concurrency, args.turns, args.stream, args.model_id)
+        result = {
+            "mode": args.mode,
+            "sessions": concurrency,
+            "turns_per_second": len(latencies) / summary["elapsed"],
+            "p50": quantile(latencies, 50),
+            "p95": quantile(latencies, 95),
+            "p99": quantile(latencies, 99),
+            "ttft_p50": quantile(ttfts, 50),
+            "ttft_p95": quantile(ttfts, 95),
+            "rss_per_session_mb": summary["rss_per_session"] / 2**20,
+        }
+        if args.json:
+            print(json.dumps(result))
+        else:
+            print(
+                f"{concurrency:>8} {result['turns_per_second']:>8.2f} "
+                f"{result['p50']:>6.2f}s {result['p95']:>6.2f}s {result['p99']:>6.2f}s "
+                f"{result['ttft_p50']:>6.2f}s {result['ttft_p95']:>6.2f}s "
+                f"{result['rss_per_session_mb']:>10.2f}MB"
+            )
+        if args.max_p95 is not None and result["p95"] > args.max_p95:
+            failed = True
+
+    if failed:
+        print(f"p95 latency exceeded {args.max_p95}s", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Tail latency of hedged Bedrock requests.
+
+Runs chat turns through answer_events against two local bedrock-runtime fakes:
+the primary region, which answers quickly but stalls for --slow-latency
+seconds on --slow-rate of its calls, and a secondary region that is a little
+slower but never stalls. Each run is made once without hedging and once with
+the secondary in BEDROCK_HEDGE_REGIONS, and reports the p50, p95 and p99 time
+to first byte, the extra requests sent and how many the secondary won.
+
+Hedging can only shorten the tail for as many calls as the budget lets it
+hedge, so p95 improves while --budget-ratio is above --slow-rate.
+
+    python benchmarks/bench_hedging.py
+    python benchmarks/bench_hedging.py --slow-rate 0.2 --slow-latency 1
+    python benchmarks/bench_hedging.py --turns 400 --slow-rate 0.05 --no-stream
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+APP_DIR = os.path.join(os.path.dirname(__file__), "..", "assets", "streamlit")
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, os.path.dirname(__file__))
+
+SECONDARY_REGION = "us-west-2"
+
+
+def reset(args, hedged):
+    """Installs fresh regional fakes and clears the process-wide caches."""
+    import bedrock_clients
+    import chat_service
+    import fake_bedrock
+
+    if hedged:
+        os.environ["BEDROCK_HEDGE_REGIONS"] = SECONDARY_REGION
+    else:
+        os.environ.pop("BEDROCK_HEDGE_REGIONS", None)
+    os.environ["BEDROCK_HEDGE_PERCENTILE"] = str(args.percentile)
+    os.environ["BEDROCK_HEDGE_MEDIAN_FACTOR"] = str(args.median_factor)
+    os.environ["BEDROCK_HEDGE_BUDGET_RATIO"] = str(args.budget_ratio)
+    for getter in (
+        bedrock_clients.get_resilience_policy,
+        bedrock_clients.get_hedged_runtime,
+        chat_service.get_answer_cache,
+        chat_service.get_answer_flights,
+    ):
+        getter.cache_clear()
+    primary = fake_bedrock.FakeBedrockRuntime(
+        latency=args.latency,
+        time_to_first_token=args.time_to_first_token,
+        slow_rate=args.slow_rate,
+        slow_latency=args.slow_latency,
+    )
+    secondary = fake_bedrock.FakeBedrockRuntime(
+        latency=args.latency * 1.5,
+        time_to_first_token=args.time_to_first_token * 1.5,
+    )
+    fake_bedrock.install(primary, regions={SECONDARY_REGION: secondary})
+    return primary, secondary
+
+
+def run(args, hedged):
+    import bedrock_clients
+    from chat_service import answer_events
+    from metrics import TurnMetrics, percentile
+
+    primary, secondary = reset(args, hedged)
+
+    def turn(_):
+        metrics = TurnMetrics(model_id=args.model_id)
+        for _ in answer_events(
+            f"When is the library open? ({uuid.uuid4().hex[:8]})",
+            args.model_id,
+            2000,
+            0.2,
+            0.2,
+            metrics=metrics,
+            stream=args.stream,
+        ):
+            metrics.mark_first_byte()
+        metrics.finish()
+        return metrics.time_to_first_byte
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        latencies = list(executor.map(turn, range(args.turns)))
+
+    runtime = bedrock_clients.get_hedged_runtime()
+    stats = runtime.stats() if runtime else {"hedges": 0, "hedge_wins": 0, "budget_denied": 0}
+    return {
+        "hedged": hedged,
+        "turns": args.turns,
+        "ttfb_p50": percentile(latencies, 50),
+        "ttfb_p95": percentile(latencies, 95),
+        "ttfb_p99": percentile(latencies, 99),
+        "primary_calls": primary.calls,
+        "secondary_calls": secondary.calls,
+        "extra_requests": stats["hedges"] / args.turns,
+        "hedge_wins": stats["hedge_wins"],
+        "budget_denied": stats["budget_denied"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--turns", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.3, help="Fake generation latency (s)")
+    parser.add_argument("--time-to-first-token", type=float, default=0.1)
+    parser.add_argument("--slow-rate", type=float, default=0.05, help="Share of stalled primary calls")
+    parser.add_argument("--slow-latency", type=float, default=2.0, help="Stall length (s)")
+    parser.add_argument("--percentile", type=int, default=90, help="Hedge deadline percentile")
+    parser.add_argument("--median-factor", type=float, default=3.0,
+                        help="Hedge deadline cap, as a multiple of the median latency")
+    parser.add_argument("--budget-ratio", type=float, default=0.3, help="Hedges per call")
+    parser.add_argument("--model-id", default="amazon.nova-lite-v1:0")
+    parser.add_argument("--no-stream", dest="stream", action="store_false")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON lines")
+    args = parser.parse_args()
+
+    os.environ.setdefault("METRICS_FORMAT", "json")
+    logging.getLogger("metrics").disabled = True
+
+    for hedged in (False, True):
+        result = run(args, hedged)
+        if args.json:
+            print(json.dumps(result))
+        else:
+            print(
+                f"{'hedged' if hedged else 'single':>7}: "
+                f"p50 {result['ttfb_p50']:.2f}s, p95 {result['ttfb_p95']:.2f}s, "
+                f"p99 {result['ttfb_p99']:.2f}s, "
+                f"{result['extra_requests']:.1%} extra requests, "
+                f"{result['hedge_wins']} won by {SECONDARY_REGION}, "
+                f"{result['budget_denied']} denied by the budget"
+            )
+
+
+if __name__ == "__main__":
+    main()
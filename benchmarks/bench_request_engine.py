@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Load benchmark for the request engine against a stubbed Bedrock endpoint.
+
+Simulates many concurrent chats against a stub that sleeps for the model latency
+and throttles once more than --quota calls are in flight, the way Bedrock does
+when an account's concurrency quota is exceeded. Compares calling the stub
+directly from each chat thread (as the app did before) with routing calls through
+RequestEngine with the settings the app ships with, and reports how many
+concurrent chats one task sustains: the most chats whose failure rate and p95
+latency both stay within their SLOs.
+
+    python benchmarks/bench_request_engine.py --chats 10 50 100 200
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "assets", "streamlit"))
+
+from request_engine import RequestEngine  # noqa: E402
+
+
+class ThrottlingException(Exception):
+    pass
+
+
+class StubBedrockRuntime:
+    """Stand-in for bedrock-runtime with fixed latency and a concurrency quota."""
+
+    def __init__(self, latency, quota):
+        self.latency = latency
+        self.quota = quota
+        self.in_flight = 0
+        self.lock = threading.Lock()
+
+    def invoke_model(self, **kwargs):
+        with self.lock:
+            if self.in_flight >= self.quota:
+                raise ThrottlingException("Too many requests")
+            self.in_flight += 1
+        try:
+            time.sleep(self.latency * random.uniform(0.8, 1.2))
+            return {"body": b"{}"}
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+
+def call_with_retries(client, max_attempts=4):
+    """Mirrors botocore's retry behaviour: exponential backoff with jitter."""
+    for attempt in range(max_attempts):
+        try:
+            return client.invoke_model(modelId="amazon.nova-lite-v1:0")
+        except ThrottlingException:
+            if attempt == max_attempts - 1:
+                raise
+            time.sleep(random.uniform(0, 0.1 * 2**attempt))
+
+
+def run(mode, chats, duration, latency, quota):
+    client = StubBedrockRuntime(latency, quota)
+    engine = None
+    if mode == "engine":
+        # The defaults get_request_engine uses when no ENGINE_* variable is set
+        engine = RequestEngine()
+    latencies = []
+    failures = 0
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def chat():
+        nonlocal failures
+        while time.monotonic() < deadline:
+            started_at = time.perf_counter()
+            try:
+                if engine:
+                    engine.submit(
+                        "amazon.nova-lite-v1:0", call_with_retries, client
+                    ).result()
+                else:
+                    call_with_retries(client)
+                with lock:
+                    latencies.append(time.perf_counter() - started_at)
+            except Exception:
+                with lock:
+                    failures += 1
+
+    started_at = time.monotonic()
+    threads = [threading.Thread(target=chat) for _ in range(chats)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started_at
+    if engine:
+        engine.shutdown()
+
+    total = len(latencies) + failures
+    quantiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else [0] * 99
+    return {
+        "mode": mode,
+        "chats": chats,
+        "turns_per_second": len(latencies) / elapsed,
+        "failure_rate": failures / total if total else 0.0,
+        "p50": quantiles[49],
+        "p95": quantiles[94],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--chats", type=int, nargs="+", default=[10, 50, 100, 200])
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--latency", type=float, default=0.5, help="Stub model latency in seconds")
+    parser.add_argument("--quota", type=int, default=20, help="Stub concurrency quota")
+    parser.add_argument("--slo", type=float, default=0.01, help="Max acceptable failure rate")
+    parser.add_argument(
+        "--p95-slo", type=float, default=2.0, help="Max acceptable p95 turn latency in seconds"
+    )
+    args = parser.parse_args()
+
+    print(f"{'mode':<8} {'chats':>6} {'turns/s':>8} {'failed':>7} {'p50':>7} {'p95':>7}")
+    sustained = {"direct": 0, "engine": 0}
+    for chats in args.chats:
+        for mode in ("direct", "engine"):
+            result = run(mode, chats, args.duration, args.latency, args.quota)
+            print(
+                f"{result['mode']:<8} {result['chats']:>6} "
+                f"{result['turns_per_second']:>8.1f} {result['failure_rate']:>7.1%} "
+                f"{result['p50']:>6.2f}s {result['p95']:>6.2f}s"
+            )
+            if result["failure_rate"] <= args.slo and result["p95"] <= args.p95_slo:
+                sustained[mode] = max(sustained[mode], chats)
+
+    print()
+    for mode, chats in sustained.items():
+        print(f"Sustained concurrent chats ({mode}): {chats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Throttling benchmark for the Bedrock resilience layer.
+
+Runs concurrent chat turns through answer_events against the local Bedrock
+fakes in three scenarios and reports answered turns, errors, Bedrock calls,
+retries, coalesced requests and circuit breaker state:
+
+    coalesce  every session asks the same question at once
+    burst     the model fake throttles the first --throttle-count calls
+    outage    the fakes throttle every call, so the circuit opens
+
+    python benchmarks/bench_resilience.py
+    python benchmarks/bench_resilience.py --scenario burst --sessions 32
+"""
+
+import argparse
+import json
+import logging
+import os
+import statistics
+import sys
+import threading
+import time
+import uuid
+
+APP_DIR = os.path.join(os.path.dirname(__file__), "..", "assets", "streamlit")
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, os.path.dirname(__file__))
+
+
+def reset(args):
+    """Installs fresh fakes and clears the process-wide caches and policy."""
+    import bedrock_clients
+    import chat_service
+    import fake_bedrock
+
+    for getter in (
+        bedrock_clients.get_resilience_policy,
+        chat_service.get_answer_cache,
+        chat_service.get_answer_flights,
+        chat_service.get_retrieval_cache,
+    ):
+        getter.cache_clear()
+    return fake_bedrock.install(
+        fake_bedrock.FakeBedrockRuntime(latency=args.latency, time_to_first_token=0.05),
+        fake_bedrock.FakeBedrockAgentRuntime(
+            latency=args.latency, time_to_first_token=0.05, retrieval_latency=0.05
+        ),
+    )
+
+
+def run_scenario(scenario, args):
+    import bedrock_clients
+    from chat_service import answer_events
+    from metrics import TurnMetrics
+
+    runtime, agent = reset(args)
+    if scenario == "burst":
+        # Model invocation quotas are the ones that usually run out
+        runtime.throttle(count=args.throttle_count)
+    elif scenario == "outage":
+        runtime.throttle(rate=1.0)
+        agent.throttle(rate=1.0)
+
+    shared_question = f"When is the library open? ({uuid.uuid4().hex[:8]})"
+    results = []
+    lock = threading.Lock()
+
+    def session():
+        prompt = (
+            shared_question
+            if scenario == "coalesce"
+            else f"When is the library open? ({uuid.uuid4().hex[:8]})"
+        )
+        metrics = TurnMetrics(model_id=args.model_id)
+        response = ""
+        for kind, data in answer_events(
+            prompt, args.model_id, 2000, 0.2, 0.2, metrics=metrics, stream=True
+        ):
+            if kind == "done":
+                response = data
+        metrics.finish()
+        with lock:
+            results.append((response, metrics))
+
+    started_at = time.perf_counter()
+    threads = [threading.Thread(target=session) for _ in range(args.sessions)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started_at
+
+    latencies = sorted(metrics.total_latency for _, metrics in results)
+    errors = sum(1 for response, _ in results if response.strip().startswith("Error:"))
+    stats = bedrock_clients.get_resilience_policy().stats()
+    return {
+        "scenario": scenario,
+        "sessions": args.sessions,
+        "answered": len(results) - errors,
+        "errors": errors,
+        "model_calls": runtime.calls,
+        "throttled": runtime.throttled + agent.throttled,
+        "retries": stats["retries"],
+        "budget_exhausted": stats["budget_exhausted"],
+        "short_circuited": stats["short_circuited"],
+        "coalesced_turns": sum(1 for _, metrics in results if metrics.coalesced),
+        "circuits": stats["circuits"],
+        "p50": statistics.median(latencies),
+        "max": latencies[-1],
+        "elapsed": elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--scenario", choices=["coalesce", "burst", "outage", "all"], default="all"
+    )
+    parser.add_argument("--sessions", type=int, default=16)
+    parser.add_argument("--throttle-count", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.3, help="Fake generation latency (s)")
+    parser.add_argument("--model-id", default="amazon.nova-lite-v1:0")
+    parser.add_argument("--knowledge-base", action="store_true", help="Exercise the Knowledge Base path")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON lines")
+    args = parser.parse_args()
+
+    if args.knowledge_base:
+        os.environ["KNOWLEDGE_BASE_ID"] = "FAKEKNOWLEDGEBASE"
+    os.environ.setdefault("METRICS_FORMAT", "json")
+    logging.getLogger("metrics").disabled = True
+
+    scenarios = ["coalesce", "burst", "outage"] if args.scenario == "all" else [args.scenario]
+    for scenario in scenarios:
+        result = run_scenario(scenario, args)
+        if args.json:
+            print(json.dumps(result))
+        else:
+            print(
+                f"{scenario:>8}: {result['answered']}/{result['sessions']} answered, "
+                f"{result['errors']} errors, {result['model_calls']} model calls, "
+                f"{result['throttled']} throttled, {result['retries']} retries, "
+                f"{result['coalesced_turns']} coalesced, "
+                f"{result['short_circuited']} short-circuited, "
+                f"p50 {result['p50']:.2f}s, max {result['max']:.2f}s, "
+                f"circuits {result['circuits']}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+Cold start benchmark for the UI and the inference API.
+
+Starts each server as a fresh process, or as a container from a built image,
+and reports the time until its health check passes and the latency of the
+first and second requests: the page for the UI and an answer for the API.
+With --image it also reports the image size. The local inference API answers
+from the Bedrock fakes in fake_bedrock.py, so no AWS access is needed.
+
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --target api --runs 5
+    docker build -t bedrock-knowledge-bot . && \\
+        python benchmarks/bench_startup.py --image bedrock-knowledge-bot
+"""
+
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.join(BENCH_DIR, "..", "assets", "streamlit")
+
+HEALTH_PATHS = {"ui": "/_stcore/health", "api": "/health"}
+CONTAINER_PORTS = {"ui": 8501, "api": 8080}
+
+# Serves the inference API with the Bedrock fakes installed
+FAKE_API_SERVER = f"""
+import sys
+sys.path[:0] = [{APP_DIR!r}, {BENCH_DIR!r}]
+import fake_bedrock
+fake_bedrock.install(
+    fake_bedrock.FakeBedrockRuntime(latency=0.2, time_to_first_token=0.05),
+    fake_bedrock.FakeBedrockAgentRuntime(latency=0.2, time_to_first_token=0.05),
+)
+import api_server
+api_server.main()
+"""
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_healthy(url, process=None, timeout=120):
+    """Polls url until it answers 200 and returns the seconds waited."""
+    started_at = time.perf_counter()
+    while time.perf_counter() - started_at < timeout:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"Server exited with status {process.returncode}")
+        try:
+            with urllib.request.urlopen(url, timeout=1) as response:
+                if response.status == 200:
+                    return time.perf_counter() - started_at
+        except (OSError, urllib.error.URLError):
+            pass
+        time.sleep(0.05)
+    raise TimeoutError(f"{url} was not healthy after {timeout}s")
+
+
+def timed_request(target, base_url):
+    """Times the request a user makes first: the page for the UI, a turn for the API."""
+    if target == "ui":
+        request = urllib.request.Request(base_url)
+    else:
+        request = urllib.request.Request(
+            f"{base_url}/v1/answer",
+            data=json.dumps({"prompt": "When is the library open?"}).encode(),
+            headers={"Content-Type": "application/json"},
+            method="POST",
+        )
+    started_at = time.perf_counter()
+    with urllib.request.urlopen(request, timeout=60) as response:
+        response.read()
+    return time.perf_counter() - started_at
+
+
+def start_local(target, port):
+    env = {**os.environ, "METRICS_FORMAT": "json", "API_PORT": str(port)}
+    env.pop("INFERENCE_API_URL", None)
+    if target == "ui":
+        command = [
+            sys.executable,
+            "-m",
+            "streamlit",
+            "run",
+            os.path.join(APP_DIR, "streamlit_app.py"),
+            f"--server.port={port}",
+            "--server.headless=true",
+            "--browser.gatherUsageStats=false",
+        ]
+    else:
+        command = [sys.executable, "-c", FAKE_API_SERVER]
+    return subprocess.Popen(
+        command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+
+
+def start_container(target, image, port):
+    command = ["docker", "run", "-d", "--rm", "-p", f"{port}:{CONTAINER_PORTS[target]}"]
+    if target == "api":
+        command += ["-e", "HEALTHCHECK_URL=http://localhost:8080/health", image]
+        command += ["python", "api_server.py"]
+    else:
+        command.append(image)
+    return subprocess.run(command, check=True, capture_output=True, text=True).stdout.strip()
+
+
+def image_size(image):
+    output = subprocess.run(
+        ["docker", "image", "inspect", "--format", "{{.Size}}", image],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return int(output.strip())
+
+
+def measure(target, image=None):
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    started_at = time.perf_counter()
+    if image:
+        container_id = start_container(target, image, port)
+        process = None
+    else:
+        process = start_local(target, port)
+    try:
+        wait_until_healthy(f"{base_url}{HEALTH_PATHS[target]}", process)
+        result = {"target": target, "time_to_healthy": time.perf_counter() - started_at}
+        # A containerised API would call Bedrock itself, so only startup is timed
+        if not (image and target == "api"):
+            result["first_request"] = timed_request(target, base_url)
+            result["second_request"] = timed_request(target, base_url)
+        return result
+    finally:
+        if image:
+            subprocess.run(["docker", "stop", container_id], capture_output=True)
+        else:
+            process.terminate()
+            process.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--target", choices=["ui", "api", "both"], default="both")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--image", help="Benchmark containers from this Docker image")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON lines")
+    args = parser.parse_args()
+
+    if args.image:
+        size_mb = image_size(args.image) / 2**20
+        if args.json:
+            print(json.dumps({"image": args.image, "size_mb": round(size_mb, 1)}))
+        else:
+            print(f"image {args.image}: {size_mb:.1f}MB")
+
+    targets = ["ui", "api"] if args.target == "both" else [args.target]
+    for target in targets:
+        runs = [measure(target, args.image) for _ in range(args.runs)]
+        summary = {"target": target, "runs": args.runs}
+        for name in ("time_to_healthy", "first_request", "second_request"):
+            values = [run[name] for run in runs if name in run]
+            if values:
+                summary[name] = statistics.median(values)
+        if args.json:
+            print(json.dumps(summary))
+        else:
+            print(
+                f"{target:>4}: healthy in {summary['time_to_healthy']:.2f}s"
+                + "".join(
+                    f", {name.replace('_', ' ')} {summary[name]:.3f}s"
+                    for name in ("first_request", "second_request")
+                    if name in summary
+                )
+                + f" (median of {args.runs})"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Rerun cost of the Streamlit transcript as a chat grows.
+
+Loads conversations of each requested length into the app through
+streamlit.testing AppTest and reports the median time of a rerun, the number
+of chat messages rendered and the markdown bytes sent for them, once with the
+paged transcript and once rendering every message (TRANSCRIPT_PAGE_TURNS=0).
+No AWS access is needed.
+
+    python benchmarks/bench_transcript.py
+    python benchmarks/bench_transcript.py --turns 10 100 1000 --reruns 10
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+APP_DIR = os.path.join(os.path.dirname(__file__), "..", "assets", "streamlit")
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, os.path.dirname(__file__))
+
+ANSWER = (
+    "The campus library is open from 8am to midnight on weekdays and from 10am "
+    "to 8pm on weekends. During exam weeks it stays open 24 hours. Thank You"
+)
+
+
+def build_history(turns):
+    from bedrock_streaming import format_citations
+    from history_store import HistoryStore
+
+    store = HistoryStore(max_messages=turns * 2)
+    conversation = store.create()
+    sources = format_citations(
+        [f"s3://campus-docs/library/page-{i}.pdf" for i in range(5)]
+    )
+    for turn in range(turns):
+        store.add_message(conversation.id, "user", f"When is the library open? ({turn})")
+        answer = f"{ANSWER} ({turn})"
+        store.add_message(conversation.id, "assistant", answer, f"\n{answer}\n\n{sources}\n")
+    return store, conversation.id
+
+
+def measure(turns, page_turns, reruns):
+    from streamlit.testing.v1 import AppTest
+
+    os.environ["TRANSCRIPT_PAGE_TURNS"] = str(page_turns)
+    store, conversation_id = build_history(turns)
+    app = AppTest.from_file(os.path.join(APP_DIR, "streamlit_app.py"), default_timeout=120)
+    app.session_state["history_store"] = store
+    app.session_state["conversation_id"] = conversation_id
+    app.run()
+    timings = []
+    for _ in range(reruns):
+        started_at = time.perf_counter()
+        app.run()
+        timings.append(time.perf_counter() - started_at)
+    if app.exception:
+        raise RuntimeError(app.exception[0].message)
+    messages = app.chat_message
+    payload = sum(
+        len(element.value.encode("utf-8"))
+        for message in messages
+        for element in message.markdown
+    )
+    return {
+        "turns": turns,
+        "paged": bool(page_turns),
+        "rerun_p50": statistics.median(timings),
+        "rendered_messages": len(messages),
+        "markdown_kb": payload / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--turns", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--page-turns", type=int, default=20)
+    parser.add_argument("--reruns", type=int, default=5)
+    parser.add_argument("--json", action="store_true", help="Print results as JSON lines")
+    args = parser.parse_args()
+
+    os.environ.setdefault("METRICS_FORMAT", "json")
+    if not args.json:
+        print(f"{'turns':>6} {'transcript':>10} {'rerun p50':>10} {'messages':>9} {'markdown':>10}")
+    for turns in args.turns:
+        for page_turns in (args.page_turns, 0):
+            result = measure(turns, page_turns, args.reruns)
+            if args.json:
+                print(json.dumps(result))
+            else:
+                print(
+                    f"{turns:>6} {'paged' if result['paged'] else 'full':>10} "
+                    f"{result['rerun_p50'] * 1000:>8.1f}ms {result['rendered_messages']:>9} "
+                    f"{result['markdown_kb']:>8.1f}KB"
+                )
+
+
+if __name__ == "__main__":
+    main()
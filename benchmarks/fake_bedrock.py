@@ -0,0 +1,279 @@
+"""
+Local stand-ins for the bedrock-runtime and bedrock-agent-runtime clients.
+
+The fakes answer every call after a configurable latency, stream responses in
+chunks after a configurable time to first token and return the same shapes as
+boto3, so the app can be exercised and benchmarked without network access.
+They can also be told to throttle, raising the ThrottlingException Bedrock
+returns when a quota is exceeded, and given a latency tail, so fakes installed
+for several regions can stand in for a slow and a fast endpoint.
+"""
+
+import io
+import json
+import random
+import re
+import threading
+import time
+import uuid
+
+ANSWER = (
+    "The campus library is open from 8am to midnight on weekdays and from 10am "
+    "to 8pm on weekends. During exam weeks it stays open 24 hours. Thank You"
+)
+CACHE_POINT = {"cachePoint": {"type": "default"}}
+# Words the fake embedding model treats as meaning the same, and words it
+# ignores, so reworded questions embed close together as with a real model
+SYNONYMS = {"what": "when", "time": "when", "shut": "closed"}
+FILLER = frozenset("a an the is are am i do does can could on at in to of please".split())
+
+
+def fake_embedding(text, dimensions=1024):
+    """
+    Sums a fixed random vector per word, so questions sharing most of their
+    meaningful words have a high cosine similarity.
+    """
+    vector = [0.0] * dimensions
+    for word in re.findall(r"\w+", text.lower()):
+        word = SYNONYMS.get(word, word)
+        if word in FILLER:
+            continue
+        word_vector = random.Random(word)
+        for i in range(dimensions):
+            vector[i] += word_vector.gauss(0.0, 1.0)
+    return vector
+
+
+def _sleep(seconds):
+    if seconds > 0:
+        time.sleep(seconds)
+
+
+class Throttling:
+    """Makes a fake raise ThrottlingException on command."""
+
+    def throttle(self, count=None, rate=0.0):
+        """
+        Throttles the next count calls, or each call with probability rate.
+        """
+        with self._throttle_lock:
+            self._throttle_count = count or 0
+            self._throttle_rate = rate
+
+    def _maybe_throttle(self, operation):
+        with self._throttle_lock:
+            throttled = self._throttle_count > 0 or random.random() < self._throttle_rate
+            if self._throttle_count > 0:
+                self._throttle_count -= 1
+            if throttled:
+                self.throttled += 1
+        if throttled:
+            from botocore.exceptions import ClientError
+
+            raise ClientError(
+                {"Error": {"Code": "ThrottlingException", "Message": "Too many requests"}},
+                operation,
+            )
+
+    def _init_throttling(self):
+        self.throttled = 0
+        self._throttle_count = 0
+        self._throttle_rate = 0.0
+        self._throttle_lock = threading.Lock()
+
+
+class FakeBedrockRuntime(Throttling):
+    """Stand-in for boto3.client("bedrock-runtime")."""
+
+    def __init__(
+        self,
+        latency=1.0,
+        time_to_first_token=0.3,
+        chunks=20,
+        answer=ANSWER,
+        slow_rate=0.0,
+        slow_latency=0.0,
+    ):
+        self.latency = latency
+        self.time_to_first_token = time_to_first_token
+        self.chunks = chunks
+        self.answer = answer
+        # With probability slow_rate a call waits slow_latency extra seconds
+        # before answering or sending its first event
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.calls = 0
+        self._lock = threading.Lock()
+        self._prompt_cache = set()
+        self._init_throttling()
+
+    def _count(self, operation):
+        with self._lock:
+            self.calls += 1
+        self._maybe_throttle(operation)
+
+    def _tail(self):
+        return self.slow_latency if random.random() < self.slow_rate else 0.0
+
+    def _usage(self, body):
+        request = json.loads(body)
+        input_tokens = max(1, len(json.dumps(request)) // 4)
+        usage = {"inputTokens": input_tokens, "outputTokens": len(self.answer) // 4}
+        system = request.get("system", [])
+        if CACHE_POINT in system:
+            # Like Bedrock's prompt cache: the prefix before the cache point is
+            # written on first use and read afterwards, and not counted in
+            # inputTokens
+            prefix = json.dumps(system[: system.index(CACHE_POINT)])
+            cached = len(prefix) // 4
+            with self._lock:
+                hit = prefix in self._prompt_cache
+                self._prompt_cache.add(prefix)
+            usage["inputTokens"] = max(1, input_tokens - cached)
+            usage["cacheReadInputTokenCount"] = cached if hit else 0
+            usage["cacheWriteInputTokenCount"] = 0 if hit else cached
+        return usage
+
+    def invoke_model(self, body, modelId, **kwargs):
+        self._count("InvokeModel")
+        if "embed" in modelId:
+            request = json.loads(body)
+            embedding = fake_embedding(request["inputText"], request.get("dimensions", 1024))
+            return {"body": io.BytesIO(json.dumps({"embedding": embedding}).encode())}
+        _sleep(self.latency + self._tail())
+        payload = {
+            "output": {"message": {"role": "assistant", "content": [{"text": self.answer}]}},
+            "usage": self._usage(body),
+        }
+        return {"body": io.BytesIO(json.dumps(payload).encode())}
+
+    def invoke_model_with_response_stream(self, body, modelId, **kwargs):
+        self._count("InvokeModelWithResponseStream")
+        return {"body": self._stream(body)}
+
+    def _stream(self, body):
+        _sleep(self.time_to_first_token + self._tail())
+        pieces = _split(self.answer, self.chunks)
+        delay = max(0.0, self.latency - self.time_to_first_token) / max(1, len(pieces))
+        for i, piece in enumerate(pieces):
+            if i:
+                _sleep(delay)
+            event = {"contentBlockDelta": {"delta": {"text": piece}, "contentBlockIndex": 0}}
+            yield {"chunk": {"bytes": json.dumps(event).encode()}}
+        metadata = {"metadata": {"usage": self._usage(body)}}
+        yield {"chunk": {"bytes": json.dumps(metadata).encode()}}
+
+
+class FakeBedrockAgentRuntime(Throttling):
+    """Stand-in for boto3.client("bedrock-agent-runtime")."""
+
+    def __init__(
+        self,
+        latency=1.5,
+        retrieval_latency=0.2,
+        time_to_first_token=0.5,
+        chunks=20,
+        passages=5,
+        answer=ANSWER,
+    ):
+        self.latency = latency
+        self.retrieval_latency = retrieval_latency
+        self.time_to_first_token = time_to_first_token
+        self.chunks = chunks
+        self.passages = passages
+        self.answer = answer
+        self._init_throttling()
+
+    def _results(self, count):
+        # Pairs of consecutive chunks from the same document, overlapping by
+        # CHUNK_OVERLAP characters as Knowledge Base chunking does
+        return [
+            {
+                "content": {"text": _chunk(i // 2, i % 2)},
+                "location": {
+                    "type": "S3",
+                    "s3Location": {"uri": f"s3://campus-docs/library/page-{i // 2}.pdf"},
+                },
+                "score": 0.9 - i * 0.05,
+                "metadata": {"x-amz-bedrock-kb-document-page-number": float(i // 2)},
+            }
+            for i in range(count)
+        ]
+
+    def _citation(self):
+        return {
+            "generatedResponsePart": {"textResponsePart": {"text": self.answer}},
+            "retrievedReferences": self._results(2),
+        }
+
+    def retrieve(self, knowledgeBaseId, retrievalQuery, retrievalConfiguration=None, **kwargs):
+        self._maybe_throttle("Retrieve")
+        _sleep(self.retrieval_latency)
+        count = (retrievalConfiguration or {}).get("vectorSearchConfiguration", {}).get(
+            "numberOfResults", self.passages
+        )
+        return {"retrievalResults": self._results(count)}
+
+    def retrieve_and_generate(self, input, retrieveAndGenerateConfiguration, sessionId=None, **kwargs):
+        self._maybe_throttle("RetrieveAndGenerate")
+        _sleep(self.retrieval_latency + self.latency)
+        return {
+            "sessionId": sessionId or uuid.uuid4().hex,
+            "output": {"text": self.answer},
+            "citations": [self._citation()],
+        }
+
+    def retrieve_and_generate_stream(
+        self, input, retrieveAndGenerateConfiguration, sessionId=None, **kwargs
+    ):
+        self._maybe_throttle("RetrieveAndGenerateStream")
+        return {"sessionId": sessionId or uuid.uuid4().hex, "stream": self._stream()}
+
+    def _stream(self):
+        _sleep(self.retrieval_latency + self.time_to_first_token)
+        pieces = _split(self.answer, self.chunks)
+        delay = max(0.0, self.latency - self.time_to_first_token) / max(1, len(pieces))
+        for i, piece in enumerate(pieces):
+            if i:
+                _sleep(delay)
+            yield {"output": {"text": piece}}
+        yield {"citation": self._citation()}
+
+
+CHUNK_SIZE = 600
+CHUNK_OVERLAP = 120
+
+
+TOPICS = ["library opening hours", "exam week study rooms", "printing credits",
+          "borrowing laptops", "late returns", "group room bookings"]
+
+
+def _chunk(document, index):
+    topic = TOPICS[document % len(TOPICS)]
+    text = " ".join(
+        f"Section {n} covers {topic}, rule {n * 7 + document} of the {topic} policy."
+        for n in range(30)
+    )
+    start = index * (CHUNK_SIZE - CHUNK_OVERLAP)
+    return text[start : start + CHUNK_SIZE]
+
+
+def _split(text, chunks):
+    size = max(1, len(text) // max(1, chunks))
+    return [text[i : i + size] for i in range(0, len(text), size)]
+
+
+def install(runtime=None, agent=None, regions=None):
+    """
+    Registers the fakes with bedrock_clients so the app uses them instead of AWS.
+    regions maps other region names to bedrock-runtime fakes for hedged calls.
+    """
+    from bedrock_clients import set_client
+
+    runtime = runtime or FakeBedrockRuntime()
+    agent = agent or FakeBedrockAgentRuntime()
+    set_client("bedrock-runtime", runtime)
+    set_client("bedrock-agent-runtime", agent)
+    for region_name, regional_runtime in (regions or {}).items():
+        set_client("bedrock-runtime", regional_runtime, region_name=region_name)
+    return runtime, agent
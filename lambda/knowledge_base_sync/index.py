@@ -1,36 +1,424 @@
 import json
 import logging
 import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 import boto3
+from botocore.exceptions import ClientError
+
+from manifest import (
+    diff_manifests,
+    has_changes,
+    load_manifest,
+    s3_manifest,
+    save_manifest,
+)
 
 logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+ACTIVE_JOB_STATUSES = ["STARTING", "IN_PROGRESS", "STOPPING"]
+FINAL_JOB_STATUSES = {"COMPLETE", "FAILED", "STOPPED"}
+
+SYNC_EVENT_SOURCE = "bedrock-knowledge-bot.sync"
+
+# Errors worth retrying when many jobs are started at once
+RETRYABLE_ERROR_CODES = {
+    "ThrottlingException",
+    "TooManyRequestsException",
+    "ServiceQuotaExceededException",
+    "ConflictException",
+}
+
+
+def with_retries(fn, *args, max_attempts=6, base_delay=1.0, max_delay=30.0, **kwargs):
+    """
+    Calls fn, retrying throttling and quota errors with exponential backoff and
+    full jitter so parallel syncs spread out instead of retrying in lockstep.
+    """
+    for attempt in range(max_attempts):
+        try:
+            return fn(*args, **kwargs)
+        except ClientError as e:
+            code = e.response.get("Error", {}).get("Code")
+            if code not in RETRYABLE_ERROR_CODES or attempt == max_attempts - 1:
+                raise
+            delay = random.uniform(0, min(max_delay, base_delay * 2**attempt))
+            logger.info(f"{code} from {fn.__name__}, retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+
+def publish_sync_generation(ingestion_job_id):
+    """
+    Records the latest completed ingestion job so the app can invalidate
+    cached answers.
+    """
+    parameter_name = os.environ.get("SYNC_GENERATION_PARAMETER")
+    if not parameter_name:
+        return
+    boto3.client("ssm").put_parameter(
+        Name=parameter_name,
+        Value=ingestion_job_id,
+        Type="String",
+        Overwrite=True,
+    )
+
+
+def publish_sync_completed(reports):
+    """
+    Announces the data sources that finished syncing on the default event bus,
+    so follow-up work such as pre-warming the answer cache can start.
+    """
+    synced = [report for report in reports if report["status"] == "success"]
+    if not synced:
+        return
+    try:
+        boto3.client("events").put_events(
+            Entries=[
+                {
+                    "Source": SYNC_EVENT_SOURCE,
+                    "DetailType": "Knowledge Base Sync Completed",
+                    "Detail": json.dumps({"targets": synced}, default=str),
+                }
+            ]
+        )
+    except ClientError as e:
+        # The sync itself succeeded; only the follow-up work is skipped
+        logger.warning(f"Could not publish sync completed event: {e}")
+
+
+def active_ingestion_job(client, knowledge_base_id, data_source_id):
+    """
+    Returns the id of an ingestion job that is still running, if any.
+    """
+    response = with_retries(
+        client.list_ingestion_jobs,
+        knowledgeBaseId=knowledge_base_id,
+        dataSourceId=data_source_id,
+        filters=[
+            {"attribute": "STATUS", "operator": "EQ", "values": ACTIVE_JOB_STATUSES}
+        ],
+        maxResults=1,
+    )
+    jobs = response.get("ingestionJobSummaries", [])
+    return jobs[0]["ingestionJobId"] if jobs else None
+
+
+def data_source_location(client, knowledge_base_id, data_source_id):
+    """
+    Returns the S3 bucket and inclusion prefixes of the data source, or
+    (None, None) for data sources that are not backed by S3.
+    """
+    data_source = with_retries(
+        client.get_data_source,
+        knowledgeBaseId=knowledge_base_id,
+        dataSourceId=data_source_id,
+    )["dataSource"]
+    s3_configuration = data_source["dataSourceConfiguration"].get(
+        "s3Configuration"
+    )
+    if not s3_configuration:
+        return None, None
+    bucket = s3_configuration["bucketArn"].split(":::", 1)[1]
+    return bucket, s3_configuration.get("inclusionPrefixes")
+
+
+def manifest_key(knowledge_base_id, data_source_id):
+    return f"manifests/{knowledge_base_id}/{data_source_id}.json"
+
+
+def pending_manifest_key(knowledge_base_id, data_source_id, ingestion_job_id):
+    return f"pending/{knowledge_base_id}/{data_source_id}/{ingestion_job_id}.json"
+
+
+def sync_data_source(
+    bedrock,
+    s3,
+    knowledge_base_id,
+    data_source_id,
+    force=False,
+    changed_buckets=None,
+):
+    """
+    Starts an ingestion job for the data source if its contents changed since
+    the last successful sync and returns a status report, "started" with the
+    job id when it did. When changed_buckets is given, data sources in other
+    buckets are skipped.
+    """
+    report = {
+        "knowledgeBaseId": knowledge_base_id,
+        "dataSourceId": data_source_id,
+    }
+
+    running_job_id = active_ingestion_job(bedrock, knowledge_base_id, data_source_id)
+    if running_job_id:
+        logger.info(f"Ingestion job {running_job_id} is already running")
+        return {**report, "status": "skipped", "reason": "job_in_progress"}
+
+    state_bucket = os.environ.get("SYNC_STATE_BUCKET")
+    manifest = None
+    bucket, prefixes = data_source_location(bedrock, knowledge_base_id, data_source_id)
+    if changed_buckets and bucket not in changed_buckets:
+        return {**report, "status": "skipped", "reason": "unaffected"}
+    if bucket and state_bucket:
+        manifest = s3_manifest(s3, bucket, prefixes)
+        diff = diff_manifests(
+            load_manifest(s3, state_bucket, manifest_key(knowledge_base_id, data_source_id)),
+            manifest,
+        )
+        report["changes"] = {kind: len(keys) for kind, keys in diff.items()}
+        if not has_changes(diff) and not force:
+            logger.info(f"No changes in data source {data_source_id}, skipping sync")
+            return {**report, "status": "skipped", "reason": "no_changes"}
+
+    response = with_retries(
+        bedrock.start_ingestion_job,
+        dataSourceId=data_source_id,
+        knowledgeBaseId=knowledge_base_id,
+    )
+    logger.info(
+        f"start_ingestion_job response: {json.dumps(response, indent=4, default=str)}"
+    )
+    ingestion_job_id = response["ingestionJob"]["ingestionJobId"]
+    report.update({"status": "started", "ingestionJobId": ingestion_job_id})
+    # The manifest is only recorded once the job succeeds, so a failed job is
+    # retried on the next run; until then it waits next to the recorded one
+    if manifest is not None:
+        report["pendingManifestKey"] = pending_manifest_key(
+            knowledge_base_id, data_source_id, ingestion_job_id
+        )
+        save_manifest(s3, state_bucket, report["pendingManifestKey"], manifest)
+    return report
+
+
+def check_ingestion_job(bedrock, s3, report):
+    """
+    Returns the report of a started ingestion job, updated with its outcome
+    once it has finished. A successful job's pending manifest becomes the one
+    the next run compares against.
+    """
+    job = with_retries(
+        bedrock.get_ingestion_job,
+        knowledgeBaseId=report["knowledgeBaseId"],
+        dataSourceId=report["dataSourceId"],
+        ingestionJobId=report["ingestionJobId"],
+    )["ingestionJob"]
+    if job["status"] not in FINAL_JOB_STATUSES:
+        return report
+    report = {
+        **report,
+        "status": "success" if job["status"] == "COMPLETE" else job["status"].lower(),
+        "statistics": job.get("statistics", {}),
+    }
+    if job.get("startedAt") and job.get("updatedAt"):
+        report["durationSeconds"] = (job["updatedAt"] - job["startedAt"]).total_seconds()
+    pending_key = report.pop("pendingManifestKey", None)
+    if pending_key:
+        state_bucket = os.environ.get("SYNC_STATE_BUCKET")
+        if job["status"] == "COMPLETE":
+            save_manifest(
+                s3,
+                state_bucket,
+                manifest_key(report["knowledgeBaseId"], report["dataSourceId"]),
+                load_manifest(s3, state_bucket, pending_key),
+            )
+        s3.delete_object(Bucket=state_bucket, Key=pending_key)
+    return report
+
+
+def needs_resync(report):
+    """
+    Whether the data source may have changed again since its last sync
+    started: its job just succeeded, or another job was running when the
+    change arrived.
+    """
+    return report["status"] == "success" or report.get("reason") == "job_in_progress"
+
+
+def summarize(reports, started_at):
+    statuses = [report["status"] for report in reports]
+    return {
+        "status": "error" if "error" in statuses else "success",
+        "summary": {status: statuses.count(status) for status in set(statuses)},
+        "resync": any(needs_resync(report) for report in reports),
+        "durationSeconds": round(time.monotonic() - started_at, 1),
+        "targets": reports,
+    }
+
+
+def complete_sync(reports):
+    """
+    Publishes a sync once none of its ingestion jobs is running: the new
+    generation for the app, once, and the event for follow-up work.
+    """
+    if any(report["status"] == "started" for report in reports):
+        return
+    synced = [report for report in reports if report["status"] == "success"]
+    if synced:
+        publish_sync_generation(synced[-1]["ingestionJobId"])
+    publish_sync_completed(reports)
+
+
+def sync_targets(event, client):
+    """
+    Returns the (knowledge base, data source) pairs to sync, taken from the
+    event's "targets", the SYNC_TARGETS environment variable or the single
+    KNOWLEDGE_BASE_ID/DATA_SOURCE_ID pair, in that order. A target without a
+    dataSourceId expands to every data source of its knowledge base.
+    """
+    targets = event.get("targets") or json.loads(os.environ.get("SYNC_TARGETS") or "[]")
+    if not targets:
+        targets = [
+            {
+                "knowledgeBaseId": os.environ.get("KNOWLEDGE_BASE_ID"),
+                "dataSourceId": os.environ.get("DATA_SOURCE_ID"),
+            }
+        ]
+
+    pairs = []
+    for target in targets:
+        knowledge_base_id = target["knowledgeBaseId"]
+        if target.get("dataSourceId"):
+            pairs.append((knowledge_base_id, target["dataSourceId"]))
+            continue
+        paginator = client.get_paginator("list_data_sources")
+        for page in paginator.paginate(knowledgeBaseId=knowledge_base_id):
+            for data_source in page["dataSourceSummaries"]:
+                pairs.append((knowledge_base_id, data_source["dataSourceId"]))
+    return list(dict.fromkeys(pairs))
+
+
+def start_syncs(event, client, s3):
+    """
+    Starts an ingestion job for each sync target that needs one and returns
+    the aggregated report.
+    """
+    changed_buckets = event.get("changedBuckets")
+    if event.get("source") == "aws.s3":
+        changed_buckets = [event.get("detail", {}).get("bucket", {}).get("name")]
+
+    def sync(pair):
+        knowledge_base_id, data_source_id = pair
+        try:
+            return sync_data_source(
+                client,
+                s3,
+                knowledge_base_id,
+                data_source_id,
+                force=bool(event.get("force")),
+                changed_buckets=changed_buckets,
+            )
+        except Exception as e:
+            logger.exception(f"Sync of {knowledge_base_id}/{data_source_id} failed")
+            return {
+                "knowledgeBaseId": knowledge_base_id,
+                "dataSourceId": data_source_id,
+                "status": "error",
+                "message": str(e),
+            }
+
+    pairs = sync_targets(event, client)
+    concurrency = int(os.environ.get("SYNC_CONCURRENCY", "4"))
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(pairs)))) as pool:
+        return list(pool.map(sync, pairs))
+
+
+def check_syncs(event, client, s3):
+    """
+    Checks the ingestion jobs still running in the report of an earlier
+    invocation and returns it with the finished ones updated.
+    """
+
+    def check(report):
+        if report["status"] != "started":
+            return report
+        try:
+            return check_ingestion_job(client, s3, report)
+        except Exception as e:
+            logger.exception(f"Checking ingestion job {report['ingestionJobId']} failed")
+            return {**report, "status": "error", "message": str(e)}
+
+    return [check(report) for report in event["targets"]]
+
+
+def changed_buckets(records):
+    """
+    Returns the buckets named in a batch of S3 change events delivered
+    through SQS, in the order they first appear.
+    """
+    buckets = {}
+    for record in records:
+        detail = json.loads(record["body"]).get("detail", {})
+        bucket = detail.get("bucket", {}).get("name")
+        if bucket:
+            buckets[bucket] = None
+    return list(buckets)
+
+
+def changes_handler(event, context):
+    """
+    Lambda function that starts one sync for a batch of S3 change events.
+
+    The change rule sends object events to an SQS queue, and the queue
+    delivers them in batches collected over a batching window, so a burst of
+    uploads starts a single state machine execution instead of one per
+    object.
+    """
+    buckets = changed_buckets(event.get("Records", []))
+    if not buckets:
+        return {"started": False}
+    response = boto3.client("stepfunctions").start_execution(
+        stateMachineArn=os.environ["SYNC_STATE_MACHINE_ARN"],
+        input=json.dumps({"changedBuckets": buckets}),
+    )
+    logger.info(f"Started sync {response['executionArn']} for {', '.join(buckets)}")
+    return {"started": True, "changedBuckets": buckets}
 
 
 def handler(event, context):
     """
-    Lambda function to sync a single knowledge base data source.
-    Reads data source configuration from environment variable.
+    Lambda function to sync knowledge base data sources.
+    Reads the sync targets from the event or environment variables.
+
+    Runs from the sync state machine, started on a schedule and on S3 change
+    events. Each data source is synced in parallel, up to SYNC_CONCURRENCY at
+    a time, and skipped when a job is already running or it is unchanged
+    since the last successful sync; pass {"force": true} to sync regardless.
+    Returns one aggregated report, in which started jobs have the status
+    "started". The state machine passes it back with {"action": "check"}
+    until none is, so a job may outlast the Lambda timeout; the invocation
+    that sees the last one finish records the manifests and announces the
+    sync. When a job succeeded or a data source was skipped because another
+    job was running, the report has "resync" set and the state machine runs
+    the sync again for the same targets, until no data source has changes
+    left, so documents changed during a job are not left for the weekly run.
     """
 
-    logging.info(f"Received event: {json.dumps(event, indent=4, default=str)}")
-    # Get data source from environment variable
-    data_source_id = os.environ.get("DATA_SOURCE_ID")
-    knowledge_base_id = os.environ.get("KNOWLEDGE_BASE_ID")
+    logger.info(f"Received event: {json.dumps(event, indent=4, default=str)}")
 
     # Initialize Bedrock client
     client = boto3.client("bedrock-agent")
+    s3 = boto3.client("s3")
 
+    started_at = time.monotonic()
     try:
-        response = client.start_ingestion_job(
-            dataSourceId=data_source_id,
-            knowledgeBaseId=knowledge_base_id,
-        )
-        logging.info(
-            f"start_ingestion_job response: {json.dumps(response, indent=4, default=str)}"
-        )
-        result = {"status": "success", "message": "Ingestion job started"}
+        if event.get("action") == "check":
+            reports = check_syncs(event, client, s3)
+        else:
+            reports = start_syncs(event, client, s3)
+        result = summarize(reports, started_at)
+        logger.info(f"Sync report: {json.dumps(result, default=str)}")
+        complete_sync(reports)
     except Exception as e:
-        result = {"status": "error", "message": str(e)}
+        logger.exception("Knowledge base sync failed")
+        result = {
+            "status": "error",
+            "message": str(e),
+            "summary": {},
+            "resync": False,
+            "targets": [],
+        }
 
-    return {"statusCode": 200, "body": json.dumps(result)}
+    return result
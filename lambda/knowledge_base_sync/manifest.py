@@ -0,0 +1,70 @@
+import json
+import os
+
+
+def s3_manifest(s3_client, bucket, prefixes=None):
+    """
+    Lists the objects under the given prefixes and returns a {key: etag} manifest.
+    Works with any client exposing the list_objects_v2 paginator, e.g. moto.
+    """
+    manifest = {}
+    paginator = s3_client.get_paginator("list_objects_v2")
+    for prefix in prefixes or [""]:
+        for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+            for obj in page.get("Contents", []):
+                manifest[obj["Key"]] = obj["ETag"].strip('"')
+    return manifest
+
+
+def directory_manifest(path):
+    """
+    Returns a {relative path: "mtime-size"} manifest for a local directory, so
+    the diffing logic can be exercised without S3.
+    """
+    manifest = {}
+    for root, _, files in os.walk(path):
+        for name in files:
+            full_path = os.path.join(root, name)
+            stat = os.stat(full_path)
+            key = os.path.relpath(full_path, path).replace(os.sep, "/")
+            manifest[key] = f"{stat.st_mtime_ns}-{stat.st_size}"
+    return manifest
+
+
+def diff_manifests(previous, current):
+    """
+    Compares two manifests and returns the added, modified and deleted keys.
+    """
+    return {
+        "added": sorted(current.keys() - previous.keys()),
+        "modified": sorted(
+            key
+            for key in current.keys() & previous.keys()
+            if current[key] != previous[key]
+        ),
+        "deleted": sorted(previous.keys() - current.keys()),
+    }
+
+
+def has_changes(diff):
+    return any(diff.values())
+
+
+def load_manifest(s3_client, bucket, key):
+    """
+    Loads the manifest recorded after the last successful sync, or {} if none.
+    """
+    try:
+        response = s3_client.get_object(Bucket=bucket, Key=key)
+    except s3_client.exceptions.NoSuchKey:
+        return {}
+    return json.loads(response["Body"].read())
+
+
+def save_manifest(s3_client, bucket, key, manifest):
+    s3_client.put_object(
+        Bucket=bucket,
+        Key=key,
+        Body=json.dumps(manifest, sort_keys=True).encode("utf-8"),
+        ContentType="application/json",
+    )
@@ -0,0 +1,29 @@
+import pytest
+
+
+@pytest.fixture
+def chat_service(monkeypatch):
+    """chat_service answering from the local Bedrock fakes with fresh caches."""
+    import bedrock_clients
+    import chat_service
+    import fake_bedrock
+
+    for getter in (
+        bedrock_clients.get_resilience_policy,
+        chat_service.get_answer_cache,
+        chat_service.get_answer_flights,
+        chat_service.get_retrieval_cache,
+        chat_service.get_model_router,
+        chat_service.get_request_engine,
+    ):
+        getter.cache_clear()
+    monkeypatch.setattr(chat_service, "KNOWLEDGE_BASE_ID", "kb")
+    monkeypatch.setattr(chat_service, "SYNC_GENERATION_PARAMETER", None)
+    fake_bedrock.install(
+        fake_bedrock.FakeBedrockRuntime(latency=0, time_to_first_token=0),
+        fake_bedrock.FakeBedrockAgentRuntime(
+            latency=0, retrieval_latency=0, time_to_first_token=0
+        ),
+    )
+    yield chat_service
+    chat_service.get_request_engine().shutdown()
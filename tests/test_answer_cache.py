@@ -0,0 +1,142 @@
+import pytest
+
+import answer_cache
+from answer_cache import AnswerCache, normalize_prompt
+from state_store import MemoryBackend, StateStore
+
+PARAMS = {
+    "knowledge_base_id": "kb",
+    "model_id": "amazon.nova-lite-v1:0",
+    "max_tokens": 200,
+    "temperature": 0.2,
+    "top_p": 0.2,
+}
+# Questions the fake embedder places close together or far apart
+EMBEDDINGS = {
+    "when is the library open": [1.0, 0.0, 0.0],
+    "what time does the library open": [0.95, 0.31, 0.0],
+    "where can i print": [0.0, 0.0, 1.0],
+}
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(answer_cache.time, "monotonic", clock)
+    return clock
+
+
+def embed(text):
+    return EMBEDDINGS[text]
+
+
+def test_answers_are_shared_by_trivially_different_prompts():
+    cache = AnswerCache()
+    cache.put("When is the library open?", "8am.", citations=["s3://docs/hours.pdf"], **PARAMS)
+    assert normalize_prompt("  WHEN is the  library open ") == "when is the library open"
+    assert cache.get("when is the library open", **PARAMS) == {
+        "answer": "8am.",
+        "citations": ["s3://docs/hours.pdf"],
+    }
+
+
+def test_answers_are_kept_apart_by_model_and_parameters():
+    cache = AnswerCache()
+    cache.put("When is the library open?", "8am.", **PARAMS)
+    assert cache.get("When is the library open?", **{**PARAMS, "model_id": "pro"}) is None
+    assert cache.get("When is the library open?", **{**PARAMS, "temperature": 0.9}) is None
+
+
+def test_entries_expire_after_the_ttl(clock):
+    cache = AnswerCache(ttl_seconds=60)
+    cache.put("When is the library open?", "8am.", **PARAMS)
+    clock.now += 60
+    assert cache.get("When is the library open?", **PARAMS) is not None
+    clock.now += 1
+    assert cache.get("When is the library open?", **PARAMS) is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = AnswerCache(max_entries=2)
+    cache.put("first", "1", **PARAMS)
+    cache.put("second", "2", **PARAMS)
+    cache.get("first", **PARAMS)
+    cache.put("third", "3", **PARAMS)
+    assert cache.get("second", **PARAMS) is None
+    assert cache.get("first", **PARAMS)["answer"] == "1"
+    assert cache.get("third", **PARAMS)["answer"] == "3"
+    assert cache.stats()["evictions"] == 1
+
+
+def test_similar_question_above_the_threshold_is_a_hit():
+    cache = AnswerCache(embed=embed, similarity_threshold=0.9)
+    cache.put("When is the library open?", "8am.", **PARAMS)
+    assert cache.get("What time does the library open?", **PARAMS)["answer"] == "8am."
+    assert cache.get("Where can I print?", **PARAMS) is None
+    assert cache.stats()["similar_hits"] == 1
+
+
+def test_similar_question_below_the_threshold_is_a_miss():
+    cache = AnswerCache(embed=embed, similarity_threshold=0.99)
+    cache.put("When is the library open?", "8am.", **PARAMS)
+    assert cache.get("What time does the library open?", **PARAMS) is None
+
+
+def test_similar_questions_only_match_within_the_same_parameters():
+    cache = AnswerCache(embed=embed, similarity_threshold=0.9)
+    cache.put("When is the library open?", "8am.", **PARAMS)
+    assert cache.get("What time does the library open?", **{**PARAMS, "model_id": "pro"}) is None
+
+
+def test_embedding_errors_fall_back_to_exact_matches():
+    def failing_embed(text):
+        raise RuntimeError("throttled")
+
+    cache = AnswerCache(embed=failing_embed, similarity_threshold=0.9)
+    cache.put("When is the library open?", "8am.", **PARAMS)
+    assert cache.get("When is the library open?", **PARAMS)["answer"] == "8am."
+    assert cache.get("What time does the library open?", **PARAMS) is None
+
+
+def test_invalidate_drops_every_entry():
+    cache = AnswerCache()
+    cache.put("When is the library open?", "8am.", **PARAMS)
+    cache.invalidate()
+    assert cache.get("When is the library open?", **PARAMS) is None
+
+
+def test_new_sync_generation_invalidates_the_cache(clock):
+    cache = AnswerCache(generation_check_seconds=60)
+    changed = []
+    cache.refresh_generation(lambda: "job-1", on_change=lambda: changed.append(1))
+    cache.put("When is the library open?", "8am.", **PARAMS)
+    clock.now += 30
+    cache.refresh_generation(lambda: "job-2", on_change=lambda: changed.append(1))
+    assert cache.get("When is the library open?", **PARAMS) is not None
+    clock.now += 30
+    cache.refresh_generation(lambda: "job-2", on_change=lambda: changed.append(1))
+    assert cache.get("When is the library open?", **PARAMS) is None
+    assert cache.generation == "job-2"
+    assert changed == [1]
+
+
+def test_answers_are_shared_through_the_state_store():
+    store = StateStore(MemoryBackend())
+    AnswerCache(store=store).put(
+        "When is the library open?", "8am.", latency=2.0, citations=["s3://docs/hours.pdf"], **PARAMS
+    )
+    other_task = AnswerCache(store=store)
+    assert other_task.get("When is the library open?", **PARAMS) == {
+        "answer": "8am.",
+        "citations": ["s3://docs/hours.pdf"],
+    }
+    assert other_task.stats()["shared_hits"] == 1
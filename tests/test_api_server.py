@@ -0,0 +1,144 @@
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+import api_server
+import fake_bedrock
+import pytest
+from tornado.tcpclient import TCPClient
+from tornado.testing import AsyncHTTPTestCase, gen_test
+
+
+def sse_events(body):
+    """Parses a server-sent events body into (event, data) pairs."""
+    events = []
+    for block in body.decode().strip().split("\n\n"):
+        kind, data = block.split("\n", 1)
+        data = json.loads(data.removeprefix("data: "))
+        events.append((kind.removeprefix("event: "), data))
+    return events
+
+
+class ApiServerTest(AsyncHTTPTestCase):
+    @pytest.fixture(autouse=True)
+    def fakes(self, chat_service, monkeypatch):
+        self.chat_service = chat_service
+        monkeypatch.setattr(chat_service, "COALESCE_WAIT_SECONDS", 5)
+        monkeypatch.setattr(api_server, "KNOWLEDGE_BASE_ID", "kb")
+
+    def get_app(self):
+        return api_server.make_app()
+
+    @property
+    def state(self):
+        return self._app.settings["state"]
+
+    def post(self, path, payload):
+        return self.fetch(
+            path, method="POST", body=json.dumps(payload), raise_error=False
+        )
+
+    def test_answer_returns_the_response_and_metrics(self):
+        response = self.post("/v1/answer", {"prompt": "When is the library open?"})
+
+        assert response.code == 200
+        payload = json.loads(response.body)
+        assert "library" in payload["response"]
+        assert payload["conversation"]["history"] == []
+        assert payload["metrics"]["pipeline"] == api_server.KB_PIPELINE
+        assert self.state["in_flight"] == 0
+
+    def test_stream_sends_events_ending_in_done(self):
+        response = self.post(
+            "/v1/answer/stream", {"prompt": "When is the library open?"}
+        )
+
+        assert response.code == 200
+        assert response.headers["Content-Type"] == "text/event-stream"
+        events = sse_events(response.body)
+        assert "text" in {kind for kind, _ in events}
+        kind, data = events[-1]
+        assert kind == "done"
+        assert "library" in data["response"]
+
+    def test_invalid_request_is_rejected(self):
+        response = self.post("/v1/answer", {"prompt": " "})
+
+        assert response.code == 400
+        assert json.loads(response.body) == {"error": "prompt is required"}
+
+    def test_request_over_capacity_gets_503(self):
+        self.state["in_flight"] = api_server.API_MAX_CONCURRENCY
+
+        response = self.post(
+            "/v1/answer/stream", {"prompt": "When is the library open?"}
+        )
+
+        assert response.code == 503
+        assert json.loads(response.body) == {"error": "busy"}
+        assert self.state["in_flight"] == api_server.API_MAX_CONCURRENCY
+
+    def test_health_reports_draining(self):
+        assert json.loads(self.fetch("/health").body) == {"status": "ok"}
+
+        self.state["draining"] = True
+
+        assert self.fetch("/health").code == 503
+
+    @gen_test(timeout=10)
+    async def test_client_disconnecting_mid_stream_cancels_the_turn(self):
+        # Slow enough that the turn is still streaming when the client leaves
+        fake_bedrock.install(
+            fake_bedrock.FakeBedrockRuntime(latency=3, time_to_first_token=0),
+            fake_bedrock.FakeBedrockAgentRuntime(
+                latency=3, retrieval_latency=0, time_to_first_token=0
+            ),
+        )
+        body = json.dumps({"prompt": "When is the library open?"}).encode()
+        stream = await TCPClient().connect("127.0.0.1", self.get_http_port())
+        await stream.write(
+            b"POST /v1/answer/stream HTTP/1.1\r\nHost: localhost\r\n"
+            + f"Content-Length: {len(body)}\r\n\r\n".encode()
+            + body
+        )
+        await stream.read_until(b"\n\n")
+        stream.close()
+
+        deadline = time.monotonic() + 2
+        while self.state["in_flight"] and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        assert self.state["in_flight"] == 0
+
+        # The cancelled turn no longer holds identical questions back
+        fake_bedrock.install(
+            fake_bedrock.FakeBedrockRuntime(latency=0, time_to_first_token=0),
+            fake_bedrock.FakeBedrockAgentRuntime(
+                latency=0, retrieval_latency=0, time_to_first_token=0
+            ),
+        )
+        started_at = time.perf_counter()
+        response = await self.http_client.fetch(
+            self.get_url("/v1/answer"), method="POST", body=body
+        )
+
+        payload = json.loads(response.body)
+        assert "library" in payload["response"]
+        assert not payload["metrics"]["coalesced"]
+        assert time.perf_counter() - started_at < 1
+
+
+def test_api_client_does_not_load_the_chat_pipeline():
+    app_dir = os.path.dirname(api_server.__file__)
+    subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import sys, api_client; "
+            "assert not {'boto3', 'numpy', 'chat_service'} & set(sys.modules)",
+        ],
+        cwd=app_dir,
+        check=True,
+    )
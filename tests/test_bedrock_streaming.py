@@ -0,0 +1,65 @@
+import time
+
+from bedrock_streaming import (
+    citation_locations,
+    format_citations,
+    location_citations,
+    stream_knowledge_base_response,
+    stream_model_response,
+)
+from fake_bedrock import ANSWER, FakeBedrockAgentRuntime, FakeBedrockRuntime
+
+BODY = {"messages": [{"role": "user", "content": [{"text": "When is the library open?"}]}]}
+
+
+def test_model_response_streams_text_then_usage():
+    client = FakeBedrockRuntime(latency=0, time_to_first_token=0, chunks=5)
+    events = list(stream_model_response(client, "amazon.nova-lite-v1:0", BODY))
+    kinds = [kind for kind, _ in events]
+    assert kinds[-1] == "usage" and set(kinds[:-1]) == {"text"}
+    assert len(kinds) > 2
+    assert "".join(value for kind, value in events if kind == "text") == ANSWER
+    assert events[-1][1]["inputTokens"] > 0
+
+
+def test_first_text_arrives_before_the_whole_answer():
+    client = FakeBedrockRuntime(latency=0.5, time_to_first_token=0.05, chunks=5)
+    started_at = time.perf_counter()
+    events = stream_model_response(client, "amazon.nova-lite-v1:0", BODY)
+    assert next(events)[0] == "text"
+    assert time.perf_counter() - started_at < 0.3
+    events.close()
+
+
+def test_knowledge_base_response_streams_session_text_and_citations():
+    client = FakeBedrockAgentRuntime(
+        latency=0, retrieval_latency=0, time_to_first_token=0, chunks=5
+    )
+    events = list(stream_knowledge_base_response(client, "Library hours?", {}, "session-1"))
+    assert events[0] == ("session", "session-1")
+    assert "".join(value for kind, value in events if kind == "text") == ANSWER
+    (citation,) = [value for kind, value in events if kind == "citation"]
+    assert citation_locations([citation]) == ["s3://campus-docs/library/page-0.pdf"]
+
+
+def test_nested_citation_payloads_are_unwrapped():
+    class Client:
+        def retrieve_and_generate_stream(self, **request):
+            assert "sessionId" not in request
+            inner = {"retrievedReferences": []}
+            return {"stream": [{"citation": {"citation": inner}}, {"guardrail": {"action": "NONE"}}]}
+
+    assert list(stream_knowledge_base_response(Client(), "Hi", {})) == [
+        ("citation", {"retrievedReferences": []})
+    ]
+
+
+def test_locations_are_deduplicated_and_survive_a_round_trip():
+    locations = ["s3://docs/a.pdf", "https://example.edu/hours"]
+    citations = location_citations(locations) + location_citations(locations[:1])
+    assert citation_locations(citations) == locations
+    assert format_citations(locations).splitlines()[-2:] == [
+        "1. s3://docs/a.pdf",
+        "2. https://example.edu/hours",
+    ]
+    assert format_citations([]) == ""
@@ -0,0 +1,156 @@
+import argparse
+import io
+import os
+import subprocess
+import sys
+import time
+
+import fake_bedrock
+import pytest
+from metrics import TurnMetrics
+from model_router import LITE_MODEL_ID, PRO_MODEL_ID
+
+
+def answer(chat_service, prompt, stream):
+    metrics = TurnMetrics(model_id="auto")
+    events = list(
+        chat_service.answer_events(
+            prompt, "auto", 200, 0.2, 0.2, metrics=metrics, stream=stream
+        )
+    )
+    return events[-1][1], metrics
+
+
+@pytest.mark.parametrize("stream", [True, False])
+def test_engine_admits_calls_under_the_routed_model(chat_service, stream):
+    response, metrics = answer(chat_service, "When is the library open?", stream)
+
+    assert "library" in response
+    assert metrics.model_id == LITE_MODEL_ID
+    assert set(chat_service.get_request_engine()._model_limits) == {
+        chat_service.RETRIEVAL_ENGINE_KEY,
+        LITE_MODEL_ID,
+    }
+
+
+@pytest.mark.parametrize("stream", [True, False])
+def test_fallback_runs_on_the_engine_under_the_larger_model(chat_service, stream):
+    fake_bedrock.install(
+        fake_bedrock.FakeBedrockRuntime(
+            latency=0, time_to_first_token=0, answer="I could not find an exact answer."
+        ),
+        fake_bedrock.FakeBedrockAgentRuntime(
+            latency=0, retrieval_latency=0, time_to_first_token=0
+        ),
+    )
+    _, metrics = answer(chat_service, "When is the library open?", stream)
+
+    assert metrics.fallback
+    assert metrics.model_id == PRO_MODEL_ID
+    assert PRO_MODEL_ID in chat_service.get_request_engine()._model_limits
+
+
+def test_sync_generation_is_read_in_the_stack_region(chat_service, monkeypatch):
+    from bedrock_clients import BEDROCK_REGION, set_client
+
+    class FakeSSM:
+        def get_parameter(self, Name):
+            return {"Parameter": {"Name": Name, "Value": "job-2"}}
+
+    stack_region = "eu-west-1" if BEDROCK_REGION != "eu-west-1" else "eu-central-1"
+    monkeypatch.setenv("AWS_REGION", stack_region)
+    monkeypatch.setattr(chat_service, "SYNC_GENERATION_PARAMETER", "/kb/generation")
+    set_client("ssm", FakeSSM(), region_name=stack_region)
+
+    assert chat_service.fetch_sync_generation() == "job-2"
+
+
+def test_follow_up_retrieval_includes_the_earlier_question(chat_service):
+    from bedrock_clients import get_client
+
+    agent = get_client("bedrock-agent-runtime")._client
+    queries = []
+    retrieve = agent.retrieve
+
+    def recording_retrieve(**kwargs):
+        queries.append(kwargs["retrievalQuery"]["text"])
+        return retrieve(**kwargs)
+
+    agent.retrieve = recording_retrieve
+    conversation = {
+        "history": [
+            {"role": "user", "text": "When is the library open?"},
+            {"role": "assistant", "text": "8am to midnight."},
+        ],
+        "bedrock_session_id": None,
+    }
+    list(
+        chat_service.answer_events(
+            "What about weekends?", "auto", 200, 0.2, 0.2, conversation=conversation
+        )
+    )
+
+    assert queries == ["When is the library open?\nWhat about weekends?"]
+
+
+def test_cached_answer_replays_its_citations(chat_service):
+    import batch_answer
+
+    args = argparse.Namespace(
+        api_url=None, retries=0, model_id="auto", max_tokens=200, temperature=0.2, top_p=0.2
+    )
+    first = batch_answer.answer_question(
+        {"id": "1", "question": "When is the library open?"}, args, batch_answer.RateLimiter(0)
+    )
+    second = batch_answer.answer_question(
+        {"id": "1", "question": "When is the library open?"}, args, batch_answer.RateLimiter(0)
+    )
+
+    assert first["citations"]
+    assert second["cache_hit"]
+    assert second["citations"] == first["citations"]
+
+
+def test_questions_are_read_from_s3_in_the_stack_region(monkeypatch):
+    import batch_answer
+    from bedrock_clients import BEDROCK_REGION, set_client
+
+    class FakeS3:
+        def get_object(self, Bucket, Key):
+            return {"Body": io.BytesIO(b'{"question": "When is the library open?"}\n')}
+
+    stack_region = "eu-west-1" if BEDROCK_REGION != "eu-west-1" else "eu-central-1"
+    monkeypatch.setenv("AWS_REGION", stack_region)
+    set_client("s3", FakeS3(), region_name=stack_region)
+
+    assert [item["question"] for item in batch_answer.read_questions("s3://bucket/faq.jsonl")] == [
+        "When is the library open?"
+    ]
+
+
+def test_closing_a_stream_mid_answer_releases_identical_questions(chat_service, monkeypatch):
+    monkeypatch.setattr(chat_service, "COALESCE_WAIT_SECONDS", 5)
+    events = chat_service.answer_events(
+        "When is the library open?", "auto", 200, 0.2, 0.2, stream=True
+    )
+    assert next(events)[0] != "done"
+    events.close()
+
+    started_at = time.perf_counter()
+    response, metrics = answer(chat_service, "When is the library open?", True)
+
+    assert "library" in response
+    assert not metrics.coalesced
+    assert time.perf_counter() - started_at < 1
+
+
+
+def test_importing_chat_service_does_not_load_numpy_without_a_faq_index():
+    app_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "assets", "streamlit")
+    env = {name: value for name, value in os.environ.items() if name != "FAQ_INDEX_URI"}
+    subprocess.run(
+        [sys.executable, "-c", "import sys, chat_service; assert 'numpy' not in sys.modules"],
+        cwd=app_dir,
+        env=env,
+        check=True,
+    )
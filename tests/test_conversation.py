@@ -0,0 +1,34 @@
+from conversation import build_message_window, retrieval_query
+
+
+def exchange(question, answer="Answer."):
+    return [{"role": "user", "text": question}, {"role": "assistant", "text": answer}]
+
+
+def test_first_question_is_searched_alone():
+    assert retrieval_query([], "When is the library open?") == "When is the library open?"
+
+
+def test_follow_up_is_searched_with_the_questions_before_it():
+    history = exchange("Where is the gym?") + exchange("When is the library open?")
+    assert retrieval_query(history, "What about weekends?", max_questions=1) == (
+        "When is the library open?\nWhat about weekends?"
+    )
+    assert retrieval_query(history, "What about weekends?", max_questions=2) == (
+        "Where is the gym?\nWhen is the library open?\nWhat about weekends?"
+    )
+
+
+def test_retrieval_query_skips_questions_over_budget():
+    history = exchange("x" * 1000)
+    assert retrieval_query(history, "And on Sundays?", budget_tokens=50) == "And on Sundays?"
+
+
+def test_message_window_summarizes_turns_that_do_not_fit():
+    history = exchange("Where is the pool?", "long " * 400) + exchange("Recent?", "Recent.")
+    texts = [m["content"][0]["text"] for m in build_message_window(history, "Next?", 100)]
+
+    assert texts[1:] == ["Recent.", "Next?"]
+    assert texts[0].startswith("Earlier in this conversation the user asked:")
+    assert "Where is the pool?" in texts[0]
+    assert texts[0].endswith("Recent?")
@@ -0,0 +1,106 @@
+import os
+
+import pytest
+
+from answer_cache import normalize_prompt
+from fake_bedrock import FakeBedrockRuntime, fake_embedding
+from faq_index import EMBEDDING_MODEL_ID, FaqIndex, FaqMatcher, write_index
+
+QUESTIONS = [
+    "When is the library open on weekends?",
+    "Is the pool closed on mondays?",
+    "How do I book a room at the gym?",
+]
+
+
+@pytest.fixture
+def index_path(tmp_path):
+    path = str(tmp_path / "faq.idx")
+    write(path, QUESTIONS)
+    return path
+
+
+def write(path, questions, generation="g1"):
+    entries = [
+        {"question": question, "answer": f"Answer {i}", "citations": []}
+        for i, question in enumerate(questions)
+    ]
+    embeddings = [fake_embedding(normalize_prompt(question), 64) for question in questions]
+    write_index(
+        path,
+        entries,
+        {"generation": generation, "embedding_model": EMBEDDING_MODEL_ID},
+        embeddings,
+    )
+
+
+def matcher(path, **kwargs):
+    return FaqMatcher(path, check_seconds=0, embedding_client=FakeBedrockRuntime(), **kwargs)
+
+
+def test_exact_question_matches_without_embedding(index_path):
+    faq = matcher(index_path, embedding_threshold=0)
+    assert faq.match("when is the LIBRARY open on weekends")["answer"] == "Answer 0"
+
+
+def test_reworded_question_matches_by_embedding(index_path):
+    faq = matcher(index_path)
+    record = faq.match("What time is the library open on weekends?")
+    assert record["answer"] == "Answer 0"
+    assert faq.match("Is the pool shut on mondays?")["answer"] == "Answer 1"
+    assert faq.stats()["semantic_hits"] == 2
+
+
+def test_reworded_question_falls_through_without_embeddings(index_path):
+    assert matcher(index_path, embedding_threshold=0).match(
+        "What time is the library open on weekends?"
+    ) is None
+
+
+def test_question_about_another_place_falls_through(index_path):
+    faq = matcher(index_path)
+    assert faq.match("When is the robotics lab open on weekends?") is None
+    assert faq.match("Can I bring my dog to a lecture?") is None
+
+
+def test_index_built_for_another_generation_is_not_used(index_path):
+    faq = matcher(index_path)
+    assert faq.match(QUESTIONS[0], generation="g2") is None
+    assert faq.stats()["stale"] == 1
+
+
+def test_reload_closes_the_replaced_index(index_path):
+    faq = matcher(index_path)
+    faq.refresh()
+    old = faq.index
+    write(index_path, ["Where is the bookstore?"], generation="g2")
+    os.utime(index_path, ns=(0, os.stat(index_path).st_mtime_ns + 1))
+    faq.refresh()
+    assert faq.index is not old
+    assert old._map.closed
+    assert faq.match("Where is the bookstore?")["answer"] == "Answer 0"
+
+
+def test_reload_during_a_lookup_closes_the_index_after_it(index_path):
+    faq = matcher(index_path)
+    faq.refresh()
+    old = faq.index
+    match = old.match
+
+    def reload_then_match(question, min_score=0.0):
+        write(index_path, QUESTIONS, generation="g2")
+        os.utime(index_path, ns=(0, os.stat(index_path).st_mtime_ns + 1))
+        faq.refresh()
+        assert not old._map.closed
+        return match(question, min_score)
+
+    old.match = reload_then_match
+    assert faq.match(QUESTIONS[1])["answer"] == "Answer 1"
+    assert old._map.closed
+
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / "other.idx"
+    path.write_bytes(b"\0" * 128)
+    with pytest.raises(ValueError):
+        FaqIndex(str(path))
@@ -0,0 +1,204 @@
+import threading
+import time
+
+import pytest
+
+from hedging import HedgedRuntime, HedgeTarget
+from resilience import RetryBudget
+
+
+def runtime(**kwargs):
+    return HedgedRuntime(
+        [HedgeTarget("us-east-1"), HedgeTarget("us-west-2")], lambda region: None, **kwargs
+    )
+
+
+def observe(hedged, latencies, model_id="m"):
+    for latency in latencies:
+        hedged._latencies.setdefault(("invoke_model", model_id), []).append(latency)
+
+
+def test_deadline_is_the_default_delay_before_enough_calls():
+    hedged = runtime(default_delay=0.7)
+    observe(hedged, [0.1] * 4)
+    assert hedged.deadline("invoke_model", "m") == 0.7
+
+
+def test_deadline_uses_the_capped_median_before_the_percentile_is_trusted():
+    hedged = runtime()
+    observe(hedged, [0.1] * 8 + [1.1] * 2)
+    assert hedged.deadline("invoke_model", "m") == 0.1 * 3
+
+
+def test_deadline_is_capped_when_the_percentile_is_a_stall():
+    hedged = runtime()
+    # One call in five stalls, so p90 is a stalled call
+    observe(hedged, [0.1] * 80 + [1.1] * 20)
+    assert round(hedged.deadline("invoke_model", "m"), 6) == 0.3
+
+
+def test_deadline_is_the_percentile_between_its_bounds():
+    hedged = runtime()
+    observe(hedged, [0.1] * 80 + [0.2] * 20)
+    assert round(hedged.deadline("invoke_model", "m"), 6) == 0.2
+
+
+def test_deadline_is_not_shorter_than_the_median_floor():
+    hedged = runtime()
+    observe(hedged, [0.1] * 100)
+    assert round(hedged.deadline("invoke_model", "m"), 6) == 0.15
+
+
+def test_deadline_is_kept_per_operation_and_model():
+    hedged = runtime(default_delay=0.7)
+    observe(hedged, [0.1] * 100, model_id="other")
+    assert hedged.deadline("invoke_model", "m") == 0.7
+
+
+class Body:
+    def __init__(self, region, events=()):
+        self.region = region
+        self.events = list(events)
+        self.closed = threading.Event()
+
+    def __iter__(self):
+        return iter(self.events)
+
+    def close(self):
+        self.closed.set()
+
+
+class FakeRuntime:
+    """Answers from its region once released; released from the start unless stalled."""
+
+    def __init__(self, region, stalled=False, error=None, events=("first", "second")):
+        self.region = region
+        self.error = error
+        self.events = events
+        self.release = threading.Event()
+        if not stalled:
+            self.release.set()
+        self.requests = []
+        self.bodies = []
+
+    def _answer(self, kwargs):
+        self.requests.append(kwargs)
+        self.release.wait(5)
+        if self.error:
+            raise self.error
+        body = Body(self.region, self.events)
+        self.bodies.append(body)
+        return {"body": body}
+
+    def invoke_model(self, **kwargs):
+        return self._answer(kwargs)
+
+    def invoke_model_with_response_stream(self, **kwargs):
+        return self._answer(kwargs)
+
+
+def racing(primary, hedge, targets=None, **kwargs):
+    clients = {primary.region: primary, hedge.region: hedge}
+    return HedgedRuntime(
+        targets or [HedgeTarget(primary.region), HedgeTarget(hedge.region)],
+        clients.__getitem__,
+        default_delay=0.05,
+        **kwargs,
+    )
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def test_primary_answering_before_the_deadline_is_not_hedged():
+    primary, hedge = FakeRuntime("us-east-1"), FakeRuntime("us-west-2")
+    hedged = racing(primary, hedge)
+    assert hedged.invoke_model(modelId="m")["body"].region == "us-east-1"
+    assert not hedge.requests
+    assert hedged.stats()["hedges"] == 0
+
+
+def test_hedge_wins_when_the_primary_stalls_and_the_loser_is_closed():
+    primary, hedge = FakeRuntime("us-east-1", stalled=True), FakeRuntime("us-west-2")
+    hedged = racing(primary, hedge)
+    assert hedged.invoke_model(modelId="m")["body"].region == "us-west-2"
+    assert hedged.stats()["hedge_wins"] == 1
+    primary.release.set()
+    # The stalled request answers later and its response is dropped
+    assert wait_for(lambda: primary.bodies)
+    assert primary.bodies[0].closed.wait(5)
+
+
+def test_primary_still_wins_when_the_hedge_fails():
+    primary = FakeRuntime("us-east-1", stalled=True)
+    hedge = FakeRuntime("us-west-2", error=RuntimeError("throttled"))
+    hedged = racing(primary, hedge)
+    threading.Timer(0.2, primary.release.set).start()
+    assert hedged.invoke_model(modelId="m")["body"].region == "us-east-1"
+    assert hedged.stats()["hedges"] == 1
+    assert hedged.stats()["hedge_wins"] == 0
+
+
+def test_primary_failure_before_the_deadline_is_hedged():
+    primary = FakeRuntime("us-east-1", error=RuntimeError("throttled"))
+    hedged = racing(primary, FakeRuntime("us-west-2"))
+    assert hedged.invoke_model(modelId="m")["body"].region == "us-west-2"
+    assert hedged.stats()["hedges"] == 1
+    assert hedged.stats()["hedge_wins"] == 1
+
+
+def test_primary_failure_is_raised_without_budget_to_hedge():
+    primary = FakeRuntime("us-east-1", error=RuntimeError("throttled"))
+    hedge = FakeRuntime("us-west-2")
+    hedged = racing(primary, hedge, budget=RetryBudget(ratio=0, capacity=0))
+    with pytest.raises(RuntimeError, match="throttled"):
+        hedged.invoke_model(modelId="m")
+    assert not hedge.requests
+    assert hedged.stats()["budget_denied"] == 1
+
+
+def test_error_is_raised_when_every_request_fails():
+    primary = FakeRuntime("us-east-1", error=RuntimeError("throttled"))
+    hedged = racing(primary, FakeRuntime("us-west-2", error=RuntimeError("down")))
+    with pytest.raises(RuntimeError, match="down"):
+        hedged.invoke_model(modelId="m")
+
+
+def test_no_hedge_without_budget():
+    primary, hedge = FakeRuntime("us-east-1", stalled=True), FakeRuntime("us-west-2")
+    hedged = racing(primary, hedge, budget=RetryBudget(ratio=0, capacity=0))
+    threading.Timer(0.2, primary.release.set).start()
+    assert hedged.invoke_model(modelId="m")["body"].region == "us-east-1"
+    assert not hedge.requests
+    assert hedged.stats()["budget_denied"] == 1
+
+
+def test_stream_race_is_won_by_the_first_event_and_keeps_every_event():
+    primary = FakeRuntime("us-east-1", stalled=True)
+    hedge = FakeRuntime("us-west-2", events=("a", "b", "c"))
+    hedged = racing(primary, hedge)
+    body = hedged.invoke_model_with_response_stream(modelId="m")["body"]
+    assert list(body) == ["a", "b", "c"]
+    body.close()
+    assert hedge.bodies[0].closed.is_set()
+    primary.release.set()
+
+
+def test_hedge_through_an_inference_profile_prefixes_the_model_id():
+    primary = FakeRuntime("us-east-1", stalled=True)
+    hedge = FakeRuntime("us-west-2")
+    hedged = racing(
+        primary,
+        hedge,
+        targets=[HedgeTarget("us-east-1"), HedgeTarget("us-west-2", profile="us")],
+    )
+    hedged.invoke_model(modelId="amazon.nova-lite-v1:0")
+    assert primary.requests[0]["modelId"] == "amazon.nova-lite-v1:0"
+    assert hedge.requests[0]["modelId"] == "us.amazon.nova-lite-v1:0"
+    primary.release.set()
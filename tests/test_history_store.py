@@ -0,0 +1,126 @@
+import pytest
+
+import history_store
+from history_store import HistoryStore, sign_owner, verify_owner
+from state_store import MemoryBackend, StateStore
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(history_store.time, "time", clock)
+    return clock
+
+
+def chat(store, *messages):
+    conversation = store.create()
+    for i, text in enumerate(messages):
+        store.add_message(conversation.id, "user" if i % 2 == 0 else "assistant", text)
+    return conversation
+
+
+def test_signed_owner_round_trips():
+    token = sign_owner("abc", "key", 60)
+    assert verify_owner(token, "key") == "abc"
+
+
+def test_forged_expired_or_malformed_owners_are_rejected():
+    owner, expires_at, signature = sign_owner("abc", "key", 60).split(".")
+    assert verify_owner(f"other.{expires_at}.{signature}", "key") is None
+    assert verify_owner(sign_owner("abc", "other key", 60), "key") is None
+    assert verify_owner(sign_owner("abc", "key", -1), "key") is None
+    assert verify_owner("abc", "key") is None
+    assert verify_owner(None, "key") is None
+
+
+def test_conversations_of_other_owners_are_not_reloaded():
+    store = StateStore(MemoryBackend())
+    alice = HistoryStore(store=store, owner="alice")
+    conversation = alice.create()
+    alice.add_message(conversation.id, "user", "Where is the library?")
+    store.flush()
+
+    assert HistoryStore(store=store, owner="alice").get(conversation.id).title
+    assert HistoryStore(store=store, owner="mallory").get(conversation.id) is None
+
+
+def test_repeated_message_is_stored_once():
+    store = HistoryStore()
+    conversation = store.create()
+    first = store.add_message(conversation.id, "user", "Where is the library?")
+    again = store.add_message(conversation.id, "user", "Where is the library?")
+    assert again is first
+    store.add_message(conversation.id, "assistant", "Where is the library?")
+    assert [m.role for m in conversation.messages] == ["user", "assistant"]
+    assert conversation.title == "Where is the library?"
+
+
+def test_oldest_conversation_is_evicted_over_capacity():
+    store = HistoryStore(max_conversations=2)
+    oldest = chat(store, "First?")
+    middle = chat(store, "Second?")
+    store.add_message(oldest.id, "assistant", "Answer.")
+    chat(store, "Third?")
+    assert len(store) == 2
+    assert store.get(middle.id) is None
+    assert store.get(oldest.id) is oldest
+
+
+def test_conversations_expire_after_the_max_age(clock):
+    store = HistoryStore(max_age_seconds=60)
+    old = chat(store, "Old question?")
+    clock.now += 61
+    recent = chat(store, "New question?")
+    assert store.get(old.id) is None
+    assert [c.id for c in store.recent()] == [recent.id]
+
+
+def test_long_conversation_keeps_its_latest_messages():
+    store = HistoryStore(max_messages=3)
+    conversation = chat(store, "1", "2", "3", "4", "5")
+    assert [m.text for m in conversation.messages] == ["3", "4", "5"]
+
+
+def test_evicted_and_trimmed_messages_are_spilled_and_reloaded(tmp_path):
+    store = HistoryStore(max_conversations=1, max_messages=2, spill_path=str(tmp_path / "spill.db"))
+    first = chat(store, "1", "2", "3")
+    chat(store, "Another chat?")
+    assert len(store) == 1
+
+    reloaded = store.get(first.id)
+    # The latest max_messages messages, including those trimmed before eviction
+    assert [m.text for m in reloaded.messages] == ["2", "3"]
+    assert reloaded.title == "1"
+
+
+def test_conversations_are_restored_from_the_state_store_in_another_task():
+    state = StateStore(MemoryBackend())
+    store = HistoryStore(store=state, owner="alice")
+    conversation = chat(store, "Where is the library?", "North campus.")
+    store.create()
+    state.flush()
+
+    restored = HistoryStore(store=state, owner="alice")
+    # Conversations without messages are not saved
+    assert len(restored) == 1
+    assert [m.text for m in restored.get(conversation.id).messages] == [
+        "Where is the library?",
+        "North campus.",
+    ]
+
+
+def test_error_answers_are_left_out_of_the_context():
+    store = HistoryStore()
+    conversation = chat(store, "First?", "Error: throttled", "Second?", "Answer.")
+    assert conversation.context_turns() == [
+        {"role": "user", "text": "Second?"},
+        {"role": "assistant", "text": "Answer."},
+    ]
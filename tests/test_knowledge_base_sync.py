@@ -0,0 +1,256 @@
+import importlib.util
+import io
+import json
+import os
+
+import pytest
+
+from manifest import (
+    diff_manifests,
+    directory_manifest,
+    has_changes,
+    load_manifest,
+    s3_manifest,
+    save_manifest,
+)
+
+SYNC_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "lambda", "knowledge_base_sync")
+spec = importlib.util.spec_from_file_location(
+    "knowledge_base_sync", os.path.join(SYNC_DIR, "index.py")
+)
+sync = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(sync)
+
+
+class NoSuchKey(Exception):
+    pass
+
+
+class FakeS3:
+    exceptions = type("Exceptions", (), {"NoSuchKey": NoSuchKey})
+
+    def __init__(self, documents):
+        self.documents = documents
+        self.objects = {}
+
+    def get_paginator(self, name):
+        documents = self.documents
+
+        class Paginator:
+            def paginate(self, Bucket, Prefix):
+                yield {
+                    "Contents": [
+                        {"Key": key, "ETag": f'"{etag}"'}
+                        for key, etag in documents.items()
+                        if key.startswith(Prefix)
+                    ]
+                }
+
+        return Paginator()
+
+    def get_object(self, Bucket, Key):
+        if Key not in self.objects:
+            raise NoSuchKey(Key)
+        return {"Body": io.BytesIO(self.objects[Key])}
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self.objects[Key] = Body
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop(Key, None)
+
+
+class FakeBedrockAgent:
+    def __init__(self):
+        self.job_status = "IN_PROGRESS"
+        self.started = 0
+
+    def list_ingestion_jobs(self, **kwargs):
+        if self.started and self.job_status == "IN_PROGRESS":
+            return {"ingestionJobSummaries": [{"ingestionJobId": f"job{self.started}"}]}
+        return {"ingestionJobSummaries": []}
+
+    def get_data_source(self, **kwargs):
+        return {
+            "dataSource": {
+                "dataSourceConfiguration": {
+                    "s3Configuration": {"bucketArn": "arn:aws:s3:::campus-docs"}
+                }
+            }
+        }
+
+    def start_ingestion_job(self, **kwargs):
+        self.started += 1
+        self.job_status = "IN_PROGRESS"
+        return {"ingestionJob": {"ingestionJobId": f"job{self.started}"}}
+
+    def get_ingestion_job(self, ingestionJobId, **kwargs):
+        return {"ingestionJob": {"status": self.job_status, "statistics": {"documents": 2}}}
+
+
+class Recorder:
+    def __init__(self):
+        self.calls = []
+
+    def __getattr__(self, name):
+        def call(**kwargs):
+            self.calls.append((name, kwargs))
+            return {"executionArn": "arn:execution"}
+
+        return call
+
+
+@pytest.fixture
+def aws(monkeypatch):
+    clients = {
+        "bedrock-agent": FakeBedrockAgent(),
+        "s3": FakeS3({"docs/hours.md": "e1", "docs/rooms.md": "e2"}),
+        "ssm": Recorder(),
+        "events": Recorder(),
+        "stepfunctions": Recorder(),
+    }
+    monkeypatch.setattr(sync.boto3, "client", lambda name: clients[name])
+    monkeypatch.setenv("KNOWLEDGE_BASE_ID", "KB")
+    monkeypatch.setenv("DATA_SOURCE_ID", "DS")
+    monkeypatch.setenv("SYNC_STATE_BUCKET", "state")
+    monkeypatch.setenv("SYNC_GENERATION_PARAMETER", "generation")
+    monkeypatch.delenv("SYNC_TARGETS", raising=False)
+    return clients
+
+
+def check(result):
+    return sync.handler({"action": "check", "targets": result["targets"]}, None)
+
+
+def test_start_leaves_the_job_to_later_checks(aws):
+    result = sync.handler({}, None)
+    assert result["summary"] == {"started": 1}
+    (report,) = result["targets"]
+    assert report["ingestionJobId"] == "job1"
+    # The manifest waits until the job succeeds, and nothing is announced yet
+    assert set(aws["s3"].objects) == {"pending/KB/DS/job1.json"}
+    assert aws["ssm"].calls == aws["events"].calls == []
+
+
+def test_check_waits_for_a_running_job(aws):
+    result = check(sync.handler({}, None))
+    assert result["summary"] == {"started": 1}
+    assert aws["ssm"].calls == aws["events"].calls == []
+
+
+def test_completed_job_records_the_manifest_and_announces_the_sync_once(aws):
+    result = check(sync.handler({}, None))
+    aws["bedrock-agent"].job_status = "COMPLETE"
+    result = check(result)
+    assert result["summary"] == {"success": 1}
+    assert json.loads(aws["s3"].objects["manifests/KB/DS.json"]) == {
+        "docs/hours.md": "e1",
+        "docs/rooms.md": "e2",
+    }
+    assert "pending/KB/DS/job1.json" not in aws["s3"].objects
+    assert [kwargs["Value"] for _, kwargs in aws["ssm"].calls] == ["job1"]
+    ((_, event),) = aws["events"].calls
+    assert event["Entries"][0]["DetailType"] == "Knowledge Base Sync Completed"
+
+    # Unchanged documents are not synced again
+    result = sync.handler({}, None)
+    assert result["targets"][0]["reason"] == "no_changes"
+    assert aws["bedrock-agent"].started == 1
+
+
+def test_failed_job_is_retried_on_the_next_run(aws):
+    result = sync.handler({}, None)
+    aws["bedrock-agent"].job_status = "FAILED"
+    assert check(result)["summary"] == {"failed": 1}
+    assert aws["s3"].objects == {}
+    assert aws["ssm"].calls == aws["events"].calls == []
+    assert sync.handler({}, None)["summary"] == {"started": 1}
+
+
+def resync(result):
+    return sync.handler({"targets": result["targets"]}, None)
+
+
+def test_change_during_a_running_job_is_synced_after_it(aws):
+    first = sync.handler({}, None)
+    aws["s3"].documents["docs/maps.md"] = "e3"
+    # The change event's sync finds the job running and asks to try again
+    changed = sync.handler({"changedBuckets": ["campus-docs"]}, None)
+    assert changed["targets"][0]["reason"] == "job_in_progress"
+    assert changed["resync"]
+    assert resync(changed)["targets"][0]["reason"] == "job_in_progress"
+
+    aws["bedrock-agent"].job_status = "COMPLETE"
+    done = check(first)
+    assert done["summary"] == {"success": 1}
+    assert done["resync"]
+    again = resync(done)
+    assert again["summary"] == {"started": 1}
+    assert again["targets"][0]["changes"] == {"added": 1, "modified": 0, "deleted": 0}
+
+    aws["bedrock-agent"].job_status = "COMPLETE"
+    finished = check(again)
+    assert resync(finished)["targets"][0]["reason"] == "no_changes"
+    assert not resync(finished)["resync"]
+
+
+def test_changes_in_other_buckets_do_not_sync(aws):
+    result = sync.handler({"changedBuckets": ["other-bucket"]}, None)
+    assert result["targets"][0]["reason"] == "unaffected"
+    assert not result["resync"]
+
+
+def test_a_batch_of_change_events_starts_one_sync(aws, monkeypatch):
+    monkeypatch.setenv("SYNC_STATE_MACHINE_ARN", "arn:sync")
+    records = [
+        {"body": json.dumps({"detail": {"bucket": {"name": bucket}}})}
+        for bucket in ("campus-docs", "campus-docs", "handbooks")
+    ]
+    assert sync.changes_handler({"Records": records}, None)["started"]
+    ((_, execution),) = aws["stepfunctions"].calls
+    assert execution["stateMachineArn"] == "arn:sync"
+    assert json.loads(execution["input"]) == {"changedBuckets": ["campus-docs", "handbooks"]}
+
+
+def test_diff_lists_added_modified_and_deleted_keys_in_order():
+    previous = {"a.pdf": "1", "b.pdf": "1", "c.pdf": "1"}
+    current = {"a.pdf": "1", "c.pdf": "2", "e.pdf": "1", "d.pdf": "1"}
+    diff = diff_manifests(previous, current)
+    assert diff == {"added": ["d.pdf", "e.pdf"], "modified": ["c.pdf"], "deleted": ["b.pdf"]}
+    assert has_changes(diff)
+
+
+def test_identical_manifests_have_no_changes():
+    assert not has_changes(diff_manifests({"a.pdf": "1"}, {"a.pdf": "1"}))
+    assert not has_changes(diff_manifests({}, {}))
+
+
+def test_directory_manifest_tracks_nested_files_and_their_changes(tmp_path):
+    (tmp_path / "guides").mkdir()
+    (tmp_path / "faq.txt").write_text("Opening hours")
+    (tmp_path / "guides" / "library.txt").write_text("Floors")
+    before = directory_manifest(tmp_path)
+    assert sorted(before) == ["faq.txt", "guides/library.txt"]
+
+    (tmp_path / "faq.txt").write_text("Opening hours and holidays")
+    (tmp_path / "guides" / "library.txt").unlink()
+    (tmp_path / "guides" / "dining.txt").write_text("Menus")
+    diff = diff_manifests(before, directory_manifest(tmp_path))
+    assert diff == {
+        "added": ["guides/dining.txt"],
+        "modified": ["faq.txt"],
+        "deleted": ["guides/library.txt"],
+    }
+
+
+def test_s3_manifest_lists_etags_under_the_prefixes():
+    s3 = FakeS3({"docs/a.pdf": "1", "docs/b.pdf": "2", "other/c.pdf": "3"})
+    assert s3_manifest(s3, "bucket", ["docs/"]) == {"docs/a.pdf": "1", "docs/b.pdf": "2"}
+    assert len(s3_manifest(s3, "bucket")) == 3
+
+
+def test_saved_manifest_loads_back_and_a_missing_one_is_empty():
+    s3 = FakeS3({})
+    assert load_manifest(s3, "bucket", "manifest.json") == {}
+    save_manifest(s3, "bucket", "manifest.json", {"a.pdf": "1"})
+    assert load_manifest(s3, "bucket", "manifest.json") == {"a.pdf": "1"}
@@ -0,0 +1,78 @@
+from model_router import (
+    AUTO_MODEL,
+    LITE_MODEL_ID,
+    PRO_MODEL_ID,
+    ModelRouter,
+    complexity_score,
+    is_low_confidence_answer,
+    prompt_features,
+)
+
+SIMPLE = "When is the library open?"
+COMPLEX = "Compare the pros and cons of the meal plans and explain why one suits commuters."
+
+
+def test_selected_model_is_used_as_is():
+    route = ModelRouter().route(COMPLEX, PRO_MODEL_ID)
+    assert route.model_id == PRO_MODEL_ID
+    assert route.reason == "selected"
+
+
+def test_simple_question_goes_to_the_lite_model_with_a_fallback():
+    route = ModelRouter().route(SIMPLE, AUTO_MODEL)
+    assert route.model_id == LITE_MODEL_ID
+    assert route.fallback_model_id == PRO_MODEL_ID
+    assert route.reason.startswith("simple prompt")
+
+
+def test_fallback_can_be_turned_off():
+    assert ModelRouter(fallback=False).route(SIMPLE, AUTO_MODEL).fallback_model_id is None
+
+
+def test_analytical_question_goes_to_the_pro_model():
+    assert complexity_score(prompt_features(COMPLEX)) > complexity_score(prompt_features(SIMPLE))
+    route = ModelRouter().route(COMPLEX, AUTO_MODEL)
+    assert route.model_id == PRO_MODEL_ID
+    assert route.reason.startswith("complex prompt")
+
+
+def test_low_retrieval_confidence_goes_to_the_pro_model():
+    router = ModelRouter(min_retrieval_score=0.4)
+    assert router.route(SIMPLE, AUTO_MODEL, [{"score": 0.2}, {"score": 0.3}]).model_id == PRO_MODEL_ID
+    assert router.route(SIMPLE, AUTO_MODEL, [{"score": 0.2}, {"score": 0.8}]).model_id == LITE_MODEL_ID
+    # Passages without scores say nothing about confidence
+    assert router.route(SIMPLE, AUTO_MODEL, [{"score": None}]).model_id == LITE_MODEL_ID
+
+
+def test_pro_model_over_its_latency_slo_keeps_complex_questions_on_lite():
+    router = ModelRouter(latency_slo_seconds=2.0, hard_threshold=0.95)
+    router.observe(PRO_MODEL_ID, 1.0)
+    assert router.route(COMPLEX, AUTO_MODEL).model_id == PRO_MODEL_ID
+
+    for _ in range(10):
+        router.observe(PRO_MODEL_ID, 6.0)
+    route = router.route(COMPLEX, AUTO_MODEL)
+    assert route.model_id == LITE_MODEL_ID
+    assert "latency SLO" in route.reason
+    assert route.fallback_model_id is None
+
+
+def test_hardest_questions_stay_on_pro_despite_the_slo():
+    router = ModelRouter(latency_slo_seconds=2.0, hard_threshold=0.5)
+    router.observe(PRO_MODEL_ID, 6.0)
+    assert router.route(COMPLEX, AUTO_MODEL).model_id == PRO_MODEL_ID
+
+
+def test_latency_is_a_moving_average():
+    router = ModelRouter(smoothing=0.5)
+    router.observe(LITE_MODEL_ID, 1.0)
+    router.observe(LITE_MODEL_ID, 3.0)
+    router.observe(LITE_MODEL_ID, None)
+    assert router.latency(LITE_MODEL_ID) == 2.0
+    assert router.stats() == {LITE_MODEL_ID: 2.0}
+
+
+def test_answers_admitting_they_could_not_answer_are_low_confidence():
+    assert is_low_confidence_answer("Sorry, I could not find an exact answer to that.")
+    assert is_low_confidence_answer("The passages do not contain information about parking.")
+    assert not is_low_confidence_answer("The library opens at 8am.")
@@ -0,0 +1,60 @@
+
+from prompt_templates import (
+    CACHE_POINT,
+    MIN_CACHED_TOKENS,
+    PROMPTS_DIR,
+    PromptPart,
+    PromptRegistry,
+)
+
+NOVA_LITE = "amazon.nova-lite-v1:0"
+
+
+def template():
+    return PromptRegistry(PROMPTS_DIR).get("question_answering")
+
+
+def test_direct_answers_get_their_own_instructions():
+    prompt = template()
+    direct = prompt.system_blocks(NOVA_LITE, grounded=False)[0]["text"]
+    grounded = prompt.system_blocks(NOVA_LITE, grounded=True)[0]["text"]
+
+    assert "search results" not in direct
+    assert "could not find" not in direct
+    assert "search results" in grounded
+    assert prompt.user_message("When is the gym open?") == "When is the gym open?"
+
+
+def test_grounded_message_numbers_the_passages():
+    message = template().user_message("Q?", [{"text": "first"}, {"text": "second"}])
+    assert "1. first\n2. second" in message
+    assert "<question>\nQ?\n</question>" in message
+
+
+def test_retrieve_and_generate_keeps_the_human_assistant_framing():
+    kb_template = template().knowledge_base_template
+    assert kb_template.startswith("\n        Human: You are a question answering agent.")
+    assert kb_template.endswith("$output_format_instructions$\n        Assistant:   \n")
+
+
+def test_short_instructions_are_sent_without_a_cache_point():
+    part = PromptPart("Answer briefly.", "$query$", ("$query$",))
+    assert not part.cacheable
+    assert CACHE_POINT not in part.system_blocks(NOVA_LITE)
+
+
+def test_long_instructions_end_in_a_cache_point_for_nova_only():
+    part = PromptPart("Be precise. " * MIN_CACHED_TOKENS, "$query$", ("$query$",))
+    assert part.system_blocks(NOVA_LITE)[-1] == CACHE_POINT
+    assert part.system_blocks("us.amazon.nova-pro-v1:0")[-1] == CACHE_POINT
+    assert CACHE_POINT not in part.system_blocks("anthropic.claude-v2")
+    assert CACHE_POINT not in part.system_blocks(NOVA_LITE, cache=False)
+
+
+def test_registry_totals_cached_and_uncached_tokens():
+    registry = PromptRegistry(PROMPTS_DIR)
+    registry.observe("question_answering@3", 100, 900, 0)
+    registry.observe("question_answering@3", 100, None, None)
+    usage = registry.stats()["usage"]["question_answering@3"]
+    assert usage["calls"] == 2
+    assert usage["cached_share"] == 900 / 1100
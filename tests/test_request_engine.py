@@ -0,0 +1,137 @@
+import threading
+import time
+
+import pytest
+
+from request_engine import EngineBusyError, RequestEngine
+
+
+@pytest.fixture
+def engines():
+    started = []
+
+    def make(**kwargs):
+        engine = RequestEngine(**kwargs)
+        started.append(engine)
+        return engine
+
+    yield make
+    for engine in started:
+        engine.shutdown()
+
+
+class Gate:
+    """Calls that block until the gate opens, recording how many ran at once."""
+
+    def __init__(self):
+        self.open = threading.Event()
+        self.running = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+
+    def call(self, value=None):
+        with self.lock:
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+        try:
+            self.open.wait(5)
+            return value
+        finally:
+            with self.lock:
+                self.running -= 1
+
+
+def test_submit_returns_the_result_and_counts_it(engines):
+    engine = engines()
+    assert engine.submit("m", lambda x, y: x + y, 1, y=2).result(5) == 3
+    assert engine.stats() == {"pending": 0, "running": 0, "completed": 1, "rejected": 0}
+
+
+def test_errors_reach_the_caller(engines):
+    engine = engines()
+
+    def fail():
+        raise ValueError("bad request")
+
+    with pytest.raises(ValueError, match="bad request"):
+        engine.submit("m", fail).result(5)
+
+
+def test_model_limit_caps_concurrent_calls(engines):
+    engine = engines(max_workers=8, model_limits={"m": 2})
+    gate = Gate()
+    futures = [engine.submit("m", gate.call, i) for i in range(5)]
+    time.sleep(0.1)
+    assert gate.running == 2
+    assert engine.stats()["pending"] == 3
+    gate.open.set()
+    assert [f.result(5) for f in futures] == list(range(5))
+    assert gate.peak == 2
+
+
+def test_saturated_model_does_not_hold_up_other_models(engines):
+    engine = engines(max_workers=4, model_limits={"pro": 2, "lite": 2})
+    gate = Gate()
+    blocked = [engine.submit("pro", gate.call) for _ in range(6)]
+    started_at = time.perf_counter()
+    assert engine.submit("lite", lambda: "lite").result(5) == "lite"
+    assert time.perf_counter() - started_at < 0.5
+    gate.open.set()
+    for future in blocked:
+        future.result(5)
+
+
+def test_worker_pool_caps_calls_across_models(engines):
+    engine = engines(max_workers=2, default_model_limit=2)
+    gate = Gate()
+    futures = [engine.submit(model, gate.call) for model in ("a", "b", "c", "a")]
+    time.sleep(0.1)
+    assert gate.running == 2
+    gate.open.set()
+    for future in futures:
+        future.result(5)
+    assert gate.peak == 2
+
+
+def test_full_queue_rejects_after_the_admission_timeout(engines):
+    engine = engines(max_workers=1, max_queue=1, admission_timeout=0.1)
+    gate = Gate()
+    futures = [engine.submit("m", gate.call) for _ in range(2)]
+    started_at = time.perf_counter()
+    with pytest.raises(EngineBusyError):
+        engine.submit("m", gate.call)
+    assert time.perf_counter() - started_at >= 0.1
+    assert engine.stats()["rejected"] == 1
+    gate.open.set()
+    for future in futures:
+        future.result(5)
+    assert engine.submit("m", lambda: "room again").result(5) == "room again"
+
+
+def test_cancelled_call_never_runs(engines):
+    engine = engines(max_workers=1)
+    gate = Gate()
+    running = engine.submit("m", gate.call)
+    ran = []
+    queued = engine.submit("m", ran.append, 1)
+    assert queued.cancel()
+    gate.open.set()
+    running.result(5)
+    assert engine.submit("m", lambda: "next").result(5) == "next"
+    assert not ran
+    assert engine.stats()["pending"] == 0
+
+
+def test_stream_yields_items_as_they_are_produced(engines):
+    engine = engines()
+
+    def produce():
+        yield "a"
+        yield "b"
+        raise RuntimeError("stream broke")
+
+    items = engine.stream("m", produce)
+    assert next(items) == "a"
+    assert next(items) == "b"
+    with pytest.raises(RuntimeError, match="stream broke"):
+        next(items)
@@ -0,0 +1,175 @@
+import pytest
+
+import resilience
+from resilience import (
+    CircuitBreaker,
+    CircuitOpenError,
+    RateLimitedError,
+    ResiliencePolicy,
+    RetryBudget,
+    TokenBucket,
+)
+
+
+class Clock:
+    """Stands in for time.monotonic and time.sleep so waits take no time."""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(resilience.time, "monotonic", clock.monotonic)
+    monkeypatch.setattr(resilience.time, "sleep", clock.sleep)
+    return clock
+
+
+class ServiceError(Exception):
+    def __init__(self, code):
+        super().__init__(code)
+        self.response = {"Error": {"Code": code}}
+
+
+def failing(code, failures):
+    """Returns a call that raises ServiceError(code) failures times, then answers."""
+    calls = []
+
+    def call():
+        calls.append(1)
+        if len(calls) <= failures:
+            raise ServiceError(code)
+        return "ok"
+
+    call.calls = calls
+    return call
+
+
+def test_limit_under_burst_window_still_allows_a_call():
+    policy = ResiliencePolicy(rate_limits={"m": 6}, rate_limit_wait=0)
+    assert policy.call("m", lambda: "ok") == "ok"
+    with pytest.raises(RateLimitedError):
+        policy.call("m", lambda: "ok")
+
+
+def test_bucket_allows_a_burst_of_its_capacity(clock):
+    bucket = TokenBucket(rate=1, capacity=3)
+    assert [bucket.acquire(timeout=0) for _ in range(4)] == [True, True, True, False]
+
+
+def test_bucket_refills_at_its_rate(clock):
+    bucket = TokenBucket(rate=2, capacity=1)
+    assert bucket.acquire(timeout=0)
+    assert not bucket.acquire(timeout=0.1)
+    clock.now += 0.5
+    assert bucket.acquire(timeout=0)
+
+
+def test_bucket_waits_for_a_token_within_the_timeout(clock):
+    bucket = TokenBucket(rate=4, capacity=1)
+    assert bucket.acquire()
+    assert bucket.acquire(timeout=1)
+    assert clock.sleeps == [pytest.approx(0.25)]
+
+
+def test_retry_budget_starts_full_and_refills_by_ratio():
+    budget = RetryBudget(ratio=0.5, capacity=2)
+    assert budget.withdraw() and budget.withdraw()
+    assert not budget.withdraw()
+    budget.deposit()
+    assert not budget.withdraw()
+    budget.deposit()
+    assert budget.withdraw()
+
+
+def test_retry_budget_is_capped_at_its_capacity():
+    budget = RetryBudget(ratio=1, capacity=1)
+    for _ in range(5):
+        budget.deposit()
+    assert budget.withdraw()
+    assert not budget.withdraw()
+
+
+def test_breaker_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+    assert breaker.retry_after() == 30
+
+
+def test_breaker_lets_one_probe_through_after_the_timeout(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    clock.now += 30
+    assert breaker.allow()
+    assert breaker.state == "half_open"
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.allow()
+
+
+def test_failed_probe_opens_the_breaker_again(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30)
+    for _ in range(3):
+        breaker.record_failure()
+    clock.now += 30
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+
+def test_retryable_errors_are_retried_with_backoff(clock):
+    policy = ResiliencePolicy(base_delay=0.25, max_delay=8)
+    call = failing("ThrottlingException", 2)
+    assert policy.call("m", call) == "ok"
+    assert len(call.calls) == 3
+    assert len(clock.sleeps) == 2
+    assert clock.sleeps[1] <= 0.5
+    assert policy.stats()["retries"] == 2
+
+
+def test_other_errors_are_not_retried_and_keep_the_circuit_closed(clock):
+    policy = ResiliencePolicy(failure_threshold=1)
+    call = failing("ValidationException", 1)
+    with pytest.raises(ServiceError):
+        policy.call("m", call)
+    assert len(call.calls) == 1
+    assert policy.stats()["circuits"] == {"m": "closed"}
+
+
+def test_empty_retry_budget_stops_retries(clock):
+    policy = ResiliencePolicy(retry_budget=RetryBudget(ratio=0, capacity=1))
+    with pytest.raises(ServiceError):
+        policy.call("m", failing("ThrottlingException", 10))
+    assert policy.stats()["retries"] == 1
+    assert policy.stats()["budget_exhausted"] == 1
+
+
+def test_open_circuit_short_circuits_calls(clock):
+    policy = ResiliencePolicy(max_retries=0, failure_threshold=2, reset_timeout=30)
+    for _ in range(2):
+        with pytest.raises(ServiceError):
+            policy.call("m", failing("ServiceUnavailableException", 1))
+    call = failing("ServiceUnavailableException", 0)
+    with pytest.raises(CircuitOpenError):
+        policy.call("m", call)
+    assert not call.calls
+    clock.now += 30
+    assert policy.call("m", call) == "ok"
+    assert policy.stats()["circuits"] == {"m": "closed"}
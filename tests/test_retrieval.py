@@ -0,0 +1,116 @@
+from conversation import estimate_tokens
+from retrieval import PAGE_NUMBER_KEY, compress_passages
+
+
+def passage(text, uri="s3://docs/a.pdf", score=0.5, page=None):
+    return {
+        "text": text,
+        "location": {"s3Location": {"uri": uri}},
+        "score": score,
+        "metadata": {} if page is None else {PAGE_NUMBER_KEY: float(page)},
+    }
+
+
+def sentences(topic, count):
+    return " ".join(f"The {topic} rule {n} covers {topic} item {n}." for n in range(count))
+
+
+def test_passages_are_ranked_by_score():
+    passages = [
+        passage(sentences("printing", 2), "s3://docs/printing.pdf", 0.2),
+        passage(sentences("library", 2), "s3://docs/library.pdf", 0.9),
+        passage(sentences("parking", 2), "s3://docs/parking.pdf", None),
+    ]
+    packed, report = compress_passages(passages)
+    assert [p["location"]["s3Location"]["uri"] for p in packed] == [
+        "s3://docs/library.pdf",
+        "s3://docs/printing.pdf",
+        "s3://docs/parking.pdf",
+    ]
+    assert report["duplicates"] == report["merges"] == report["tokens_saved"] == 0
+
+
+def test_near_duplicates_keep_the_higher_scored_copy():
+    text = sentences("library", 5)
+    passages = [
+        passage(text, "s3://docs/copy.pdf", 0.4),
+        passage(text + " Thanks.", "s3://docs/original.pdf", 0.8),
+    ]
+    packed, report = compress_passages(passages)
+    assert [p["location"]["s3Location"]["uri"] for p in packed] == ["s3://docs/original.pdf"]
+    assert report["duplicates"] == 1
+    assert report["tokens_saved"] == estimate_tokens(text)
+
+
+def test_overlapping_chunks_of_a_document_are_merged():
+    text = sentences("library", 10)
+    first, second = text[:300], text[200:]
+    packed, report = compress_passages([passage(second, score=0.7), passage(first, score=0.9)])
+    assert [p["text"] for p in packed] == [text]
+    assert packed[0]["score"] == 0.9
+    assert report["merges"] == 1
+
+
+def test_chunks_on_consecutive_pages_are_merged_in_page_order():
+    packed, _ = compress_passages(
+        [
+            passage(sentences("library", 2), page=3, score=0.9),
+            passage(sentences("dining", 2), page=2, score=0.8),
+            passage(sentences("parking", 2), page=7, score=0.7),
+        ]
+    )
+    assert len(packed) == 2
+    assert packed[0]["text"] == f"{sentences('dining', 2)}\n{sentences('library', 2)}"
+
+
+def test_passages_are_packed_into_the_budget_and_the_last_one_truncated():
+    passages = [
+        passage(sentences("library", 10), "s3://docs/library.pdf", 0.9),
+        passage(sentences("printing", 10), "s3://docs/printing.pdf", 0.8),
+        passage(sentences("parking", 10), "s3://docs/parking.pdf", 0.7),
+    ]
+    first_tokens = estimate_tokens(passages[0]["text"])
+    packed, report = compress_passages(passages, budget_tokens=first_tokens + 60)
+    assert [p["location"]["s3Location"]["uri"] for p in packed] == [
+        "s3://docs/library.pdf",
+        "s3://docs/printing.pdf",
+    ]
+    assert packed[0]["text"] == passages[0]["text"]
+    # Cut at a sentence end
+    assert packed[1]["text"].endswith(".")
+    assert passages[1]["text"].startswith(packed[1]["text"])
+    assert report["tokens_after"] <= first_tokens + 60
+    assert report["passages_after"] == 2
+
+
+def test_remainder_too_small_for_a_useful_passage_is_left_empty():
+    passages = [
+        passage(sentences("library", 10), "s3://docs/library.pdf", 0.9),
+        passage(sentences("printing", 10), "s3://docs/printing.pdf", 0.8),
+    ]
+    budget = estimate_tokens(passages[0]["text"]) + 10
+    packed, report = compress_passages(passages, budget_tokens=budget)
+    assert len(packed) == 1
+    assert report["tokens_after"] == estimate_tokens(passages[0]["text"])
+
+
+def test_nothing_fits_a_budget_smaller_than_a_truncated_passage():
+    packed, report = compress_passages([passage(sentences("library", 10))], budget_tokens=10)
+    assert packed == []
+    assert report["passages_after"] == report["tokens_after"] == 0
+    assert report["tokens_saved"] == report["tokens_before"]
+
+
+def test_no_passages():
+    assert compress_passages([], budget_tokens=100) == (
+        [],
+        {
+            "passages_before": 0,
+            "passages_after": 0,
+            "duplicates": 0,
+            "merges": 0,
+            "tokens_before": 0,
+            "tokens_after": 0,
+            "tokens_saved": 0,
+        },
+    )
@@ -0,0 +1,342 @@
+import os
+
+import aws_cdk as cdk
+import pytest
+from aws_cdk.assertions import Match, Template
+
+from bedrock_knowledgebase_bot.bedrock_knowledgebase_bot_stack import (
+    BedrockKnowledgeBotStack,
+)
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CONTEXT = {
+    "knowledge_base_id": "KB123",
+    "data_source_id": "DS123",
+    "ecr_repository_name": "bedrock-knowledge-bot",
+}
+
+
+def synth(**context):
+    # Lambda asset paths are relative to the repository root, as for `cdk synth`
+    cwd = os.getcwd()
+    os.chdir(REPO_DIR)
+    try:
+        app = cdk.App(context={**CONTEXT, **context})
+        stack = BedrockKnowledgeBotStack(
+            app,
+            "TestStack",
+            env=cdk.Environment(account="123456789012", region="us-east-1"),
+        )
+        return Template.from_stack(stack)
+    finally:
+        os.chdir(cwd)
+
+
+@pytest.fixture(scope="module")
+def template():
+    return synth()
+
+
+@pytest.fixture(scope="module")
+def full_template():
+    return synth(
+        data_source_bucket_name="campus-docs",
+        prewarm_questions_uri="s3://questions/prewarm.jsonl",
+        faq_questions_uri="s3://questions/faq.jsonl",
+        ui_scaling_schedules=[
+            {
+                "name": "ExamWeek",
+                "cron": {"hour": "7", "minute": "0", "week_day": "MON-FRI"},
+                "min_capacity": 6,
+                "max_capacity": 20,
+                "time_zone": "America/New_York",
+            }
+        ],
+    )
+
+
+def test_services_scale_between_their_capacity_defaults(template):
+    template.resource_count_is("AWS::ApplicationAutoScaling::ScalableTarget", 2)
+    for min_capacity, max_capacity in ((1, 10), (2, 8)):
+        template.has_resource_properties(
+            "AWS::ApplicationAutoScaling::ScalableTarget",
+            {
+                "MinCapacity": min_capacity,
+                "MaxCapacity": max_capacity,
+                "ScalableDimension": "ecs:service:DesiredCount",
+            },
+        )
+
+
+@pytest.mark.parametrize(
+    "metric_type, target",
+    [
+        ("ECSServiceAverageCPUUtilization", 60),
+        ("ECSServiceAverageCPUUtilization", 50),
+        ("ALBRequestCountPerTarget", 300),
+        ("ALBRequestCountPerTarget", 1000),
+    ],
+)
+def test_services_track_cpu_and_requests_per_target(template, metric_type, target):
+    template.has_resource_properties(
+        "AWS::ApplicationAutoScaling::ScalingPolicy",
+        {
+            "PolicyType": "TargetTrackingScaling",
+            "TargetTrackingScalingPolicyConfiguration": Match.object_like(
+                {
+                    "PredefinedMetricSpecification": Match.object_like(
+                        {"PredefinedMetricType": metric_type}
+                    ),
+                    "TargetValue": target,
+                    "ScaleInCooldown": 600,
+                    "ScaleOutCooldown": 60,
+                }
+            ),
+        },
+    )
+
+
+def test_capacity_follows_context():
+    template = synth(api_min_capacity=3, api_max_capacity=30, api_cpu_target=40)
+    template.has_resource_properties(
+        "AWS::ApplicationAutoScaling::ScalableTarget",
+        {"MinCapacity": 3, "MaxCapacity": 30},
+    )
+    template.has_resource_properties(
+        "AWS::ApplicationAutoScaling::ScalingPolicy",
+        {
+            "TargetTrackingScalingPolicyConfiguration": Match.object_like(
+                {"TargetValue": 40}
+            )
+        },
+    )
+
+
+def test_scaling_schedules_become_scheduled_actions(full_template):
+    full_template.has_resource_properties(
+        "AWS::ApplicationAutoScaling::ScalableTarget",
+        {
+            "ScheduledActions": [
+                Match.object_like(
+                    {
+                        "ScalableTargetAction": {"MinCapacity": 6, "MaxCapacity": 20},
+                        "Schedule": "cron(0 7 ? * MON-FRI *)",
+                        "Timezone": "America/New_York",
+                    }
+                )
+            ]
+        },
+    )
+
+
+def test_state_table_is_on_demand_with_a_ttl(template):
+    template.resource_count_is("AWS::DynamoDB::Table", 1)
+    template.has_resource_properties(
+        "AWS::DynamoDB::Table",
+        {
+            "KeySchema": [{"AttributeName": "pk", "KeyType": "HASH"}],
+            "BillingMode": "PAY_PER_REQUEST",
+            "TimeToLiveSpecification": {"AttributeName": "expires_at", "Enabled": True},
+        },
+    )
+    template.has_resource_properties(
+        "AWS::ECS::TaskDefinition",
+        {
+            "ContainerDefinitions": [
+                Match.object_like(
+                    {
+                        "Environment": Match.array_with(
+                            [{"Name": "STATE_BACKEND", "Value": "dynamodb"}]
+                        )
+                    }
+                )
+            ]
+        },
+    )
+
+
+def test_ui_signs_session_ids_with_a_generated_key(template):
+    template.resource_count_is("AWS::SecretsManager::Secret", 1)
+    template.has_resource_properties(
+        "AWS::ECS::TaskDefinition",
+        {
+            "ContainerDefinitions": [
+                Match.object_like(
+                    {
+                        "Secrets": [
+                            Match.object_like({"Name": "STATE_SESSION_KEY"})
+                        ]
+                    }
+                )
+            ]
+        },
+    )
+
+
+def test_state_backend_none_creates_no_table():
+    none_template = synth(state_backend="none")
+    none_template.resource_count_is("AWS::DynamoDB::Table", 0)
+    none_template.resource_count_is("AWS::SecretsManager::Secret", 0)
+
+
+def test_sync_generation_parameter(template):
+    template.resource_count_is("AWS::SSM::Parameter", 1)
+    template.has_resource_properties(
+        "AWS::SSM::Parameter", {"Type": "String", "Value": "initial"}
+    )
+
+
+def sync_state_machine_target(template):
+    (state_machine,) = template.find_resources("AWS::StepFunctions::StateMachine")
+    return [Match.object_like({"Arn": {"Ref": state_machine}})]
+
+
+def test_weekly_sync_rule_starts_the_sync_state_machine(template):
+    template.has_resource_properties(
+        "AWS::Events::Rule",
+        {
+            "ScheduleExpression": "cron(0 0 7 * ? *)",
+            "State": "ENABLED",
+            "Targets": sync_state_machine_target(template),
+        },
+    )
+
+
+def test_sync_state_machine_checks_jobs_until_none_is_running(template):
+    (state_machine,) = template.find_resources("AWS::StepFunctions::StateMachine").values()
+    parts = state_machine["Properties"]["DefinitionString"]["Fn::Join"][1]
+    definition = "".join(part if isinstance(part, str) else "<sync>" for part in parts)
+    assert '"IsPresent":true,"Next":"WaitForIngestionJobs"' in definition
+    assert '"Seconds":60,"Next":"CheckKnowledgeBaseSync"' in definition
+    assert '"Parameters":{"action":"check","targets.$":"$.targets"}' in definition
+    (sync_function,) = template.find_resources(
+        "AWS::Lambda::Function", {"Properties": {"Handler": "index.handler"}}
+    )
+    # The start, the check and the resync invoke the sync Lambda
+    assert parts.count({"Fn::GetAtt": [sync_function, "Arn"]}) == 3
+
+
+def test_sync_state_machine_resyncs_until_nothing_changed(template):
+    (state_machine,) = template.find_resources("AWS::StepFunctions::StateMachine").values()
+    parts = state_machine["Properties"]["DefinitionString"]["Fn::Join"][1]
+    definition = "".join(part if isinstance(part, str) else "<sync>" for part in parts)
+    assert '"BooleanEquals":true,"Next":"WaitBeforeResync"' in definition
+    assert '"Seconds":60,"Next":"ResyncKnowledgeBase"' in definition
+    assert '"Parameters":{"targets.$":"$.targets"}' in definition
+
+
+def test_data_source_changes_and_finished_syncs_trigger_rules(full_template):
+    full_template.has_resource_properties(
+        "AWS::Events::Rule",
+        {
+            "EventPattern": {
+                "source": ["aws.s3"],
+                "detail-type": ["Object Created", "Object Deleted"],
+                "detail": {"bucket": {"name": ["campus-docs"]}},
+            },
+            "Targets": [Match.object_like({"Arn": Match.any_value()})],
+        },
+    )
+    sync_completed = full_template.find_resources(
+        "AWS::Events::Rule",
+        {
+            "Properties": {
+                "EventPattern": {
+                    "source": ["bedrock-knowledge-bot.sync"],
+                    "detail-type": ["Knowledge Base Sync Completed"],
+                }
+            }
+        },
+    )
+    # The answer cache prewarm and the FAQ index build
+    assert len(sync_completed) == 2
+
+
+def test_data_source_changes_are_batched_into_one_sync(full_template):
+    (queue,) = full_template.find_resources("AWS::SQS::Queue")
+    (rule,) = full_template.find_resources(
+        "AWS::Events::Rule", {"Properties": {"EventPattern": {"source": ["aws.s3"]}}}
+    ).values()
+    assert rule["Properties"]["Targets"][0]["Arn"] == {"Fn::GetAtt": [queue, "Arn"]}
+    full_template.has_resource_properties(
+        "AWS::Lambda::EventSourceMapping",
+        {
+            "EventSourceArn": {"Fn::GetAtt": [queue, "Arn"]},
+            "BatchSize": 1000,
+            "MaximumBatchingWindowInSeconds": 120,
+        },
+    )
+    (state_machine,) = full_template.find_resources("AWS::StepFunctions::StateMachine")
+    full_template.has_resource_properties(
+        "AWS::Lambda::Function",
+        {
+            "Handler": "index.changes_handler",
+            "Environment": {
+                "Variables": {"SYNC_STATE_MACHINE_ARN": {"Ref": state_machine}}
+            },
+        },
+    )
+
+
+def test_sync_lambda_environment_and_limits(template):
+    template.has_resource_properties(
+        "AWS::Lambda::Function",
+        {
+            "Handler": "index.handler",
+            "Timeout": 900,
+            "ReservedConcurrentExecutions": 1,
+            "Environment": {
+                "Variables": Match.object_like(
+                    {
+                        "KNOWLEDGE_BASE_ID": "KB123",
+                        "DATA_SOURCE_ID": "DS123",
+                        "SYNC_GENERATION_PARAMETER": Match.any_value(),
+                        "SYNC_STATE_BUCKET": Match.any_value(),
+                        "SYNC_TARGETS": "[]",
+                        "SYNC_CONCURRENCY": "4",
+                    }
+                )
+            },
+        },
+    )
+
+
+def policy_actions(template):
+    actions = set()
+    for policy in template.find_resources("AWS::IAM::Policy").values():
+        for statement in policy["Properties"]["PolicyDocument"]["Statement"]:
+            action = statement["Action"]
+            actions.update([action] if isinstance(action, str) else action)
+    return actions
+
+
+def test_sync_lambda_permissions(template):
+    actions = policy_actions(template)
+    assert {
+        "bedrock:StartIngestionJob",
+        "bedrock:GetIngestionJob",
+        "bedrock:ListIngestionJobs",
+        "events:PutEvents",
+        "ssm:PutParameter",
+        "s3:ListBucket",
+    } <= actions
+
+
+def test_data_source_listing_is_limited_to_its_buckets(full_template):
+    full_template.has_resource_properties(
+        "AWS::IAM::Policy",
+        {
+            "PolicyDocument": {
+                "Statement": Match.array_with(
+                    [
+                        Match.object_like(
+                            {
+                                "Action": "s3:ListBucket",
+                                "Resource": "arn:aws:s3:::campus-docs",
+                            }
+                        )
+                    ]
+                )
+            }
+        },
+    )
@@ -0,0 +1,76 @@
+import pytest
+
+import state_store
+from state_store import DynamoDBBackend, StateStore
+
+
+class FakeDynamoDB:
+    """Leaves the first key or item of each of the first `unprocessed` calls unprocessed."""
+
+    def __init__(self, unprocessed=1):
+        self.unprocessed = unprocessed
+        self.items = {}
+        self.calls = 0
+
+    def batch_get_item(self, RequestItems):
+        self.calls += 1
+        ((table, request),) = RequestItems.items()
+        keys = request["Keys"]
+        response = {"Responses": {table: []}}
+        if self.calls <= self.unprocessed:
+            response["UnprocessedKeys"] = {table: {**request, "Keys": keys[:1]}}
+            keys = keys[1:]
+        for key in keys:
+            if key["pk"]["S"] in self.items:
+                response["Responses"][table].append(self.items[key["pk"]["S"]])
+        return response
+
+    def batch_write_item(self, RequestItems):
+        self.calls += 1
+        ((table, requests),) = RequestItems.items()
+        response = {}
+        if self.calls <= self.unprocessed:
+            response["UnprocessedItems"] = {table: requests[:1]}
+            requests = requests[1:]
+        for request in requests:
+            item = request["PutRequest"]["Item"]
+            self.items[item["pk"]["S"]] = item
+        return response
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    delays = []
+    monkeypatch.setattr(state_store.time, "sleep", delays.append)
+    return delays
+
+
+def test_unprocessed_items_are_written_after_a_backoff(sleeps):
+    client = FakeDynamoDB(unprocessed=2)
+    DynamoDBBackend("state", client).put_many({"a": (b"1", None), "b": (b"2", None)})
+    assert set(client.items) == {"a", "b"}
+    assert client.calls == 3
+    assert len(sleeps) == 2
+    assert sleeps[0] <= state_store.DYNAMODB_BASE_DELAY * 2
+    assert sleeps[1] <= state_store.DYNAMODB_BASE_DELAY * 4
+
+
+def test_unprocessed_keys_are_read_after_a_backoff(sleeps):
+    client = FakeDynamoDB(unprocessed=0)
+    backend = DynamoDBBackend("state", client)
+    backend.put_many({"a": (b"1", None), "b": (b"2", None)})
+    client.calls, client.unprocessed = 0, 1
+    assert backend.get_many(["a", "b"]) == {"a": b"1", "b": b"2"}
+    assert client.calls == 2
+    assert len(sleeps) == 1
+
+
+def test_batches_still_unprocessed_are_given_up_as_errors(sleeps):
+    client = FakeDynamoDB(unprocessed=100)
+    store = StateStore(DynamoDBBackend("state", client))
+    store.put("a", {"x": 1})
+    store.flush()
+    assert client.calls == state_store.DYNAMODB_MAX_ATTEMPTS
+    assert len(sleeps) == state_store.DYNAMODB_MAX_ATTEMPTS - 1
+    assert max(sleeps) <= state_store.DYNAMODB_MAX_DELAY
+    assert store.stats()["errors"] == 1